@@ -1,21 +1,47 @@
 import os
+import re
 import logging
 import sys
 import json
-from typing import Any, Dict, List
-import altair as alt
-import io
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
-from snowflake.snowpark.session import Session
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
 
+from handler_tasks.config_registry import ConfigRegistry, TenantConfig
 from handler_tasks.db_setup import DBSetup
-from handler_tasks.cortalyst import Cortlayst
+from handler_tasks.cortalyst import get_cortalyst
+from handler_tasks.answer_cache import answer_cache
+from handler_tasks.result_cache import ResultCache
+from handler_tasks.result_pages import result_pages
+from handler_tasks.charts import chart_cache
+from handler_tasks.executors import StageExecutors
+from handler_tasks.outbox import SlackOutbox
+from handler_tasks.scheduler import Admission, CommandScheduler
+from handler_tasks.session_pool import SessionPool
 import handler_tasks.blocks as blocks
+from utils.dag import SKIPPED, summary
+from utils.metrics import metrics
+from utils.shared_store import shared_store
+from utils.tracing import configure_tracing, tracer
+from utils.warmup import WarmUp
 
 _log_level = os.getenv("APP_LOG_LEVEL", "WARNING")
+# rows fetched from the result of the generated SQL, the rest is only counted
+QUERY_PREVIEW_ROWS = int(os.getenv("QUERY_PREVIEW_ROWS", 500))
+# rows of the preview shown in the answer table
+TABLE_MAX_ROWS = int(os.getenv("TABLE_MAX_ROWS", 10))
+# opt-in, stream the Cortex Analyst answer, updating the reply as it arrives
+ANALYST_STREAMING = os.getenv("ANALYST_STREAMING", "false").lower() == "true"
+# minimum interval between the updates of the streamed reply, within Slack rate limits
+ANALYST_UPDATE_SECS = float(os.getenv("ANALYST_UPDATE_SECS", 1.0))
+# connect Socket Mode first and open the Snowpark session in the background, else
+# open the session at import as before
+LAZY_STARTUP = os.getenv("LAZY_STARTUP", "true").lower() == "true"
 
 logging.basicConfig(
     level=logging.WARNING,
@@ -26,26 +52,112 @@ logging.basicConfig(
 logger = logging.getLogger("demo_mate_bot")
 logger.setLevel(level=_log_level)
 
-try:
-    session = Session.builder.getOrCreate()
-except Exception as e:
-    logger.error(f"Error establishing connection,{e}", exc_info=True)
-    sys.exit(1)
+
+def open_session():
+    # snowpark is slow to import, it is loaded along with the session
+    from snowflake.snowpark.session import Session
+
+    return Session.builder.getOrCreate()
+
+
+def _exit_on_session_error(future):
+    if future.exception() is not None:
+        logger.error(
+            f"Error establishing connection,{future.exception()}",
+            exc_info=future.exception(),
+        )
+        # from the warmup thread, sys.exit would only end the thread
+        os._exit(1)
+
+
+# stands in for the Snowpark session, the queries wait for it to be opened
+session = WarmUp(open_session, name="snowpark-session")
+session.add_done_callback(_exit_on_session_error)
+if not LAZY_STARTUP:
+    try:
+        session.get()
+    except Exception:
+        sys.exit(1)
+
+
+def open_pooled_session():
+    from snowflake.snowpark.session import Session
+
+    # with the connection parameters the main session was opened with, getOrCreate
+    # must not run once there are several sessions
+    session.get()
+    return Session.builder.create()
+
+
+# the queries of concurrent questions run each on its own session
+session_pool = SessionPool(open_pooled_session)
 
 # Initializes your app with your bot token and socket mode handler
 app = App(token=os.environ.get("SLACK_BOT_TOKEN"))
 
-db_setup: DBSetup = DBSetup(session=session)
+db_setup: DBSetup = DBSetup(session=session, pool=session_pool)
 
-if os.path.exists(".dbinfo"):
-    logger.debug("Loading db and schema info from file .dbinfo")
-    with open(".dbinfo", "r") as file:
-        db_info = json.load(file)
-        db_setup.db_name = db_info["db_name"]
-        db_setup.schema_name = db_info["schema_name"]
-        logger.debug(
-            f"App will use DB: '{db_setup.db_name}' and Schema: '{ db_setup.schema_name}'"
-        )
+result_cache: ResultCache = ResultCache(session=session, pool=session_pool)
+
+executors = StageExecutors()
+
+# all the messages of the bot go out through the rate limit aware outbox
+outbox = SlackOutbox()
+
+# the work of the commands runs on the scheduler, the handlers only ack and queue it
+scheduler = CommandScheduler()
+
+# the request traces kept in memory (TRACE_BUFFER_SIZE) and/or written to TRACE_FILE
+trace_buffer = configure_tracing()
+
+# the caches and the db/schema in use shared by the worker processes of the
+# supervisor, through the SQLite store at SHARED_STORE_PATH
+store = shared_store()
+if store is not None:
+    answer_cache.share(store)
+    result_cache.share(store)
+    chart_cache.share(store)
+    result_pages.share(store)
+    db_setup.state.share(store)
+
+
+# the db/schema each workspace and channel runs its demo against
+registry = ConfigRegistry(
+    default=TenantConfig(
+        db_setup.db_name,
+        db_setup.schema_name,
+        db_setup.semantic_models_stage,
+        db_setup.semantic_model_file,
+    ),
+    store=store,
+).load()
+
+
+def register_semantic_models():
+    """
+    Record the semantic models of the configurations, for their answers to be cached
+    """
+    for config in set(registry.configs().values()):
+        if answer_cache.model_version(config.semantic_model) is None:
+            # the staged model was rendered from the same template, so answers can
+            # be cached across restarts without waiting for the next setup
+            answer_cache.set_semantic_model(
+                config.semantic_model,
+                db_setup.render_semantic_model(config.db_name, config.schema_name),
+            )
+
+
+register_semantic_models()
+
+
+def resolve_config(team_id: Optional[str], channel_id: str) -> TenantConfig:
+    """
+    The configuration of the channel, with the changes made by the other worker
+    processes
+    """
+    if registry.refresh():
+        register_semantic_models()
+    return registry.resolve(team_id, channel_id)
 
 
 def setLogLevel(logger):
@@ -55,50 +167,145 @@ def setLogLevel(logger):
     logger.setLevel(_log_level)
 
 
+def use_db(
+    db_name: str,
+    schema_name: str,
+    team_id: Optional[str] = None,
+    channel_id: Optional[str] = None,
+):
+    """
+    Point the channel to the demo database and schema, and its whole workspace when
+    it has none yet. Without a team the global configuration is set.
+    """
+    config = registry.resolve(None, None)._replace(
+        db_name=db_name, schema_name=schema_name
+    )
+    configs = {(team_id, channel_id): config}
+    if team_id is not None and (team_id, None) not in registry.configs():
+        configs[(team_id, None)] = config
+    registry.update(configs)
+
+
+def parse_setup_command(command_text: str):
+    """
+    Parses the `/setup <db> <schema> [force]` command text, force re-applies all the
+    setup steps even when they are unchanged since the last setup
+    :return: the database name, schema name and whether to force the setup
+    :raises ValueError: when the text is not in that format
+    """
+    match command_text.split():
+        case [db_name, schema_name]:
+            return db_name, schema_name, False
+        case [db_name, schema_name, flag] if flag.lower() == "force":
+            return db_name, schema_name, True
+    raise ValueError(f"Invalid setup command '{command_text}'")
+
+
+def setup_done_text(db_name: str, schema_name: str, steps=None) -> str:
+    timings = ""
+    if steps:
+        skipped = sum(1 for result in steps.values() if result.status == SKIPPED)
+        timings = (
+            f"\n_{skipped} of {len(steps)} steps skipped as unchanged."
+            f" Setup steps: {summary(steps)}_"
+        )
+    return f"""
+*Congratulations!!* Demo setup successful :tada:.
+
+Try this query in *Snowsight* to view the loaded data:  
+```
+SELECT * FROM {db_name}.{schema_name}.SUPPORT_TICKETS;
+```{timings}"""
+
+
 def do_setup(
-    client, channel_id, logger, db_name: str = "demo_db", schema_name: str = "data"
+    client,
+    channel_id,
+    logger,
+    db_name: str = "demo_db",
+    schema_name: str = "data",
+    force: bool = False,
+    team_id: Optional[str] = None,
 ):
     """
     Calls the utility to setup the demo database and other objects
     """
     logger.debug("DO SETUP")
     try:
-        client.chat_postMessage(
-            channel=channel_id,
+        outbox.send(
+            client,
+            "chat_postMessage",
+            channel_id,
             text=f"Wait for few seconds for the setup to be done :timer_clock:",
         )
 
-        global db_setup
-        db_setup.db_name = db_name
-        db_setup.schema_name = schema_name
-        ## write to file for persistence
-        with open(".dbinfo", "w") as file:
-            json.dump(
-                {"db_name": db_name, "schema_name": schema_name}, file, indent=2.0
-            )
-        db_setup.do()
+        use_db(db_name, schema_name, team_id, channel_id)
+        with tracer.span("setup", db=db_name, schema=schema_name, force=force):
+            steps = db_setup.do(force=force, db_name=db_name, schema_name=schema_name)
 
         # Send a message with the input value
-        client.chat_postMessage(
-            channel=channel_id,
-            text=f"""
-*Congratulations!!* Demo setup successful :tada:.
-
-Try this query in *Snowsight* to view the loaded data:  
-```
-SELECT * FROM {db_name}.{schema_name}.SUPPORT_TICKETS;
-```""",
+        outbox.send(
+            client,
+            "chat_postMessage",
+            channel_id,
+            text=setup_done_text(db_name, schema_name, steps),
         )
     except Exception as e:
         logger.error(f"Error handling submission: {str(e)}")
-        client.chat_postMessage(
-            channel=channel_id,
+        outbox.send(
+            client,
+            "chat_postMessage",
+            channel_id,
             text=f"Sorry, error setting up database.{e}",
         )
 
 
+def reply_admission(admission: Admission, respond):
+    """
+    Tell the user right away when their command was queued behind others or rejected
+    """
+    if not admission.accepted:
+        respond(text=f":no_entry: {admission.reason}", response_type="ephemeral")
+    elif admission.position > 0:
+        respond(
+            text=f":hourglass_flowing_sand: Queued, position {admission.position}. I will get to it shortly.",
+            response_type="ephemeral",
+        )
+    logger.debug(f"Scheduler stats:{scheduler.stats()}")
+
+
+def submit_command(
+    kind: str, user: str, channel: str, context, fn, *args, **kwargs
+) -> Admission:
+    """
+    Queue the work of the command on the scheduler, continuing the trace of the
+    Slack request it came with
+    """
+    with tracer.span(
+        "command", parent=context.get("trace_span"), kind=kind, user=user, channel=channel
+    ) as span:
+        admission = scheduler.submit(kind, user, channel, fn, *args, **kwargs)
+        span.set(accepted=admission.accepted, position=admission.position)
+        return admission
+
+
+@app.middleware
+def trace_envelope(body, context, next):
+    """
+    Start the trace of each Slack request, the handlers continue it from the context
+    """
+    with tracer.span(
+        "slack.envelope",
+        type=body.get("type"),
+        command=body.get("command"),
+        trigger_id=body.get("trigger_id"),
+    ) as span:
+        context["trace_span"] = span
+        next()
+
+
 @app.command("/setup")
-def setup_handler(ack, client, command, respond):
+def setup_handler(ack, client, command, respond, context):
     try:
         setLogLevel(logger)
         ack()
@@ -122,18 +329,26 @@ def setup_handler(ack, client, command, respond):
         else:
             try:
                 logger.debug(f"Body Text:{command_text}")
-                db_name, schema_name = tuple(command_text.strip().split())
+                db_name, schema_name, force = parse_setup_command(command_text)
                 channel = command["channel_id"]
-                do_setup(
+                admission = submit_command(
+                    "setup",
+                    command["user_id"],
+                    channel,
+                    context,
+                    do_setup,
                     channel_id=channel,
                     client=client,
                     db_name=db_name,
                     schema_name=schema_name,
+                    force=force,
                     logger=logger,
+                    team_id=command.get("team_id"),
                 )
+                reply_admission(admission, respond)
             except ValueError as e:
                 respond(
-                    text="Invalid format. Please provide both database name and schema name.",
+                    text="Invalid format. Please provide both database name and schema name, optionally followed by `force`.",
                     response_type="ephemeral",
                 )
             except Exception as e:
@@ -153,7 +368,7 @@ def setup_handler(ack, client, command, respond):
 
 
 @app.action("setup_db")
-def action_setup_db(ack, body, client, logger):
+def action_setup_db(ack, body, client, respond, context, logger):
     setLogLevel(logger)
     logger.debug(f"Received Message Event: {body}")
 
@@ -166,17 +381,24 @@ def action_setup_db(ack, body, client, logger):
         "value"
     ]
     channel = body["channel"]["id"]
-    do_setup(
+    admission = submit_command(
+        "setup",
+        body["user"]["id"],
+        channel,
+        context,
+        do_setup,
         channel_id=channel,
         client=client,
         db_name=db_name,
         schema_name=schema_name,
         logger=logger,
+        team_id=body.get("team", {}).get("id"),
     )
+    reply_admission(admission, respond)
 
 
 @app.command("/cortalyst")
-def handle_cortalyst(ack, client: WebClient, say, command, respond, logger):
+def handle_cortalyst(ack, client: WebClient, command, respond, context, logger):
     ack()
     logger.debug(f"Received Command 'cortalyst': {command}")
     try:
@@ -198,21 +420,27 @@ def handle_cortalyst(ack, client: WebClient, say, command, respond, logger):
                 )
         else:
             logger.debug(f"Question:{command_text}")
-            try:
-                channel_id = command["channel_id"]
-                ask_cortex_analyst(
-                    channel_id=channel_id,
-                    client=client,
-                    say=say,
-                    logger=logger,
-                    question=command_text,
-                )
-            except Exception as e:
-                logger.error(f"Cortalyst error: {e}")
-                respond(
-                    text=f"Error asking Cortex Analyst: {str(e)}",
-                    response_type="ephemeral",
-                )
+
+            def answer():
+                try:
+                    ask_cortex_analyst(
+                        channel_id=command["channel_id"],
+                        client=client,
+                        logger=logger,
+                        question=command_text,
+                        team_id=command.get("team_id"),
+                    )
+                except Exception as e:
+                    logger.error(f"Cortalyst error: {e}")
+                    respond(
+                        text=f"Error asking Cortex Analyst: {str(e)}",
+                        response_type="ephemeral",
+                    )
+
+            admission = submit_command(
+                "question", command["user_id"], command["channel_id"], context, answer
+            )
+            reply_admission(admission, respond)
     except Exception as e:
         logger.error(f"Cortalyst::Failed to send response: {e}")
         try:
@@ -227,18 +455,33 @@ def handle_cortalyst(ack, client: WebClient, say, command, respond, logger):
 
 
 @app.action("ask_cortex_analyst")
-def action_ask_cortex_analyst(ack, body, client, respond, say, logger):
+def action_ask_cortex_analyst(ack, body, client, respond, context, logger):
     ack()
     setLogLevel(logger)
     try:
         logger.debug(f"Received Message Event: {body}")
-        global db_setup  # make sure we use the global one
 
         question = body["state"]["values"]["analyst_question_block"]["question"][
             "value"
         ]
         channel_id = body["channel"]["id"]
-        ask_cortex_analyst(channel_id, client, say, logger, question)
+        team_id = body.get("team", {}).get("id")
+
+        def answer():
+            try:
+                ask_cortex_analyst(channel_id, client, logger, question, team_id)
+            except Exception as e:
+                logger.error(f"Failed to send request to Cortex Analyst: {e}")
+                # Fallback response
+                respond(
+                    text="Sorry, there was an error askingCortex Analyst .",
+                    response_type="ephemeral",
+                )
+
+        admission = submit_command(
+            "question", body["user"]["id"], channel_id, context, answer
+        )
+        reply_admission(admission, respond)
 
     except Exception as e:
         logger.error(f"Failed to send request to Cortex Analyst: {e}")
@@ -249,44 +492,227 @@ def action_ask_cortex_analyst(ack, body, client, respond, say, logger):
         )
 
 
-def ask_cortex_analyst(channel_id: str, client: WebClient, say, logger, question: str):
-    try:
-        sanitized_question = " ".join(question.splitlines())
+def analyst_client():
+    """
+    Return the pooled Cortex Analyst client for the current Snowpark connection
+    """
+    if os.getenv("PRIVATE_KEY_FILE_PATH") is None:
+        raise Exception(
+            f"Require PRIVATE_KEY_FILE_PATH to be set. Consult Snowflake documentation https://docs.snowflake.com/user-guide/key-pair-auth#configuring-key-pair-authentication."
+        )
 
-        logger.debug(f"Question:{sanitized_question}")
-        logger.debug(f"Using DB:{db_setup.db_name},Schema:{db_setup.schema_name}")
+    return get_cortalyst(
+        account=session.conf.get("account"),
+        user=session.conf.get("user"),
+        host=session.conf.get("host"),
+        private_key_file_path=os.getenv("PRIVATE_KEY_FILE_PATH"),
+    )
 
-        client.chat_postMessage(
-            channel=channel_id,
-            text=f":timer_clock: Wait for a few seconds... while I ask the Cortex Analyst :robot_face:",
-        )
 
-        if os.getenv("PRIVATE_KEY_FILE_PATH") is None:
-            raise Exception(
-                f"Require PRIVATE_KEY_FILE_PATH to be set. Consult Snowflake documentation https://docs.snowflake.com/user-guide/key-pair-auth#configuring-key-pair-authentication."
+@app.action(re.compile("result_(next|previous)_page"))
+def action_result_page(ack, body, client, respond, context, logger):
+    """
+    Show the next or previous page of the answer table in place
+    """
+    ack()
+    page = json.loads(body["actions"][0]["value"])
+    channel_id = body["channel"]["id"]
+    ts = body["message"]["ts"]
+
+    def show_page():
+        page_blocks = page_block(page["result_id"], page["offset"])
+        if page_blocks is None:
+            respond(
+                text="This result is not kept anymore, please ask the question again.",
+                response_type="ephemeral",
+                replace_original=False,
             )
+            return
+        outbox.update(client, channel_id, ts, blocks=page_blocks, text="Query Result")
 
-        cortalyst = Cortlayst(
-            account=session.conf.get("account"),
-            user=session.conf.get("user"),
-            host=session.conf.get("host"),
-            private_key_file_path=os.getenv("PRIVATE_KEY_FILE_PATH"),
-        )
+    admission = submit_command(
+        "page", body["user"]["id"], channel_id, context, show_page
+    )
+    reply_admission(admission, respond)
 
-        ans = cortalyst.answer(question)
 
-        content = ans["message"]["content"]
-        show_response(
+def ask_cortex_analyst(
+    channel_id: str,
+    client: WebClient,
+    logger,
+    question: str,
+    team_id: Optional[str] = None,
+):
+    config = resolve_config(team_id, channel_id)
+    try:
+        with metrics.stage("question"), tracer.span(
+            "question",
+            channel=channel_id,
+            db=config.db_name,
+            schema=config.schema_name,
+        ):
+            sanitized_question = " ".join(question.splitlines())
+
+            logger.debug(f"Question:{sanitized_question}")
+            logger.debug(f"Using DB:{config.db_name},Schema:{config.schema_name}")
+
+            waiting = outbox.send(
+                client,
+                "chat_postMessage",
+                channel_id,
+                text=f":timer_clock: Wait for a few seconds... while I ask the Cortex Analyst :robot_face:",
+            ).result()
+
+            if ANALYST_STREAMING:
+                stream_response(client, channel_id, waiting["ts"], question, config)
+                return
+
+            ans = analyst_client().answer(question, config.semantic_model)
+            logger.debug(f"Answer cache stats:{answer_cache.stats()}")
+
+            content = ans["message"]["content"]
+            show_response(
+                client,
+                channel_id,
+                content,
+                config,
+            )
+    except Exception as e:
+        raise Exception(e)
+
+
+def run_query(query: str, config: TenantConfig):
+    """
+    Run the Cortex Analyst generated SQL against the database/schema of the
+    configuration, returning the preview of its result as a DataFrame along with
+    the total number of rows
+    """
+    logger.debug(f"Building query result")
+    df, total_rows = result_cache.fetch(
+        query,
+        config.db_name,
+        config.schema_name,
+        max_rows=QUERY_PREVIEW_ROWS,
+    )
+    logger.debug(f"Result cache stats:{result_cache.stats()}")
+    return df, total_rows
+
+
+def render_chart(df, total_rows: int) -> Optional[Tuple[str, bytes]]:
+    """
+    Render the query result as a PNG chart, None when there is nothing to chart
+    :return: the chart key and the PNG bytes
+    """
+    # only I have enough columns for building a graph
+    if len(df.columns) <= 1:
+        return None
+    # a chart of a truncated preview would be misleading
+    if total_rows > len(df):
+        logger.debug(f"Not charting preview of {len(df)} of {total_rows} rows")
+        return None
+    return chart_cache.render(df)
+
+
+def share_chart(client: WebClient, channel_id, chart_key: str, image_bytes: bytes):
+    """
+    Share the chart in the channel, reusing the Slack file when the same chart was
+    already uploaded to it
+    """
+    file_id = chart_cache.shared_file(chart_key, channel_id)
+    if file_id is not None:
+        try:
+            outbox.send(
+                client,
+                "chat_postMessage",
+                channel_id,
+                blocks=blocks.visualization_block(file_id=file_id),
+                text="Chart",
+            ).result()
+            return
+        except SlackApiError as e:
+            logger.debug(f"Unable to reshare chart file {file_id},{e}")
+            chart_cache.forget_file(chart_key, channel_id)
+
+    # Upload image bytes to Slack
+    with metrics.stage("upload"), tracer.span("upload", chart_key=chart_key) as span:
+        uploaded_file = outbox.send(
             client,
+            "files_upload_v2",
             channel_id,
-            content,
-            say,
+            file=image_bytes,
+            filename="chart.png",
+            initial_comment="Generating chart...",
+        ).result()
+        span.set(file_id=uploaded_file["file"]["id"])
+    logger.info(f"Uploaded File:{uploaded_file}")
+    chart_cache.remember_file(chart_key, channel_id, uploaded_file["file"]["id"])
+
+
+def table_block(df, total_rows: int) -> List[Dict[str, Any]]:
+    """
+    The answer table of the query result preview, kept to be browsed page by page
+    when it has more rows than a page
+    """
+    with metrics.stage("table"):
+        # kept when the page does not show all the rows, over TABLE_MAX_ROWS or
+        # over the character limit of the table
+        _, shown_rows = blocks.markdown_table(df, max_rows=TABLE_MAX_ROWS)
+        result_id = result_pages.keep(df, total_rows) if shown_rows < len(df) else None
+        return blocks.create_df_block(
+            df,
+            total_rows=total_rows,
+            max_rows=TABLE_MAX_ROWS,
+            result_id=result_id,
+            kept_rows=len(df),
         )
-    except Exception as e:
-        raise Exception(e)
 
 
-def show_response(client: WebClient, channel_id, content: List[Dict[str, Any]], say):
+def page_block(result_id: str, offset: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    The page of the kept query result from `offset`, None when no longer kept
+    """
+    page = result_pages.page(result_id, offset, TABLE_MAX_ROWS)
+    if page is None:
+        return None
+    df, kept_rows, total_rows = page
+    with metrics.stage("table"):
+        return blocks.create_df_block(
+            df,
+            total_rows=total_rows,
+            max_rows=TABLE_MAX_ROWS,
+            offset=offset,
+            result_id=result_id,
+            kept_rows=kept_rows,
+        )
+
+
+def show_result(client: WebClient, channel_id, df, total_rows: int):
+    """
+    Display the result of the generated SQL as a table, and as a chart when it can
+    be charted
+    """
+    df_block = table_block(df, total_rows)
+    # a pageable table is updated in place, alone in its message
+    outbox.post(
+        client,
+        channel_id,
+        blocks=df_block,
+        text="Query Result",
+        coalesce=not blocks.has_page_buttons(df_block),
+    )
+
+    # Visualization
+    chart = render_chart(df, total_rows)
+    if chart is not None:
+        share_chart(client, channel_id, *chart)
+
+
+def show_response(
+    client: WebClient,
+    channel_id,
+    content: List[Dict[str, Any]],
+    config: TenantConfig,
+):
     try:
         for item in content:
             match item["type"]:
@@ -294,48 +720,16 @@ def show_response(client: WebClient, channel_id, content: List[Dict[str, Any]],
                     # Send raw generated query for reference
                     logger.debug(f"Generating text block with generated SQL")
                     query = item["statement"]
-                    say(
+                    outbox.post(
+                        client,
+                        channel_id,
                         blocks=blocks.create_sql_block(query),
                         text="Generated SQL",
                     )
 
                     # Build and Display Dataframe for Query Results
-                    logger.debug(f"Building query result")
-                    df = session.sql(query).to_pandas()
-                    say(
-                        blocks=blocks.create_df_block(df),
-                        text="Query Result",
-                    )
-
-                    # Visualization
-                    # only I have enough columns for building a graph
-                    if len(df.columns) > 1:
-                        chart = (
-                            alt.Chart(df)
-                            .mark_arc()
-                            .encode(theta="TICKET_COUNT", color="SERVICE_TYPE")
-                        )
-
-                        # Save chart to bytes buffer as PNG
-                        buffer = io.BytesIO()
-                        chart.save(buffer, format="png")
-                        buffer.seek(0)
-                        image_bytes = buffer.getvalue()
-
-                        # Upload image bytes to Slack
-                        uploaded_file = client.files_upload_v2(
-                            channel=channel_id,
-                            file=image_bytes,
-                            filename="chart.png",
-                            initial_comment="Generating chart...",
-                        )
-
-                        logger.info(f"Uploaded File:{uploaded_file}")
-
-                        # say(
-                        #     blocks=blocks.visualization_block(uploaded_file),
-                        #     text="Query Result",
-                        # )
+                    df, total_rows = run_query(query, config)
+                    show_result(client, channel_id, df, total_rows)
                 case _:
                     pass
     except Exception as e:
@@ -343,6 +737,70 @@ def show_response(client: WebClient, channel_id, content: List[Dict[str, Any]],
         raise Exception(f"Error sending response {e}")
 
 
+def done_status(event: Dict[str, Any]) -> str:
+    """
+    The status of the streamed reply once the answer is done
+    """
+    if event.get("cached"):
+        return "Answered from cache"
+    if event.get("shared"):
+        return "Answered along with the same question asked just before"
+    return "Done"
+
+
+def stream_response(
+    client: WebClient, channel_id, ts: str, question: str, config: TenantConfig
+):
+    """
+    Stream the Cortex Analyst answer into the message `ts`, updating it in place as
+    the status, interpretation and SQL arrive. Each statement starts running as
+    soon as it is complete, while the rest of the answer streams.
+    """
+    status, text, statements, queries = "Asking the Cortex Analyst", "", [], []
+    updated_at = 0.0
+
+    def update(force: bool = False):
+        nonlocal updated_at
+        if not force and time.monotonic() - updated_at < ANALYST_UPDATE_SECS:
+            return
+        outbox.update(
+            client,
+            channel_id,
+            ts,
+            blocks=blocks.analyst_progress_block(status, text, statements),
+            text=text or status,
+        )
+        updated_at = time.monotonic()
+
+    try:
+        for event in analyst_client().stream_answer(question, config.semantic_model):
+            match event["type"]:
+                case "status":
+                    status = event["message"]
+                    update()
+                case "text":
+                    text = event["text"]
+                    update()
+                case "sql":
+                    statements.append(event["statement"])
+                    queries.append(
+                        executors.submit("query", run_query, event["statement"], config)
+                    )
+                    update(force=True)
+                case "done":
+                    status = done_status(event)
+                    update(force=True)
+        logger.debug(f"Answer cache stats:{answer_cache.stats()}")
+
+        for query in queries:
+            df, total_rows = query.result()
+            show_result(client, channel_id, df, total_rows)
+        logger.debug(f"Outbox stats:{outbox.stats()}")
+    except Exception as e:
+        logger.error(f"Error streaming response {e}", exc_info=True)
+        raise Exception(f"Error streaming response {e}")
+
+
 # Error handler
 @app.error
 def error_handler(error, body, logger):
@@ -350,9 +808,64 @@ def error_handler(error, body, logger):
     logger.error(f"Request body: {body}")
 
 
+def serve_metrics():
+    """
+    Serve the metrics on the local METRICS_PORT, when set, along with the traces of
+    the slowest questions on /traces when they are kept in memory
+    """
+    port = os.getenv("METRICS_PORT")
+    if not port:
+        return
+    metrics.collect(
+        "cache",
+        "Hits, misses, evictions, entries and bytes of the caches.",
+        lambda: {
+            (cache, stat): value
+            for cache, stats in {
+                "answers": answer_cache.stats(),
+                "results": result_cache.stats(),
+                "result_pages": result_pages.stats(),
+                **chart_cache.stats(),
+            }.items()
+            for stat, value in stats.items()
+        },
+        labels=("cache", "stat"),
+    )
+    metrics.collect(
+        "outbox",
+        "Slack outbox queue depth and deliveries.",
+        outbox.stats,
+        labels=("stat",),
+    )
+    metrics.collect(
+        "session_pool",
+        "Snowpark session pool utilization, checkouts and wait time.",
+        session_pool.stats,
+        labels=("stat",),
+    )
+    metrics.collect(
+        "scheduler",
+        "Bot command queue depth and admissions.",
+        scheduler.stats,
+        labels=("stat",),
+    )
+    routes = {}
+    if trace_buffer is not None:
+        routes["/traces"] = lambda: trace_buffer.slowest("question")
+    metrics.serve(int(port), host=os.getenv("METRICS_HOST", "127.0.0.1"), routes=routes)
+
+
 def main():
     logger.debug("Jai Guru! Starting Slack bot application...")
-    SocketModeHandler(app, os.environ["SLACK_APP_TOKEN"]).start()
+    serve_metrics()
+    handler = SocketModeHandler(app, os.environ["SLACK_APP_TOKEN"])
+    handler.connect()
+    logger.debug("Connected to Slack, warming up the Snowpark session")
+    session.start()
+    try:
+        threading.Event().wait()
+    finally:
+        session_pool.close()
 
 
 # Start your app
@@ -0,0 +1,478 @@
+"""
+Opt-in asyncio mode of the bot, run it with `python async_app.py` instead of `python app.py`.
+
+The handlers mirror the ones in app.py but run on Bolt's AsyncApp, the blocking
+Snowpark, Cortex Analyst and chart rendering calls are bounded by per stage
+executors (see handler_tasks.executors), configurable via the
+ANALYST_CONCURRENCY, QUERY_CONCURRENCY, RENDER_CONCURRENCY, UPLOAD_CONCURRENCY
+and SETUP_CONCURRENCY env.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_async_handlers import AsyncRateLimitErrorRetryHandler
+
+from app import (
+    db_setup,
+    logger,
+    setLogLevel,
+    use_db,
+    resolve_config,
+    setup_done_text,
+    parse_setup_command,
+    analyst_client,
+    run_query,
+    render_chart,
+    table_block,
+    page_block,
+    serve_metrics,
+    ANALYST_STREAMING,
+    ANALYST_UPDATE_SECS,
+    done_status,
+    executors,
+    session,
+    session_pool,
+)
+from handler_tasks.charts import chart_cache
+from handler_tasks.config_registry import TenantConfig
+from utils.metrics import metrics
+from utils.tracing import tracer
+import handler_tasks.blocks as blocks
+
+app = AsyncApp(token=os.environ.get("SLACK_BOT_TOKEN"))
+# the async handlers post directly, retrying the calls Slack rate limited
+app.client.retry_handlers.append(
+    AsyncRateLimitErrorRetryHandler(
+        max_retry_count=int(os.getenv("SLACK_OUTBOX_MAX_RETRIES", 3))
+    )
+)
+
+
+@app.middleware
+async def trace_envelope(body, context, next):
+    """
+    Start the trace of each Slack request, the handlers continue it from the context
+    """
+    with tracer.span(
+        "slack.envelope",
+        type=body.get("type"),
+        command=body.get("command"),
+        trigger_id=body.get("trigger_id"),
+    ) as span:
+        context["trace_span"] = span
+        await next()
+
+
+def _setup(
+    db_name: str,
+    schema_name: str,
+    force: bool = False,
+    team_id: Optional[str] = None,
+    channel_id: Optional[str] = None,
+):
+    use_db(db_name, schema_name, team_id, channel_id)
+    with tracer.span("setup", db=db_name, schema=schema_name, force=force):
+        return db_setup.do(force=force, db_name=db_name, schema_name=schema_name)
+
+
+async def do_setup(
+    client: AsyncWebClient,
+    channel_id,
+    logger,
+    db_name: str = "demo_db",
+    schema_name: str = "data",
+    force: bool = False,
+    team_id: Optional[str] = None,
+):
+    """
+    Calls the utility to setup the demo database and other objects
+    """
+    logger.debug("DO SETUP")
+    try:
+        await client.chat_postMessage(
+            channel=channel_id,
+            text=f"Wait for few seconds for the setup to be done :timer_clock:",
+        )
+
+        steps = await executors.run(
+            "setup", _setup, db_name, schema_name, force, team_id, channel_id
+        )
+
+        await client.chat_postMessage(
+            channel=channel_id,
+            text=setup_done_text(db_name, schema_name, steps),
+        )
+    except Exception as e:
+        logger.error(f"Error handling submission: {str(e)}")
+        await client.chat_postMessage(
+            channel=channel_id,
+            text=f"Sorry, error setting up database.{e}",
+        )
+
+
+@app.command("/setup")
+async def setup_handler(ack, client: AsyncWebClient, command, respond):
+    setLogLevel(logger)
+    await ack()
+    try:
+        command_text = command.get("text", "").strip()
+        logger.debug(f"command_text:{command_text}")
+        if not command_text:
+            await respond(
+                blocks=blocks.db_schema_setup,
+                response_type="ephemeral",
+            )
+            return
+        try:
+            db_name, schema_name, force = parse_setup_command(command_text)
+        except ValueError:
+            await respond(
+                text="Invalid format. Please provide both database name and schema name, optionally followed by `force`.",
+                response_type="ephemeral",
+            )
+            return
+        await do_setup(
+            channel_id=command["channel_id"],
+            client=client,
+            db_name=db_name,
+            schema_name=schema_name,
+            force=force,
+            logger=logger,
+            team_id=command.get("team_id"),
+        )
+    except Exception as e:
+        logger.error(f"Setup error: {e}")
+        await client.chat_postEphemeral(
+            channel=command["channel_id"],
+            user=command["user_id"],
+            text="An unexpected error occurred.",
+        )
+
+
+@app.action("setup_db")
+async def action_setup_db(ack, body, client: AsyncWebClient, logger):
+    setLogLevel(logger)
+    await ack()
+    logger.debug(f"Received Message Event: {body}")
+
+    db_name = body["state"]["values"]["db_name_input_block"]["db_name"]["value"]
+    schema_name = body["state"]["values"]["schema_name_input_block"]["schema_name"][
+        "value"
+    ]
+    await do_setup(
+        channel_id=body["channel"]["id"],
+        client=client,
+        db_name=db_name,
+        schema_name=schema_name,
+        logger=logger,
+        team_id=body.get("team", {}).get("id"),
+    )
+
+
+@app.command("/cortalyst")
+async def handle_cortalyst(
+    ack, client: AsyncWebClient, say, command, respond, context, logger
+):
+    await ack()
+    logger.debug(f"Received Command 'cortalyst': {command}")
+    command_text = command.get("text", "").strip()
+    try:
+        if not command_text:
+            await respond(
+                blocks=blocks.cortex_question,
+                response_type="ephemeral",
+            )
+            return
+        with tracer.span(
+            "command",
+            parent=context.get("trace_span"),
+            kind="question",
+            user=command["user_id"],
+            channel=command["channel_id"],
+        ):
+            await ask_cortex_analyst(
+                channel_id=command["channel_id"],
+                client=client,
+                say=say,
+                logger=logger,
+                question=command_text,
+                team_id=command.get("team_id"),
+            )
+    except Exception as e:
+        logger.error(f"Cortalyst error: {e}")
+        await respond(
+            text=f"Error asking Cortex Analyst: {str(e)}",
+            response_type="ephemeral",
+        )
+
+
+@app.action("ask_cortex_analyst")
+async def action_ask_cortex_analyst(
+    ack, body, client, respond, say, context, logger
+):
+    await ack()
+    setLogLevel(logger)
+    try:
+        logger.debug(f"Received Message Event: {body}")
+        question = body["state"]["values"]["analyst_question_block"]["question"][
+            "value"
+        ]
+        with tracer.span(
+            "command",
+            parent=context.get("trace_span"),
+            kind="question",
+            user=body["user"]["id"],
+            channel=body["channel"]["id"],
+        ):
+            await ask_cortex_analyst(
+                body["channel"]["id"],
+                client,
+                say,
+                logger,
+                question,
+                body.get("team", {}).get("id"),
+            )
+    except Exception as e:
+        logger.error(f"Failed to send request to Cortex Analyst: {e}")
+        await respond(
+            text="Sorry, there was an error askingCortex Analyst .",
+            response_type="ephemeral",
+        )
+
+
+@app.action(re.compile("result_(next|previous)_page"))
+async def action_result_page(ack, body, client: AsyncWebClient, respond, logger):
+    """
+    Show the next or previous page of the answer table in place
+    """
+    await ack()
+    page = json.loads(body["actions"][0]["value"])
+    page_blocks = await executors.run(
+        "render", page_block, page["result_id"], page["offset"]
+    )
+    if page_blocks is None:
+        await respond(
+            text="This result is not kept anymore, please ask the question again.",
+            response_type="ephemeral",
+            replace_original=False,
+        )
+        return
+    await client.chat_update(
+        channel=body["channel"]["id"],
+        ts=body["message"]["ts"],
+        blocks=page_blocks,
+        text="Query Result",
+    )
+
+
+async def ask_cortex_analyst(
+    channel_id: str,
+    client: AsyncWebClient,
+    say,
+    logger,
+    question: str,
+    team_id: Optional[str] = None,
+):
+    config = resolve_config(team_id, channel_id)
+    with metrics.stage("question"), tracer.span(
+        "question",
+        channel=channel_id,
+        db=config.db_name,
+        schema=config.schema_name,
+    ):
+        sanitized_question = " ".join(question.splitlines())
+
+        logger.debug(f"Question:{sanitized_question}")
+        logger.debug(f"Using DB:{config.db_name},Schema:{config.schema_name}")
+
+        waiting = await client.chat_postMessage(
+            channel=channel_id,
+            text=f":timer_clock: Wait for a few seconds... while I ask the Cortex Analyst :robot_face:",
+        )
+
+        # first use of the client parses the private key, keep it off the loop too
+        cortalyst = await executors.run("analyst", analyst_client)
+        if ANALYST_STREAMING:
+            await stream_response(
+                client, channel_id, waiting["ts"], cortalyst, question, config, say
+            )
+            return
+
+        ans = await executors.run(
+            "analyst", cortalyst.answer, question, config.semantic_model
+        )
+
+        await show_response(client, channel_id, ans["message"]["content"], config, say)
+
+
+async def share_chart(
+    client: AsyncWebClient, channel_id, chart_key: str, image_bytes: bytes
+):
+    """
+    Share the chart in the channel, reusing the Slack file when the same chart was
+    already uploaded to it
+    """
+    file_id = chart_cache.shared_file(chart_key, channel_id)
+    if file_id is not None:
+        try:
+            await client.chat_postMessage(
+                channel=channel_id,
+                blocks=blocks.visualization_block(file_id=file_id),
+                text="Chart",
+            )
+            return
+        except SlackApiError as e:
+            logger.debug(f"Unable to reshare chart file {file_id},{e}")
+            chart_cache.forget_file(chart_key, channel_id)
+
+    async with executors.slot("upload"):
+        with metrics.stage("upload"), tracer.span(
+            "upload", chart_key=chart_key
+        ) as span:
+            uploaded_file = await client.files_upload_v2(
+                channel=channel_id,
+                file=image_bytes,
+                filename="chart.png",
+                initial_comment="Generating chart...",
+            )
+            span.set(file_id=uploaded_file["file"]["id"])
+    logger.info(f"Uploaded File:{uploaded_file}")
+    chart_cache.remember_file(chart_key, channel_id, uploaded_file["file"]["id"])
+
+
+async def show_result(client: AsyncWebClient, channel_id, df, total_rows: int, say):
+    """
+    Display the result of the generated SQL as a table, and as a chart when it can
+    be charted
+    """
+    df_block = await executors.run("render", table_block, df, total_rows)
+    await say(blocks=df_block, text="Query Result")
+
+    chart = await executors.run("render", render_chart, df, total_rows)
+    if chart is not None:
+        await share_chart(client, channel_id, *chart)
+
+
+async def show_response(
+    client: AsyncWebClient,
+    channel_id,
+    content: List[Dict[str, Any]],
+    config: TenantConfig,
+    say,
+):
+    try:
+        for item in content:
+            match item["type"]:
+                case "sql":
+                    query = item["statement"]
+                    await say(
+                        blocks=blocks.create_sql_block(query),
+                        text="Generated SQL",
+                    )
+
+                    df, total_rows = await executors.run(
+                        "query", run_query, query, config
+                    )
+                    await show_result(client, channel_id, df, total_rows, say)
+                case _:
+                    pass
+    except Exception as e:
+        logger.error(f"Error sending response {e}", exc_info=True)
+        raise Exception(f"Error sending response {e}")
+
+
+async def stream_response(
+    client: AsyncWebClient,
+    channel_id,
+    ts: str,
+    cortalyst,
+    question: str,
+    config: TenantConfig,
+    say,
+):
+    """
+    Stream the Cortex Analyst answer into the message `ts`, updating it in place as
+    the status, interpretation and SQL arrive. Each statement starts running as
+    soon as it is complete, while the rest of the answer streams.
+    """
+    status, text, statements, queries = "Asking the Cortex Analyst", "", [], []
+    updated_at = 0.0
+
+    async def update(force: bool = False):
+        nonlocal updated_at
+        if not force and time.monotonic() - updated_at < ANALYST_UPDATE_SECS:
+            return
+        updated_at = time.monotonic()
+        await client.chat_update(
+            channel=channel_id,
+            ts=ts,
+            blocks=blocks.analyst_progress_block(status, text, statements),
+            text=text or status,
+        )
+
+    try:
+        async for event in executors.iterate(
+            "analyst", cortalyst.stream_answer, question, config.semantic_model
+        ):
+            match event["type"]:
+                case "status":
+                    status = event["message"]
+                    await update()
+                case "text":
+                    text = event["text"]
+                    await update()
+                case "sql":
+                    statements.append(event["statement"])
+                    queries.append(
+                        asyncio.ensure_future(
+                            executors.run(
+                                "query", run_query, event["statement"], config
+                            )
+                        )
+                    )
+                    await update(force=True)
+                case "done":
+                    status = done_status(event)
+                    await update(force=True)
+
+        for query in queries:
+            df, total_rows = await query
+            await show_result(client, channel_id, df, total_rows, say)
+    except Exception as e:
+        for query in queries:
+            query.cancel()
+        logger.error(f"Error streaming response {e}", exc_info=True)
+        raise Exception(f"Error streaming response {e}")
+
+
+@app.error
+async def error_handler(error, body, logger):
+    logger.error(f"Error: {error}")
+    logger.error(f"Request body: {body}")
+
+
+async def main():
+    logger.debug("Jai Guru! Starting Slack bot application in async mode...")
+    serve_metrics()
+    try:
+        handler = AsyncSocketModeHandler(app, os.environ["SLACK_APP_TOKEN"])
+        await handler.connect_async()
+        logger.debug("Connected to Slack, warming up the Snowpark session")
+        session.start()
+        await asyncio.sleep(float("inf"))
+    finally:
+        executors.shutdown(wait=False)
+        session_pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Micro-benchmark of the per-question client overhead of Cortex Analyst calls.
+
+Compares building a new Cortlayst for every question (key parsing, token
+minting and a cold connection each time) with the pooled client returned by
+`get_cortalyst`. A local keep-alive HTTP server stands in for the Analyst API.
+
+    python -m benchmarks.cortalyst_client --questions 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    NoEncryption,
+    PrivateFormat,
+)
+
+from handler_tasks.cortalyst import Cortlayst, clear_cortalyst_clients, get_cortalyst
+
+_ANSWER = json.dumps(
+    {"message": {"role": "analyst", "content": [{"type": "text", "text": "ok"}]}}
+).encode()
+
+
+class _AnalystHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_ANSWER)))
+        self.send_header("X-Snowflake-Request-Id", "bench")
+        self.end_headers()
+        self.wfile.write(_ANSWER)
+
+    def log_message(self, *args):
+        pass
+
+
+def _write_private_key(path: str):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with open(path, "wb") as file:
+        file.write(
+            key.private_bytes(Encoding.PEM, PrivateFormat.PKCS8, NoEncryption())
+        )
+
+
+def _time_questions(questions: int, make_client, endpoint: str):
+    timings = []
+    for _ in range(questions):
+        start = time.perf_counter()
+        client = make_client()
+        client.analyst_endpoint = endpoint
+        client.answer("How many tickets per service type?")
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _report(label: str, timings):
+    print(
+        f"{label:<8} mean={statistics.mean(timings):8.3f}ms "
+        f"p50={statistics.median(timings):8.3f}ms "
+        f"max={max(timings):8.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--questions", type=int, default=100)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _AnalystHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_port}/api/v2/cortex/analyst/message"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pk_file = os.path.join(tmp_dir, "bench_key.p8")
+        _write_private_key(pk_file)
+        client_args = dict(
+            account="bench",
+            user="bench",
+            private_key_file_path=pk_file,
+            host="127.0.0.1",
+        )
+
+        def new_client():
+            return Cortlayst(**client_args)
+
+        def pooled_client():
+            return get_cortalyst(**client_args)
+
+        before = _time_questions(args.questions, new_client, endpoint)
+        after = _time_questions(args.questions, pooled_client, endpoint)
+        clear_cortalyst_clients()
+
+    server.shutdown()
+    print(f"Per question client overhead over {args.questions} questions")
+    _report("before", before)
+    _report("after", after)
+
+
+if __name__ == "__main__":
+    main()
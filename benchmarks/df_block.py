@@ -0,0 +1,89 @@
+"""
+Benchmark of the markdown table rendering of query results (blocks.create_df_block).
+
+Compares the columnar formatter with the previous row by row `iterrows` one over
+wide and long frames and increasing row caps.
+
+    python -m benchmarks.df_block --repeat 20
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import handler_tasks.blocks as blocks
+
+
+def iterrows_table(df, max_rows):
+    """
+    The row by row formatter create_df_block used before the columnar one
+    """
+
+    def format_value(val):
+        if pd.isna(val):
+            return "N/A"
+        elif isinstance(val, (float, np.floating)):
+            return f"{val:.2f}"
+        return str(val)
+
+    headers = df.columns.tolist()
+    header_row = " | ".join([""] + headers + [""])
+    separator_row = " | ".join([""] + ["-" * len(header) for header in headers] + [""])
+    table_rows = []
+    for _, row in df.head(max_rows).iterrows():
+        formatted_row = [format_value(val) for val in row]
+        table_rows.append(" | ".join([""] + formatted_row + [""]))
+    return "\n".join([header_row, separator_row] + table_rows)
+
+
+def columnar_table(df, max_rows):
+    # no Slack text limit, to format the same rows as the row by row formatter
+    return blocks.markdown_table(df, max_rows=max_rows, max_chars=float("inf"))
+
+
+def make_frame(rows: int, columns: int) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    data = {}
+    for i in range(columns):
+        match i % 3:
+            case 0:
+                data[f"SERVICE_TYPE_{i}"] = rng.choice(
+                    ["Cellular", "Business Internet", "Home Internet", None], rows
+                )
+            case 1:
+                data[f"TICKET_COUNT_{i}"] = rng.integers(0, 10_000, rows)
+            case 2:
+                values = rng.random(rows) * 100
+                values[rng.random(rows) < 0.1] = np.nan
+                data[f"AVG_RESOLUTION_{i}"] = values
+    return pd.DataFrame(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    frames = {
+        "wide 1000x60": make_frame(1_000, 60),
+        "long 1000000x6": make_frame(1_000_000, 6),
+    }
+    print(f"{'frame':<16}{'rows':>6}{'iterrows ms':>14}{'columnar ms':>14}")
+    for name, df in frames.items():
+        for max_rows in (10, 100, 1000):
+            before = timeit.timeit(
+                lambda: iterrows_table(df, max_rows), number=args.repeat
+            )
+            after = timeit.timeit(
+                lambda: columnar_table(df, max_rows), number=args.repeat
+            )
+            print(
+                f"{name:<16}{max_rows:>6}"
+                f"{before / args.repeat * 1000:>14.3f}{after / args.repeat * 1000:>14.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Offline end-to-end benchmark of the question pipeline of the bot.
+
+Drives the real /cortalyst handler of app.py with a fake Slack WebClient, a local
+fake Cortex Analyst server and a fake Snowpark session returning synthetic
+results, each with a configurable latency. Reports the throughput and the
+p50/p95/p99 latency of every stage from the request traces, and saves them as
+JSON so that runs can be diffed.
+
+    python -m benchmarks.end_to_end --questions 200 --concurrency 8 --output bench.json
+"""
+
+import argparse
+import functools
+import importlib
+import json
+import math
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+from unittest import mock
+
+from benchmarks.cortalyst_client import _write_private_key
+from benchmarks.fakes import (
+    FakeAnalystServer,
+    FakeRespond,
+    FakeSession,
+    FakeSessionBuilder,
+    FakeWebClient,
+)
+from utils.tracing import RingBufferExporter, tracer
+
+# the stages reported, in pipeline order, "end_to_end" is from the command to the
+# last span of its trace
+STAGES = (
+    "end_to_end",
+    "command",
+    "question",
+    "analyst.answer",
+    "analyst.request",
+    "query",
+    "render",
+    "upload",
+)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Nearest rank percentile of the values
+    """
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ms = [value * 1000 for value in values]
+    return {
+        "count": len(ms),
+        "mean": round(statistics.mean(ms), 3),
+        "p50": round(percentile(ms, 50), 3),
+        "p95": round(percentile(ms, 95), 3),
+        "p99": round(percentile(ms, 99), 3),
+        "max": round(max(ms), 3),
+    }
+
+
+def stage_latencies(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    durations = defaultdict(list)
+    traces = defaultdict(list)
+    for span in spans:
+        durations[span["name"]].append(span["duration"])
+        traces[span["trace_id"]].append(span)
+    for trace in traces.values():
+        commands = [span for span in trace if span["name"] == "command"]
+        if commands and any(span["name"] == "question" for span in trace):
+            end = max(span["start"] + span["duration"] for span in trace)
+            durations["end_to_end"].append(end - commands[0]["start"])
+    return {
+        stage: summarize(durations[stage])
+        for stage in (*STAGES, *sorted(set(durations) - set(STAGES)))
+        if durations[stage]
+    }
+
+
+def load_app(session: FakeSession, env: Dict[str, str], **app_options):
+    """
+    Import app.py against the fake Snowpark session, with the env and the options
+    of its Bolt App
+    """
+    os.environ.update({"SLACK_BOT_TOKEN": "xoxb-benchmark", **env})
+    from slack_bolt import App
+
+    with mock.patch(
+        "snowflake.snowpark.session.Session.builder", FakeSessionBuilder(session)
+    ), mock.patch("slack_bolt.App", functools.partial(App, **app_options)):
+        bot = importlib.import_module("app")
+        # the session warms up in the background, open it within the patch
+        bot.session.get()
+    # the queries share the fake session, which runs them concurrently
+    bot.session_pool.factory = lambda: session
+    return bot
+
+
+def wait_idle(bot, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        scheduler, outbox = bot.scheduler.stats(), bot.outbox.stats()
+        if (
+            scheduler["queued"] == 0
+            and scheduler["running"] == 0
+            and outbox["queued"] == 0
+            and outbox["channels"] == 0
+        ):
+            return
+        time.sleep(0.01)
+    raise TimeoutError(f"Questions still pending after {timeout}s")
+
+
+def run(args) -> Dict[str, Any]:
+    session = FakeSession(query_latency=args.query_latency, rows=args.rows)
+    server = FakeAnalystServer(
+        latency=args.analyst_latency, statements=args.statements
+    ).start()
+    client = FakeWebClient(latency=args.slack_latency)
+    respond = FakeRespond()
+    buffer = RingBufferExporter(args.questions * (8 + 4 * args.statements))
+    tracer.add_exporter(buffer)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ["PRIVATE_KEY_FILE_PATH"] = os.path.join(tmp_dir, "bench_key.p8")
+        _write_private_key(os.environ["PRIVATE_KEY_FILE_PATH"])
+        bot = load_app(
+            session,
+            {
+                "ANALYST_STREAMING": "true" if args.stream else "false",
+                "SCHEDULER_WORKERS": str(args.concurrency),
+                # every question is admitted, the benchmark measures the pipeline
+                "SCHEDULER_MAX_QUEUED": str(args.questions),
+                "SCHEDULER_MAX_PER_USER": str(args.questions),
+                "SCHEDULER_MAX_PER_CHANNEL": str(args.questions),
+            },
+            token_verification_enabled=False,
+        )
+        if not args.slack_limits:
+            # no pacing, the benchmark measures the bot rather than the Slack limits
+            from handler_tasks.outbox import SlackOutbox
+
+            bot.outbox = SlackOutbox(sleep=lambda seconds: None)
+        bot.analyst_client().analyst_endpoint = server.endpoint
+
+        started_at = datetime.now(timezone.utc).isoformat()
+        start = time.perf_counter()
+        admissions = Counter()
+        for i in range(args.questions):
+            channel = f"C{i % args.channels if args.channels else i}"
+            command = {
+                "text": f"How many tickets per service type, variant {i % args.distinct}?",
+                "channel_id": channel,
+                "user_id": f"U{i % args.users}",
+            }
+            before = bot.scheduler.stats()["rejected"]
+            bot.handle_cortalyst(
+                ack=lambda: None,
+                client=client,
+                command=command,
+                respond=respond,
+                context={},
+                logger=bot.logger,
+            )
+            admissions[
+                "rejected" if bot.scheduler.stats()["rejected"] > before else "accepted"
+            ] += 1
+            if args.rate:
+                time.sleep(1 / args.rate)
+        wait_idle(bot, args.timeout)
+        wall = time.perf_counter() - start
+        bot.scheduler.shutdown()
+
+    server.stop()
+    spans = buffer.spans()
+    questions = [span for span in spans if span["name"] == "question"]
+    failed = sum(1 for span in questions if span["error"])
+    return {
+        "benchmark": "end_to_end",
+        "started_at": started_at,
+        "config": vars(args),
+        "wall_secs": round(wall, 3),
+        "questions": {
+            "submitted": args.questions,
+            **admissions,
+            "completed": len(questions) - failed,
+            "failed": failed,
+        },
+        "throughput_per_sec": round((len(questions) - failed) / wall, 3),
+        "latency_ms": stage_latencies(spans),
+        "analyst_requests": server.requests,
+        "slack_calls": dict(Counter(method for method, _ in client.calls)),
+        "outbox": bot.outbox.stats(),
+        "session_pool": bot.session_pool.stats(),
+    }
+
+
+def report(result: Dict[str, Any]):
+    questions = result["questions"]
+    print(
+        f"{questions['completed']} of {questions['submitted']} questions answered "
+        f"({questions['failed']} failed) in {result['wall_secs']}s, "
+        f"{result['throughput_per_sec']} questions/s"
+    )
+    print(f"{'stage':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, latency in result["latency_ms"].items():
+        print(
+            f"{stage:<16}{latency['count']:>7}{latency['p50']:>10.1f}"
+            f"{latency['p95']:>10.1f}{latency['p99']:>10.1f}{latency['max']:>10.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Questions answered at once"
+    )
+    parser.add_argument(
+        "--distinct",
+        type=int,
+        default=None,
+        help="Distinct questions, the others repeat them (default all distinct)",
+    )
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument(
+        "--channels", type=int, default=0, help="Channels asked in, 0 for one per question"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Questions per second, 0 for all at once"
+    )
+    parser.add_argument("--analyst-latency", type=float, default=0.5)
+    parser.add_argument("--query-latency", type=float, default=0.2)
+    parser.add_argument("--slack-latency", type=float, default=0.05)
+    parser.add_argument("--statements", type=int, default=1)
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument(
+        "--no-stream", dest="stream", action="store_false", help="Ask without streaming"
+    )
+    parser.add_argument(
+        "--slack-limits", action="store_true", help="Pace the messages as Slack would"
+    )
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="Save the results as JSON to this file")
+    args = parser.parse_args()
+    if args.distinct is None:
+        args.distinct = args.questions
+
+    result = run(args)
+    report(result)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
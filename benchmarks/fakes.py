@@ -0,0 +1,376 @@
+"""
+Local stand-ins of Slack, Cortex Analyst and Snowpark for the offline benchmarks.
+"""
+
+import itertools
+import json
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+import numpy as np
+import pandas as pd
+
+
+class FakeAnalystServer:
+    """
+    Local HTTP server answering like the Cortex Analyst REST API, with the JSON
+    message or the server-sent events stream. Each answer is an interpretation
+    followed by `statements` SQL statements, sent over `latency` seconds. The
+    statements depend on the question, so that only repeated questions share
+    their query results and charts.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        statements: int = 1,
+        sql: str = "SELECT service_type, COUNT(*) AS ticket_count FROM support_tickets WHERE ticket_id % 100000 <> {id} GROUP BY 1",
+    ):
+        self.latency = latency
+        self.statements = statements
+        self.sql = sql
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/api/v2/cortex/analyst/message"
+
+    def start(self) -> "FakeAnalystServer":
+        threading.Thread(
+            target=self._server.serve_forever, name="fake-analyst", daemon=True
+        ).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def content(self, question: str) -> List[Dict[str, Any]]:
+        question_id = zlib.crc32(question.encode()) % 100000
+        return [
+            {"type": "text", "text": f"This is our interpretation of: {question}"}
+        ] + [
+            {
+                "type": "sql",
+                "statement": self.sql.format(id=question_id + i),
+                "confidence": {},
+            }
+            for i in range(self.statements)
+        ]
+
+    def events(self, question: str):
+        """
+        The server-sent events of the answer, with the delay before each of them
+        """
+        content = self.content(question)
+        pause = self.latency / (len(content) + 1)
+        yield 0, "status", {
+            "status": "interpreting_question",
+            "status_message": "Interpreting question",
+        }
+        for index, item in enumerate(content):
+            delta = {"index": index, "type": item["type"]}
+            if item["type"] == "text":
+                delta["text_delta"] = item["text"]
+            else:
+                delta["statement_delta"] = item["statement"]
+            yield pause, "message.content.delta", delta
+        yield pause, "status", {"status": "done", "status_message": "Done"}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                payload = json.loads(
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                )
+                with fake._lock:
+                    fake.requests += 1
+                question = payload["messages"][-1]["content"][0]["text"]
+                request_id = str(uuid.uuid4())
+                if payload.get("stream"):
+                    self.stream(question, request_id)
+                    return
+                time.sleep(fake.latency)
+                body = json.dumps(
+                    {
+                        "message": {
+                            "role": "analyst",
+                            "content": fake.content(question),
+                        }
+                    }
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("X-Snowflake-Request-Id", request_id)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def stream(self, question: str, request_id: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.send_header("X-Snowflake-Request-Id", request_id)
+                self.end_headers()
+                for pause, event, data in fake.events(question):
+                    time.sleep(pause)
+                    self.chunk(f"event: {event}\ndata: {json.dumps(data)}\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def chunk(self, text: str):
+                data = text.encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class FakeWebClient:
+    """
+    Slack WebClient answering each call after `latency` seconds, recording the calls
+    """
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.calls = []
+        self._ts = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _call(self, method: str, **kwargs) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls.append((method, kwargs.get("channel")))
+            ts = f"{time.time():.0f}.{next(self._ts):06d}"
+        return {"ok": True, "channel": kwargs.get("channel"), "ts": ts}
+
+    def chat_postMessage(self, **kwargs):
+        return self._call("chat_postMessage", **kwargs)
+
+    def chat_postEphemeral(self, **kwargs):
+        return self._call("chat_postEphemeral", **kwargs)
+
+    def chat_update(self, **kwargs):
+        return self._call("chat_update", **kwargs)
+
+    def files_upload_v2(self, **kwargs):
+        response = self._call("files_upload_v2", **kwargs)
+        return {**response, "file": {"id": f"F{response['ts'].replace('.', '')}"}}
+
+
+class FakeSlackServer:
+    """
+    Local HTTP server answering the Slack Web API calls, the file uploads and the
+    response_url replies after `latency` seconds, for a real WebClient created with
+    `base_url=server.base_url`
+    """
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/api/"
+
+    def response_url(self, id) -> str:
+        return f"{self.url}/respond/{id}"
+
+    def start(self) -> "FakeSlackServer":
+        threading.Thread(
+            target=self._server.serve_forever, name="fake-slack", daemon=True
+        ).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def answer(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.calls[method] += 1
+            id = next(self._ids)
+        ts = f"{time.time():.0f}.{id:06d}"
+        match method:
+            case "auth.test":
+                return {
+                    "ok": True,
+                    "user_id": "UBENCH",
+                    "bot_id": "BBENCH",
+                    "team_id": "TBENCH",
+                }
+            case "files.getUploadURLExternal":
+                return {
+                    "ok": True,
+                    "file_id": f"F{id}",
+                    "upload_url": f"{self.url}/upload/F{id}",
+                }
+            case "files.completeUploadExternal":
+                files = params.get("files", "[]")
+                files = json.loads(files) if isinstance(files, str) else files
+                return {"ok": True, "files": [{"id": file["id"]} for file in files]}
+            case _:
+                return {"ok": True, "channel": params.get("channel"), "ts": ts}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(fake.latency)
+                if self.path.startswith("/api/"):
+                    if self.headers.get("Content-Type", "").startswith("application/json"):
+                        params = json.loads(body or b"{}")
+                    else:
+                        params = {
+                            k: v[0] for k, v in parse_qs(body.decode()).items()
+                        }
+                    self.reply(fake.answer(self.path[len("/api/") :], params))
+                else:
+                    # the file uploads and the response_url replies
+                    with fake._lock:
+                        fake.calls[self.path.split("/")[1]] += 1
+                    self.reply("ok")
+
+            def reply(self, answer):
+                data = (
+                    answer if isinstance(answer, str) else json.dumps(answer)
+                ).encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type",
+                    "text/plain" if isinstance(answer, str) else "application/json",
+                )
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class FakeRespond:
+    """
+    The `respond` of a Bolt handler, recording the ephemeral replies
+    """
+
+    def __init__(self):
+        self.replies = []
+
+    def __call__(self, text: str = "", **kwargs):
+        self.replies.append(text)
+
+
+def synthetic_frame(rows: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "SERVICE_TYPE": rng.choice(
+                ["Cellular", "Business Internet", "Home Internet"], rows
+            ),
+            "TICKET_COUNT": rng.integers(0, 10_000, rows),
+        }
+    )
+
+
+class FakeCursor:
+    def __init__(self, session: "FakeSession"):
+        self.session = session
+        self.rowcount = None
+        self.sfqid = None
+        self.description = []
+        self._seed = 0
+
+    def execute(self, query: str):
+        time.sleep(self.session.query_latency)
+        self.sfqid = str(uuid.uuid4())
+        self.rowcount = self.session.rows
+        self._seed = zlib.crc32(query.encode())
+
+    def fetch_pandas_batches(self):
+        df = synthetic_frame(self.session.rows, self._seed)
+        for start in range(0, len(df), self.session.batch_rows):
+            yield df.iloc[start : start + self.session.batch_rows]
+
+    def close(self):
+        pass
+
+
+class _FakeConnection:
+    def __init__(self, session: "FakeSession"):
+        self.session = session
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self.session)
+
+
+class _FakeDataFrame:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def collect(self):
+        return self.rows
+
+
+class FakeSession:
+    """
+    Snowpark session running every query in `query_latency` seconds, with a
+    synthetic result of `rows` rows seeded by the query
+    """
+
+    def __init__(
+        self,
+        query_latency: float = 0.2,
+        rows: int = 20,
+        batch_rows: int = 1000,
+        conf: Optional[Dict[str, str]] = None,
+    ):
+        self.query_latency = query_latency
+        self.rows = rows
+        self.batch_rows = batch_rows
+        self.conf = dict(
+            conf or {"account": "bench", "user": "bench", "host": "127.0.0.1"}
+        )
+        self.connection = _FakeConnection(self)
+
+    def sql(self, query: str, params=None) -> _FakeDataFrame:
+        # the metadata probe of the result cache
+        return _FakeDataFrame([("2024-11-24 00:00:00", self.rows)])
+
+
+class FakeSessionBuilder:
+    def __init__(self, session: FakeSession):
+        self.session = session
+
+    def getOrCreate(self) -> FakeSession:
+        return self.session
@@ -0,0 +1,426 @@
+"""
+Load generator replaying Socket Mode envelopes through the Bolt app of app.py.
+
+Synthetic, or recorded, `/cortalyst` commands and `ask_cortex_analyst` and
+`setup_db` block actions are enqueued on the client of the SocketModeHandler as
+if they came from Slack, at a rate ramping up step by step. The acks are captured
+instead of being sent back, the Web API calls and response_url replies go to a
+local fake Slack server and the questions to the fake Analyst server and Snowpark
+session of benchmarks.fakes, so no Slack connection is needed.
+
+Each step reports the ack latency against the Slack deadline of 3 seconds, the
+completion time of the work and the error rates, the first step past the limits
+is the concurrency knee of the handler.
+
+    python -m benchmarks.socket_replay --rates 2,5,10,20 --step-secs 10 --output replay.json
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List
+
+from benchmarks.cortalyst_client import _write_private_key
+from benchmarks.end_to_end import load_app, summarize, wait_idle
+from benchmarks.fakes import FakeAnalystServer, FakeSession, FakeSlackServer
+from utils.tracing import RingBufferExporter, tracer
+
+# Slack retries, then reports as failed, the requests not acked within 3 seconds
+ACK_DEADLINE_SECS = 3.0
+
+
+def cortalyst_envelope(i: int, question: str, response_url: str) -> Dict[str, Any]:
+    return {
+        "envelope_id": f"replay-{i}",
+        "type": "slash_commands",
+        "accepts_response_payload": True,
+        "payload": {
+            "token": "replay",
+            "team_id": "TBENCH",
+            "team_domain": "bench",
+            "channel_id": f"C{i}",
+            "channel_name": "bench",
+            "user_id": f"U{i}",
+            "user_name": "bench",
+            "command": "/cortalyst",
+            "text": question,
+            "api_app_id": "ABENCH",
+            "is_enterprise_install": "false",
+            "response_url": response_url,
+            "trigger_id": f"replay-{i}",
+        },
+    }
+
+
+def block_action_envelope(
+    i: int, action_id: str, values: Dict[str, Any], response_url: str
+) -> Dict[str, Any]:
+    return {
+        "envelope_id": f"replay-{i}",
+        "type": "interactive",
+        "accepts_response_payload": False,
+        "payload": {
+            "type": "block_actions",
+            "user": {"id": f"U{i}", "username": "bench", "team_id": "TBENCH"},
+            "api_app_id": "ABENCH",
+            "token": "replay",
+            "container": {
+                "type": "message",
+                "message_ts": "1700000000.000001",
+                "channel_id": f"C{i}",
+                "is_ephemeral": True,
+            },
+            "trigger_id": f"replay-{i}",
+            "team": {"id": "TBENCH", "domain": "bench"},
+            "channel": {"id": f"C{i}", "name": "bench"},
+            "response_url": response_url,
+            "state": {"values": values},
+            "actions": [
+                {
+                    "action_id": action_id,
+                    "block_id": action_id,
+                    "type": "button",
+                    "action_ts": f"{time.time():.6f}",
+                }
+            ],
+        },
+    }
+
+
+def ask_envelope(i: int, question: str, response_url: str) -> Dict[str, Any]:
+    return block_action_envelope(
+        i,
+        "ask_cortex_analyst",
+        {
+            "analyst_question_block": {
+                "question": {"type": "plain_text_input", "value": question}
+            }
+        },
+        response_url,
+    )
+
+
+def setup_envelope(i: int, question: str, response_url: str) -> Dict[str, Any]:
+    return block_action_envelope(
+        i,
+        "setup_db",
+        {
+            "db_name_input_block": {
+                "db_name": {"type": "plain_text_input", "value": "demo_db"}
+            },
+            "schema_name_input_block": {
+                "schema_name": {"type": "plain_text_input", "value": "data"}
+            },
+        },
+        response_url,
+    )
+
+
+SYNTHETIC = {
+    "cortalyst": cortalyst_envelope,
+    "ask": ask_envelope,
+    "setup": setup_envelope,
+}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Parse the envelope mix e.g. `cortalyst=8,ask=2,setup=1`
+    """
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in SYNTHETIC:
+            raise ValueError(f"Unknown envelope kind '{kind}', one of {list(SYNTHETIC)}")
+        weights[kind] = float(weight or 1)
+    return weights
+
+
+def synthetic_envelopes(
+    mix: Dict[str, float], distinct: int, response_url: Callable[[int], str], seed: int = 0
+) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    kinds, weights = list(mix), list(mix.values())
+    i = 0
+    while True:
+        kind = rng.choices(kinds, weights)[0]
+        question = f"How many tickets per service type, variant {i % distinct}?"
+        yield SYNTHETIC[kind](i, question, response_url(i))
+        i += 1
+
+
+def recorded_envelopes(
+    path: str, response_url: Callable[[int], str]
+) -> Iterator[Dict[str, Any]]:
+    """
+    Replay the envelopes recorded one per line, in a loop, with new envelope and
+    trigger ids so that each replayed request can be told apart
+    """
+    with open(path) as file:
+        recorded = [json.loads(line) for line in file if line.strip()]
+    if not recorded:
+        raise ValueError(f"No envelopes in {path}")
+    i = 0
+    while True:
+        envelope = copy.deepcopy(recorded[i % len(recorded)])
+        envelope["envelope_id"] = f"replay-{i}"
+        payload = envelope.get("payload", {})
+        payload["trigger_id"] = f"replay-{i}"
+        if "response_url" in payload:
+            payload["response_url"] = response_url(i)
+        yield envelope
+        i += 1
+
+
+class AckRecorder:
+    """
+    Records when each envelope was acked, in place of sending the acks to Slack
+    """
+
+    def __init__(self):
+        self.acked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, message: str):
+        envelope_id = json.loads(message).get("envelope_id")
+        with self._lock:
+            self.acked_at[envelope_id] = time.time()
+
+
+def step_report(
+    rate: float,
+    sent: List[Dict[str, Any]],
+    acked_at: Dict[str, float],
+    traces: Dict[str, List[Dict[str, Any]]],
+    deadline: float,
+) -> Dict[str, Any]:
+    acks, completions = [], []
+    counts = defaultdict(int)
+    for request in sent:
+        acked = acked_at.get(request["envelope_id"])
+        if acked is None:
+            counts["missing_acks"] += 1
+        else:
+            acks.append(acked - request["sent_at"])
+            if acked - request["sent_at"] > deadline:
+                counts["late_acks"] += 1
+        trace = traces.get(request["trigger_id"], [])
+        if any(span["error"] for span in trace):
+            counts["failed"] += 1
+        commands = [span for span in trace if span["name"] == "command"]
+        if commands and not commands[0]["attributes"].get("accepted"):
+            counts["rejected"] += 1
+        elif commands:
+            completions.append(
+                max(span["start"] + span["duration"] for span in trace)
+                - request["sent_at"]
+            )
+    errors = counts["missing_acks"] + counts["late_acks"] + counts["failed"]
+    return {
+        "rate": rate,
+        "sent": len(sent),
+        **{key: counts[key] for key in ("missing_acks", "late_acks", "failed", "rejected")},
+        "error_rate": round(errors / len(sent), 4) if sent else 0.0,
+        "rejected_rate": round(counts["rejected"] / len(sent), 4) if sent else 0.0,
+        "ack_ms": summarize(acks),
+        "completion_ms": summarize(completions),
+    }
+
+
+def find_knee(steps: List[Dict[str, Any]], deadline: float, max_error_rate: float):
+    """
+    The rate of the first step whose p99 ack misses the deadline or whose error rate
+    is above the limit
+    """
+    for step in steps:
+        if (
+            step["error_rate"] > max_error_rate
+            or step["ack_ms"].get("p99", 0) > deadline * 1000
+        ):
+            return step["rate"]
+    return None
+
+
+def run(args) -> Dict[str, Any]:
+    session = FakeSession(query_latency=args.query_latency, rows=args.rows)
+    analyst = FakeAnalystServer(latency=args.analyst_latency).start()
+    slack = FakeSlackServer(latency=args.slack_latency).start()
+    rates = [float(rate) for rate in args.rates.split(",")]
+    buffer = RingBufferExporter(int(sum(rates) * args.step_secs * 20) + 1000)
+    tracer.add_exporter(buffer)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # the setups write their .dbinfo and .setup_state there
+        os.chdir(tmp_dir)
+        try:
+            os.environ["PRIVATE_KEY_FILE_PATH"] = os.path.join(tmp_dir, "bench_key.p8")
+            _write_private_key(os.environ["PRIVATE_KEY_FILE_PATH"])
+            from slack_sdk import WebClient
+            from slack_bolt.adapter.socket_mode import SocketModeHandler
+
+            env = {}
+            if args.workers:
+                env["SCHEDULER_WORKERS"] = str(args.workers)
+            bot = load_app(
+                session,
+                env,
+                client=WebClient(token="xoxb-benchmark", base_url=slack.base_url),
+            )
+            if not args.slack_limits:
+                from handler_tasks.outbox import SlackOutbox
+
+                bot.outbox = SlackOutbox(sleep=lambda seconds: None)
+            bot.analyst_client().analyst_endpoint = analyst.endpoint
+
+            def fake_setup(force: bool = False):
+                time.sleep(args.setup_latency)
+                return {}
+
+            bot.db_setup.do = fake_setup
+
+            handler = SocketModeHandler(
+                bot.app, "xapp-replay", concurrency=args.socket_concurrency
+            )
+            recorder = AckRecorder()
+            handler.client.send_message = recorder
+
+            if args.envelopes:
+                envelopes = recorded_envelopes(args.envelopes, slack.response_url)
+            else:
+                envelopes = synthetic_envelopes(
+                    parse_mix(args.mix), args.distinct, slack.response_url, args.seed
+                )
+
+            started_at = datetime.now(timezone.utc).isoformat()
+            sent_by_step: List[List[Dict[str, Any]]] = []
+            for rate in rates:
+                sent = []
+                step_start = time.perf_counter()
+                for n in range(max(1, int(rate * args.step_secs))):
+                    # open loop, at the rate whatever the bot keeps up with
+                    delay = step_start + n / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    envelope = next(envelopes)
+                    sent.append(
+                        {
+                            "envelope_id": envelope["envelope_id"],
+                            "trigger_id": envelope.get("payload", {}).get("trigger_id"),
+                            "sent_at": time.time(),
+                        }
+                    )
+                    handler.client.enqueue_message(json.dumps(envelope))
+                sent_by_step.append(sent)
+
+            # the acks of the last envelopes, then the work they started
+            ack_deadline = time.monotonic() + 2 * args.deadline
+            total = sum(len(sent) for sent in sent_by_step)
+            while len(recorder.acked_at) < total and time.monotonic() < ack_deadline:
+                time.sleep(0.01)
+            wait_idle(bot, args.timeout)
+            handler.client.close()
+            bot.scheduler.shutdown()
+        finally:
+            os.chdir(cwd)
+
+    analyst.stop()
+    slack.stop()
+    traces = defaultdict(list)
+    for span in buffer.spans():
+        traces[span["trace_id"]].append(span)
+    by_trigger = {}
+    for trace in traces.values():
+        for span in trace:
+            if span["name"] == "slack.envelope" and span["attributes"].get("trigger_id"):
+                by_trigger[span["attributes"]["trigger_id"]] = trace
+
+    steps = [
+        step_report(rate, sent, recorder.acked_at, by_trigger, args.deadline)
+        for rate, sent in zip(rates, sent_by_step)
+    ]
+    return {
+        "benchmark": "socket_replay",
+        "started_at": started_at,
+        "config": vars(args),
+        "steps": steps,
+        "knee_rate": find_knee(steps, args.deadline, args.max_error_rate),
+        "slack_calls": dict(slack.calls),
+        "analyst_requests": analyst.requests,
+        "scheduler": bot.scheduler.stats(),
+        "outbox": bot.outbox.stats(),
+    }
+
+
+def report(result: Dict[str, Any]):
+    print(
+        f"{'rate/s':>7}{'sent':>6}{'ack p50':>9}{'ack p99':>9}{'late':>6}{'missed':>7}"
+        f"{'done p50':>10}{'done p95':>10}{'done p99':>10}{'errors':>8}{'rejected':>10}"
+    )
+    for step in result["steps"]:
+        ack, done = step["ack_ms"], step["completion_ms"]
+        print(
+            f"{step['rate']:>7g}{step['sent']:>6}{ack.get('p50', 0):>9.1f}{ack.get('p99', 0):>9.1f}"
+            f"{step['late_acks']:>6}{step['missing_acks']:>7}"
+            f"{done.get('p50', 0):>10.1f}{done.get('p95', 0):>10.1f}{done.get('p99', 0):>10.1f}"
+            f"{step['error_rate']:>8.1%}{step['rejected_rate']:>10.1%}"
+        )
+    if result["knee_rate"] is None:
+        print("No knee within the rates tried")
+    else:
+        print(f"Knee at {result['knee_rate']:g} requests/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--rates", default="1,2,5,10", help="Requests per second of each ramp step"
+    )
+    parser.add_argument("--step-secs", type=float, default=10)
+    parser.add_argument(
+        "--mix", default="cortalyst=8,ask=2", help="Weights of the synthetic envelopes"
+    )
+    parser.add_argument(
+        "--envelopes", help="Replay the Socket Mode envelopes of this JSON lines file"
+    )
+    parser.add_argument("--distinct", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--socket-concurrency",
+        type=int,
+        default=10,
+        help="Threads of the SocketModeHandler, its default is 10",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Scheduler workers, default SCHEDULER_WORKERS"
+    )
+    parser.add_argument("--analyst-latency", type=float, default=0.5)
+    parser.add_argument("--query-latency", type=float, default=0.2)
+    parser.add_argument("--slack-latency", type=float, default=0.05)
+    parser.add_argument("--setup-latency", type=float, default=2.0)
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument(
+        "--slack-limits", action="store_true", help="Pace the messages as Slack would"
+    )
+    parser.add_argument("--deadline", type=float, default=ACK_DEADLINE_SECS)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="Save the results as JSON to this file")
+    args = parser.parse_args()
+
+    result = run(args)
+    report(result)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from utils.cache import LRUCache
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize the question so that case, whitespace and punctuation variants of
+    the same question share the cached answer
+    """
+    return " ".join(_PUNCTUATION.sub("", question.lower()).split())
+
+
+class AnswerCache:
+    """
+    Cache of Cortex Analyst answers keyed by the normalized question and the
+    content hash of the semantic model it was answered against.
+    """
+
+    LOGGER = logging.getLogger(__name__)
+    LOGGER.setLevel(os.getenv("APP_LOG_LEVEL", logging.WARNING))
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+    ):
+        if max_entries is None:
+            max_entries = int(os.getenv("ANSWER_CACHE_SIZE", 256))
+        if ttl is None:
+            ttl = float(os.getenv("ANSWER_CACHE_TTL_SECS", 900))
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._model_versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def model_version(self, semantic_model: str) -> Optional[str]:
+        return self._model_versions.get(semantic_model)
+
+    def set_semantic_model(self, semantic_model: str, content: str) -> str:
+        """
+        Record the content of the semantic model staged at `semantic_model`, dropping
+        all the answers cached for it.
+        :param semantic_model: The staged semantic model e.g. @db.schema.stage/file.yaml
+        :param content: The rendered semantic model YAML
+        :return: the content hash used as the model version
+        """
+        version = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self._lock:
+            self._model_versions[semantic_model] = version
+            dropped = self._cache.invalidate_where(lambda key: key[0] == semantic_model)
+        self.LOGGER.debug(
+            f"Semantic model {semantic_model} is at version {version}, dropped {dropped} cached answers"
+        )
+        return version
+
+    def get(
+        self, semantic_model: str, version: str, question: str
+    ) -> Optional[Dict[str, Any]]:
+        return self._cache.get((semantic_model, version, normalize_question(question)))
+
+    def put(
+        self,
+        semantic_model: str,
+        version: str,
+        question: str,
+        answer: Dict[str, Any],
+    ):
+        """
+        Cache the answer under the model version it was asked against, an answer
+        that raced with a model upload is stored under the old version and never served
+        """
+        self._cache.put((semantic_model, version, normalize_question(question)), answer)
+
+    def share(self, store):
+        """
+        Share the cached answers with the other processes through the SharedStore
+        """
+        self._cache.share(store, "answers")
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+
+answer_cache = AnswerCache()
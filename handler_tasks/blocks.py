@@ -1,8 +1,13 @@
 from typing import List, Dict, Any
 import json
-import pandas as pd
 import numpy as np
 
+# Slack rejects section blocks whose text is longer than this
+SECTION_TEXT_LIMIT = 3000
+
+# the block_id of the page buttons of an answer table, followed by its result id
+PAGE_BLOCK_PREFIX = "result_pages_"
+
 db_schema_setup = [
     {
         "type": "section",
@@ -96,41 +101,204 @@ def create_sql_block(sql_query) -> List[Dict[str, Any]]:
     ]
 
 
-def create_df_block(df, title="Answer") -> List[Dict[str, Any]]:
+def analyst_progress_block(
+    status: str, text: str = "", statements: List[str] = ()
+) -> List[Dict[str, Any]]:
     """
-    Slack App block to send Dataframe as a markdown table.
+    Slack App block of the Cortex Analyst answer as it streams, updated in place
+    with the status, the interpretation of the question and the generated SQL.
     """
+    block = [
+        {
+            "type": "context",
+            "elements": [{"type": "mrkdwn", "text": f":robot_face: _{status}_"}],
+        },
+    ]
+    if text:
+        block.append(
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": text[:SECTION_TEXT_LIMIT]},
+            }
+        )
+    for statement in statements:
+        block.extend(create_sql_block(statement[: SECTION_TEXT_LIMIT - 8]))
+    return block
 
-    # Function to format a single value properly for display
-    def format_value(val):
-        if pd.isna(val):
-            return "N/A"
-        elif isinstance(val, (float, np.floating)):
-            return f"{val:.2f}"
-        return str(val)
 
-    # Create markdown table header
-    headers = df.columns.tolist()
-    header_row = " | ".join([""] + headers + [""])
-    separator_row = " | ".join([""] + ["-" * len(header) for header in headers] + [""])
+def format_floats(values: np.ndarray) -> np.ndarray:
+    """
+    Format a float column with two decimals, using integer arithmetic so that the
+    whole column is converted at once. Values whose rounding is ambiguous in the
+    scaled representation, too large or not finite fall back to printf formatting.
+    """
+    with np.errstate(invalid="ignore", over="ignore"):
+        scaled = values * 100
+        cents = np.rint(scaled)
+        exact = np.isfinite(scaled) & (np.abs(cents) < 1e15)
+        exact &= np.abs(np.abs(scaled - cents) - 0.5) > 1e-6
+    cents = np.where(exact, cents, 0).astype(np.int64)
+    whole, frac = np.divmod(np.abs(cents), 100)
+    formatted = np.char.add(
+        np.char.add(np.where(np.signbit(values), "-", ""), whole.astype(str)),
+        np.char.add(".", np.char.zfill(frac.astype(str), 2)),
+    )
+    if not exact.all():
+        formatted = formatted.astype(object)
+        formatted[~exact] = np.char.mod("%.2f", values[~exact])
+    return formatted
 
-    # Create table rows
-    table_rows = []
-    for _, row in df.head(10).iterrows():  # Limiting to 10 rows for Slack readability
-        formatted_row = [format_value(val) for val in row]
-        table_rows.append(" | ".join([""] + formatted_row + [""]))
 
-    # Combine all rows
-    markdown_table = "\n".join([header_row, separator_row] + table_rows)
+def format_columns(df) -> List[List[str]]:
+    """
+    Format the DataFrame for display column by column, floats with two decimals
+    and missing values as N/A. Columns of the same kind are formatted together.
+    :return: the formatted cells of each column
+    """
+    kinds = [dtype.kind for dtype in df.dtypes]
+    columns: List[List[str]] = [None] * len(kinds)
 
-    # Create the full table display with summary
-    total_rows = len(df)
-    shown_rows = min(10, total_rows)
-    summary_text = (
-        f"Showing {shown_rows} of {total_rows} rows"
-        if total_rows > 10
-        else f"Total rows: {total_rows}"
+    floats = [i for i, kind in enumerate(kinds) if kind == "f"]
+    integers = [i for i, kind in enumerate(kinds) if kind in "biu"]
+    if floats and len(df):
+        block = format_floats(df.iloc[:, floats].to_numpy(dtype=float))
+        for i, cells in zip(floats, block.T.tolist()):
+            columns[i] = cells
+    if integers and len(df):
+        block = df.iloc[:, integers].to_numpy().astype(str)
+        for i, cells in zip(integers, block.T.tolist()):
+            columns[i] = cells
+    others = [i for i, cells in enumerate(columns) if cells is None]
+    if others:
+        block = df.iloc[:, others].to_numpy(dtype=object)
+        for i, values in zip(others, block.T.tolist()):
+            columns[i] = [str(value) for value in values]
+
+    missing = df.isna().to_numpy()
+    for i in np.flatnonzero(missing.any(axis=0)).tolist():
+        columns[i] = [
+            "N/A" if na else cell for cell, na in zip(columns[i], missing[:, i].tolist())
+        ]
+    return columns
+
+
+def markdown_table(df, max_rows=10, max_chars=SECTION_TEXT_LIMIT - 6):
+    """
+    Format the first `max_rows` rows of the Dataframe as an aligned markdown table,
+    formatting whole columns at once. Rows that would not fit in `max_chars`
+    are left out.
+    :return: the markdown table and the number of rows in it
+    """
+    rows = df.head(max_rows)
+
+    headers = [str(column) for column in df.columns]
+    columns = format_columns(rows)
+    widths = [
+        max(len(header), max(map(len, cells), default=0))
+        for header, cells in zip(headers, columns)
+    ]
+    # numbers read better right aligned
+    aligns = [">" if dtype.kind in "biuf" else "<" for dtype in rows.dtypes]
+    row_format = " | ".join(
+        [""] + [f"{{:{align}{width}}}" for align, width in zip(aligns, widths)] + [""]
     )
+
+    header_row = " | ".join(
+        [""] + [header.ljust(width) for header, width in zip(headers, widths)] + [""]
+    )
+    separator_row = " | ".join([""] + ["-" * width for width in widths] + [""])
+
+    # all the lines are of the same width once aligned
+    line_width = len(header_row) + 1
+    shown_rows = max(0, min(len(rows), (max_chars + 1) // line_width - 2))
+    table_rows = [
+        row_format.format(*cells) for cells in zip(*columns)
+    ][:shown_rows]
+    return "\n".join([header_row, separator_row] + table_rows), shown_rows
+
+
+def page_buttons(
+    result_id: str, offset: int, shown_rows: int, page_rows: int, kept_rows: int
+) -> List[Dict[str, Any]]:
+    """
+    The previous/next page buttons of the answer table, their value is the result
+    id and the offset of the page they show. `page_rows` is the rows of a full
+    page, less than `max_rows` when the character limit of the table cut it.
+    """
+    if shown_rows == 0:
+        # too wide for a single row, no page would show any
+        return []
+    buttons = []
+    if offset > 0:
+        buttons.append(
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "Previous page"},
+                "action_id": "result_previous_page",
+                "value": json.dumps(
+                    {"result_id": result_id, "offset": max(0, offset - page_rows)}
+                ),
+            }
+        )
+    if offset + shown_rows < kept_rows:
+        buttons.append(
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "Next page"},
+                "action_id": "result_next_page",
+                "value": json.dumps(
+                    {"result_id": result_id, "offset": offset + shown_rows}
+                ),
+            }
+        )
+    if not buttons:
+        return []
+    # unique per result, Slack rejects a message with twice the same block_id
+    return [
+        {
+            "type": "actions",
+            "block_id": f"{PAGE_BLOCK_PREFIX}{result_id}",
+            "elements": buttons,
+        }
+    ]
+
+
+def has_page_buttons(block: List[Dict[str, Any]]) -> bool:
+    return any(b.get("block_id", "").startswith(PAGE_BLOCK_PREFIX) for b in block)
+
+
+def create_df_block(
+    df,
+    title="Answer",
+    total_rows=None,
+    max_rows=10,
+    offset=0,
+    result_id=None,
+    kept_rows=None,
+) -> List[Dict[str, Any]]:
+    """
+    Slack App block to send Dataframe as a markdown table.
+    `total_rows` is the row count of the whole result when df is only a preview of it.
+    With a `result_id` df is the page of the kept result starting at `offset`, out
+    of `kept_rows` rows that can be browsed with the previous/next page buttons.
+    """
+
+    # Limiting the rows for Slack readability
+    table, shown_rows = markdown_table(df, max_rows=max_rows)
+
+    # Create the full table display with summary
+    if total_rows is None:
+        total_rows = offset + len(df)
+    if result_id is not None and total_rows > shown_rows:
+        summary_text = (
+            f"Showing rows {offset + 1}-{offset + shown_rows} of {total_rows}"
+        )
+        if kept_rows is not None and kept_rows < total_rows:
+            summary_text += f", the first {kept_rows} can be browsed"
+    elif total_rows > shown_rows:
+        summary_text = f"Showing {shown_rows} of {total_rows} rows"
+    else:
+        summary_text = f"Total rows: {total_rows}"
     block = [
         {
             "type": "header",
@@ -138,21 +306,42 @@ def create_df_block(df, title="Answer") -> List[Dict[str, Any]]:
         },
         {
             "type": "section",
-            "text": {"type": "mrkdwn", "text": f"```{markdown_table}```"},
+            "text": {"type": "mrkdwn", "text": f"```{table}```"},
         },
         {
             "type": "context",
             "elements": [{"type": "mrkdwn", "text": f"_{summary_text}_"}],
         },
     ]
+    if result_id is not None:
+        # the pages step by the rows shown when the character limit cut the page,
+        # a last page is only short of rows
+        page_rows = shown_rows if shown_rows < min(len(df), max_rows) else max_rows
+        block.extend(
+            page_buttons(
+                result_id,
+                offset,
+                shown_rows,
+                page_rows,
+                kept_rows if kept_rows is not None else offset + len(df),
+            )
+        )
 
     return block
 
 
 def visualization_block(
-    uploaded_file, title="Data Visualization Results"
+    uploaded_file=None, title="Data Visualization Results", file_id=None
 ) -> List[Dict[str, Any]]:
-
+    """
+    Slack App block showing a chart already uploaded to Slack, either from the
+    upload response or by its file id.
+    """
+    slack_file = (
+        {"id": file_id}
+        if file_id is not None
+        else {"url": uploaded_file["file"]["url_private"]}
+    )
     block = [
         {
             "type": "section",
@@ -160,9 +349,7 @@ def visualization_block(
         },
         {
             "type": "image",
-            "slack_file": {
-                "url": uploaded_file["file"]["url_private"],
-            },
+            "slack_file": slack_file,
             "alt_text": "graph",
         },
         {
@@ -0,0 +1,120 @@
+import os
+import io
+import json
+import hashlib
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+from utils.cache import LRUCache
+from utils.metrics import metrics
+from utils.single_flight import SingleFlight
+from utils.tracing import tracer
+
+# pie chart of the ticket counts by service type
+DEFAULT_SPEC = {
+    "mark": "arc",
+    "encoding": {"theta": "TICKET_COUNT", "color": "SERVICE_TYPE"},
+}
+
+
+def chart_key(df, spec: Dict[str, Any]) -> str:
+    """
+    Content address of the chart, a hash of the DataFrame contents and the chart spec
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(spec, sort_keys=True).encode("utf-8"))
+    digest.update(
+        json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode("utf-8")
+    )
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def render_png(df, spec: Dict[str, Any]) -> bytes:
+    """
+    Render the chart of the DataFrame as PNG
+    """
+    # altair and its vl-convert renderer are slow to import, load them with the
+    # first chart rather than at startup
+    import altair as alt
+
+    chart = getattr(alt.Chart(df), f"mark_{spec['mark']}")().encode(
+        **spec["encoding"]
+    )
+
+    # Save chart to bytes buffer as PNG
+    buffer = io.BytesIO()
+    chart.save(buffer, format="png")
+    buffer.seek(0)
+    return buffer.getvalue()
+
+
+class ChartCache:
+    """
+    Content addressed cache of the rendered charts, the PNG bytes are bounded by
+    a memory budget. The Slack file each chart was uploaded as is remembered per
+    channel, so that a repeat answer can share the existing file instead of
+    uploading it again.
+    """
+
+    LOGGER = logging.getLogger(__name__)
+    LOGGER.setLevel(os.getenv("APP_LOG_LEVEL", logging.WARNING))
+
+    def __init__(self, max_bytes: Optional[int] = None, max_files: int = 1024):
+        if max_bytes is None:
+            max_bytes = int(os.getenv("CHART_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+        self._pngs = LRUCache(
+            max_entries=None if max_bytes > 0 else 0,
+            max_bytes=max_bytes,
+            sizeof=len,
+        )
+        self._files = LRUCache(max_entries=max_files)
+        self._in_flight = SingleFlight()
+
+    def render(self, df, spec: Dict[str, Any] = DEFAULT_SPEC) -> Tuple[str, bytes]:
+        """
+        :return: the chart key and its PNG, rendered only when not already cached
+        """
+        with tracer.span("render") as span:
+            key = chart_key(df, spec)
+            png = self._pngs.get(key)
+            if png is None:
+                # the same chart asked again while rendering waits for the first render
+                png, shared = self._in_flight.do(key, self._render, key, df, spec)
+                span.set(shared=shared)
+            else:
+                span.set(cached=True)
+            span.set(chart_key=key)
+            return key, png
+
+    def _render(self, key: str, df, spec: Dict[str, Any]) -> bytes:
+        self.LOGGER.debug(f"Rendering chart {key}")
+        with metrics.stage("render"):
+            png = render_png(df, spec)
+        self._pngs.put(key, png)
+        return png
+
+    def shared_file(self, key: str, channel_id: str) -> Optional[str]:
+        return self._files.get((key, channel_id))
+
+    def remember_file(self, key: str, channel_id: str, file_id: str):
+        self._files.put((key, channel_id), file_id)
+
+    def forget_file(self, key: str, channel_id: str):
+        self._files.invalidate((key, channel_id))
+
+    def share(self, store):
+        """
+        Share the rendered charts and their Slack files with the other processes
+        through the SharedStore
+        """
+        self._pngs.share(store, "charts")
+        self._files.share(store, "chart_files")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {"charts": self._pngs.stats(), "files": self._files.stats()}
+
+
+chart_cache = ChartCache()
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# (team id, channel id), None for the team wide and global configurations
+Scope = Tuple[Optional[str], Optional[str]]
+
+GLOBAL: Scope = (None, None)
+
+
+class TenantConfig(NamedTuple):
+    """
+    The database/schema a demo runs against, and its semantic model
+    """
+
+    db_name: str = "demo_db"
+    schema_name: str = "data"
+    semantic_models_stage: str = "semantic_models"
+    semantic_model_file: str = "support_tickets_semantic_model.yaml"
+
+    @property
+    def semantic_model(self) -> str:
+        """
+        The staged semantic model as referred by Cortex Analyst
+        """
+        return f"@{self.db_name}.{self.schema_name}.{self.semantic_models_stage}/{self.semantic_model_file}"
+
+
+class ConfigRegistry:
+    """
+    The demo configuration of each Slack workspace (team) and channel. A channel
+    uses its own configuration, else the one of its team, else the global one.
+
+    Reads are lock free: the configurations are an immutable snapshot, resolved
+    with at most two dict lookups. Writes copy the snapshot under a lock, persist
+    it to `path` (and the SharedStore of the worker processes, if any) and then
+    swap it in, so that a reader sees either the old or the new snapshot.
+    """
+
+    LOGGER = logging.getLogger(__name__)
+    LOGGER.setLevel(os.getenv("APP_LOG_LEVEL", logging.WARNING))
+
+    def __init__(
+        self,
+        path: str = ".tenant_config",
+        default: TenantConfig = TenantConfig(),
+        store=None,
+        refresh_interval: Optional[float] = None,
+    ):
+        """
+        :param path: The JSON file the configurations are persisted to.
+        :param default: The global configuration until one is set.
+        :param store: The SharedStore the configurations are shared through, if any.
+        :param refresh_interval: Min seconds between two reads of the store, env CONFIG_REFRESH_SECS.
+        """
+        self.path = path
+        self.store = store
+        self.refresh_interval = (
+            refresh_interval
+            if refresh_interval is not None
+            else float(os.getenv("CONFIG_REFRESH_SECS", 1))
+        )
+        self._write_lock = threading.Lock()
+        self._configs: Dict[Scope, TenantConfig] = {GLOBAL: default}
+        self._version = 0
+        self._refreshed_at = 0.0
+
+    def resolve(self, team_id: Optional[str], channel_id: Optional[str]) -> TenantConfig:
+        """
+        The configuration of the channel of the team
+        """
+        configs = self._configs
+        return (
+            configs.get((team_id, channel_id))
+            or configs.get((team_id, None))
+            or configs[GLOBAL]
+        )
+
+    def configs(self) -> Dict[Scope, TenantConfig]:
+        return dict(self._configs)
+
+    def set(
+        self,
+        config: TenantConfig,
+        team_id: Optional[str] = None,
+        channel_id: Optional[str] = None,
+    ):
+        """
+        Set the configuration of the channel, of the whole team without a channel,
+        or the global one without a team
+        """
+        self.update({(team_id, channel_id): config})
+
+    def update(self, configs: Dict[Scope, TenantConfig]):
+        """
+        Set several configurations at once, atomically
+        """
+        with self._write_lock:
+            version = time.time_ns()
+            if self.store is not None:
+                # on top of the configurations set by the other processes, read
+                # and written back in one transaction of the store
+                self.store.update(
+                    "config",
+                    "tenants",
+                    lambda records: self._merge(records, configs, version),
+                )
+            snapshot = {**self._configs, **configs}
+            self._save(snapshot, version)
+            self._configs = snapshot
+            self._version = version
+
+    def _merge(
+        self, records: Optional[Dict], configs: Dict[Scope, TenantConfig], version: int
+    ) -> Dict:
+        if records is not None:
+            self._apply(records)
+        return _records({**self._configs, **configs}, version)
+
+    def _save(self, snapshot: Dict[Scope, TenantConfig], version: int):
+        records = _records(snapshot, version)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(records, file, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def load(self, legacy_path: str = ".dbinfo") -> "ConfigRegistry":
+        """
+        Load the configurations from the store, else from the file. Without either
+        the global configuration comes from the legacy .dbinfo file, if any.
+        """
+        records = self.store.get("config", "tenants") if self.store is not None else None
+        if records is None and os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as file:
+                    records = json.load(file)
+            except (OSError, ValueError) as e:
+                self.LOGGER.warning(f"Ignoring unreadable configuration {self.path},{e}")
+        if records is not None:
+            self._apply(records)
+        elif os.path.exists(legacy_path):
+            with open(legacy_path, "r") as file:
+                db_info = json.load(file)
+            self._configs = {
+                **self._configs,
+                GLOBAL: self._configs[GLOBAL]._replace(
+                    db_name=db_info["db_name"], schema_name=db_info["schema_name"]
+                ),
+            }
+        return self
+
+    def refresh(self) -> bool:
+        """
+        Pick up the configurations set by the other worker processes, reading the
+        store at most once per refresh interval
+        :return: whether the configurations changed
+        """
+        if self.store is None:
+            return False
+        now = time.monotonic()
+        if now - self._refreshed_at < self.refresh_interval:
+            return False
+        self._refreshed_at = now
+        records = self.store.get("config", "tenants")
+        if records is None or records["version"] == self._version:
+            return False
+        with self._write_lock:
+            return self._apply(records)
+
+    def _apply(self, records) -> bool:
+        if records["version"] == self._version:
+            return False
+        self._configs = {
+            (record["team_id"], record["channel_id"]): TenantConfig(**record["config"])
+            for record in records["configs"]
+        }
+        self._version = records["version"]
+        return True
+
+
+def _records(snapshot: Dict[Scope, TenantConfig], version: int) -> Dict:
+    configs: List[Dict] = [
+        {"team_id": team_id, "channel_id": channel_id, "config": config._asdict()}
+        for (team_id, channel_id), config in snapshot.items()
+    ]
+    return {"version": version, "configs": configs}
@@ -1,9 +1,120 @@
 import os
 import logging
+import threading
 import requests
-from typing import Dict, Any
+from requests.adapters import HTTPAdapter
+import json
+import time
+from typing import Dict, Any, Iterable, Iterator, Optional, Tuple
 
 from utils.jwt_generator import JWTGenerator
+from utils.metrics import metrics
+from utils.tracing import tracer
+from utils.single_flight import SingleFlight
+from utils.sse import parse_sse
+from handler_tasks.answer_cache import AnswerCache, answer_cache, normalize_question
+
+
+def answer_text(content: Iterable[Dict[str, Any]]) -> str:
+    """
+    The text items of the answer content e.g. the interpretation of the question
+    """
+    return "\n".join(item["text"] for item in content if item["type"] == "text")
+
+
+def analyst_events(
+    sse: Iterable[Tuple[str, str]], request_id: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Assemble the Analyst server-sent events into the events of the answer:
+      - {"type": "status", "status": ..., "message": ...} as the Analyst progresses
+      - {"type": "text", "text": ...} with the text of the interpretation so far
+      - {"type": "sql", "statement": ...} once a statement is complete, so that it
+        can be run while the rest of the answer streams
+      - {"type": "done", "message": ..., "request_id": ...} with the whole answer,
+        in the shape of the non streaming response message
+    """
+    content: Dict[int, Dict[str, Any]] = {}
+    pending_sql = set()
+
+    def complete_sql(indexes):
+        for index in sorted(indexes):
+            pending_sql.discard(index)
+            yield {"type": "sql", "statement": content[index]["statement"]}
+
+    for event, data in sse:
+        match event:
+            case "status":
+                status = json.loads(data)
+                if status.get("status") == "done":
+                    yield from complete_sql(set(pending_sql))
+                yield {
+                    "type": "status",
+                    "status": status.get("status"),
+                    "message": status.get("status_message", status.get("status")),
+                }
+            case "message.content.delta":
+                delta = json.loads(data)
+                index = delta["index"]
+                # a statement is complete once the Analyst moves on to the next item
+                yield from complete_sql({i for i in pending_sql if i != index})
+                item = content.setdefault(index, {"type": delta["type"]})
+                match delta["type"]:
+                    case "text":
+                        item["text"] = item.get("text", "") + delta.get("text_delta", "")
+                        yield {
+                            "type": "text",
+                            "text": answer_text(content[i] for i in sorted(content)),
+                        }
+                    case "sql":
+                        item["statement"] = item.get("statement", "") + delta.get(
+                            "statement_delta", ""
+                        )
+                        if "confidence" in delta:
+                            item["confidence"] = delta["confidence"]
+                        pending_sql.add(index)
+                    case "suggestions":
+                        suggestions = item.setdefault("suggestions", [])
+                        suggestion = delta.get("suggestions_delta", {})
+                        while len(suggestions) <= suggestion.get("index", 0):
+                            suggestions.append("")
+                        suggestions[suggestion.get("index", 0)] += suggestion.get(
+                            "suggestion_delta", ""
+                        )
+            case "error":
+                error = json.loads(data)
+                raise Exception(
+                    f"Failed request (id: {error.get('request_id', request_id)}) with error {error.get('code')}: {error.get('message')}"
+                )
+    yield from complete_sql(set(pending_sql))
+    yield {
+        "type": "done",
+        "message": {
+            "role": "analyst",
+            "content": [content[index] for index in sorted(content)],
+        },
+        "request_id": request_id,
+    }
+
+
+def replay_answer(ans: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    The events of a complete answer, as analyst_events would have streamed them
+    """
+    content = ans["message"]["content"]
+    for i, item in enumerate(content):
+        match item["type"]:
+            case "text":
+                yield {"type": "text", "text": answer_text(content[: i + 1])}
+            case "sql":
+                yield {"type": "sql", "statement": item["statement"]}
+    yield {
+        "type": "done",
+        "message": ans["message"],
+        "request_id": ans.get("request_id"),
+        "cached": ans.get("cached", False),
+        "shared": ans.get("shared", False),
+    }
 
 
 class Cortlayst:
@@ -17,10 +128,13 @@ class Cortlayst:
         user: str,
         private_key_file_path: str,
         host: str,
-        database: str = "slack_demo",
+        database: str = "demo_db",
         schema: str = "data",
         stage: str = "semantic_models",
         file: str = "support_tickets_semantic_model.yaml",
+        pool_size: Optional[int] = None,
+        cache: Optional[AnswerCache] = answer_cache,
+        refresh_token: Optional[bool] = None,
     ):
         self.account = account
         self.user = user
@@ -29,18 +143,47 @@ class Cortlayst:
             user,
             private_key_file_path,
         )
+        # renew the JWT in the background, off the path of the questions
+        if refresh_token is None:
+            refresh_token = os.getenv("JWT_BACKGROUND_REFRESH", "false").lower() == "true"
+        if refresh_token:
+            self.jwt_generator.start_refresher()
         self.database = database
         self.schema = schema
         self.stage = stage
         self.file = file
+        self.cache = cache
+        self.in_flight = SingleFlight()
         self.analyst_endpoint = f"https://{host}/api/v2/cortex/analyst/message"
+        # keep-alive session so repeated questions reuse the TLS connection
+        if pool_size is None:
+            pool_size = int(os.getenv("CORTALYST_POOL_SIZE", 10))
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+
+    @property
+    def semantic_model_file(self) -> str:
+        return f"@{self.database}.{self.schema}.{self.stage}/{self.file}"
 
     def get_token(self):
         self.LOGGER.debug("Getting JWT Token")
-        return self.jwt_generator.generate_token()
+        with metrics.stage("jwt"):
+            return self.jwt_generator.generate_token()
 
-    def answer(self, question) -> Dict[str, Any]:
-        self.LOGGER.debug(f"Answering question:{question}")
+    def _cached_answer(self, semantic_model_file: str, model_version: Optional[str], question):
+        if model_version is None:
+            return None
+        cached = self.cache.get(semantic_model_file, model_version, question)
+        if cached is not None:
+            self.LOGGER.debug("Answering from cache")
+            return {**cached, "cached": True}
+        return None
+
+    def _post(
+        self, semantic_model_file: str, question, stream: bool = False, parent=None
+    ):
         jwt_token = self.get_token()
         self.LOGGER.debug(f"Token:{jwt_token}")
         payload = {
@@ -50,28 +193,199 @@ class Cortlayst:
                     "content": [{"type": "text", "text": question}],
                 }
             ],
-            "semantic_model_file": f"@{self.database}.{self.schema}.{self.stage}/{self.file}",
+            "semantic_model_file": semantic_model_file,
         }
+        if stream:
+            payload["stream"] = True
 
         self.LOGGER.debug(f"Analyst Endpoint:{self.analyst_endpoint}")
         self.LOGGER.debug(f"Request Payload:{payload}")
 
-        resp = requests.post(
-            url=f"{self.analyst_endpoint}",
-            json=payload,
-            headers={
-                "X-Snowflake-Authorization-Token-Type": "KEYPAIR_JWT",
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-                "Authorization": f"Bearer {jwt_token}",
-            },
+        start = time.perf_counter()
+        with metrics.stage("analyst"), tracer.span(
+            "analyst.request", parent=parent, stream=stream
+        ) as span:
+            resp = self.http.post(
+                url=f"{self.analyst_endpoint}",
+                json=payload,
+                headers={
+                    "X-Snowflake-Authorization-Token-Type": "KEYPAIR_JWT",
+                    "Content-Type": "application/json",
+                    "Accept": "text/event-stream" if stream else "application/json",
+                    "Authorization": f"Bearer {jwt_token}",
+                },
+                stream=stream,
+            )
+            request_id = resp.headers.get("X-Snowflake-Request-Id")
+            span.set(request_id=request_id, status=resp.status_code)
+        self.LOGGER.debug(
+            f"Analyst request {request_id} responded in {time.perf_counter() - start:.3f}s"
         )
-
-        request_id = resp.headers.get("X-Snowflake-Request-Id")
-        if resp.status_code == 200:
-            self.LOGGER.debug(f"Response:{resp.text}")
-            return {**resp.json(), "request_id": request_id}
-        else:
+        if resp.status_code != 200:
             raise Exception(
                 f"Failed request (id: {request_id}) with status {resp.status_code}: {resp.text}"
             )
+        return resp, request_id
+
+    def answer(
+        self, question, semantic_model_file: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Answer the question against the staged semantic model, by default the one of
+        the database/schema of the client
+        """
+        self.LOGGER.debug(f"Answering question:{question}")
+        with tracer.span("analyst.answer") as span:
+            semantic_model_file = semantic_model_file or self.semantic_model_file
+            model_version = (
+                self.cache.model_version(semantic_model_file) if self.cache else None
+            )
+            cached = self._cached_answer(semantic_model_file, model_version, question)
+            if cached is not None:
+                span.set(cached=True, request_id=cached.get("request_id"))
+                return cached
+
+            # the same question asked again while in flight waits for the first answer
+            ans, shared = self.in_flight.do(
+                (semantic_model_file, normalize_question(question)),
+                self._ask,
+                semantic_model_file,
+                model_version,
+                question,
+            )
+            span.set(shared=shared, request_id=ans.get("request_id"))
+            return {**ans, "shared": True} if shared else ans
+
+    def _ask(self, semantic_model_file: str, model_version: Optional[str], question):
+        resp, request_id = self._post(semantic_model_file, question)
+        self.LOGGER.debug(f"Response:{resp.text}")
+        ans = {**resp.json(), "request_id": request_id}
+        if model_version is not None:
+            self.cache.put(semantic_model_file, model_version, question, ans)
+        return ans
+
+    def stream_answer(
+        self, question, semantic_model_file: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Answer the question from the Analyst server-sent events stream, yielding the
+        events as they arrive, see analyst_events. A cached answer is replayed, as is
+        the answer of the same question already streaming for another caller.
+        """
+        self.LOGGER.debug(f"Streaming answer of question:{question}")
+        semantic_model_file = semantic_model_file or self.semantic_model_file
+        model_version = (
+            self.cache.model_version(semantic_model_file) if self.cache else None
+        )
+        cached = self._cached_answer(semantic_model_file, model_version, question)
+        if cached is not None:
+            tracer.start(
+                "analyst.answer", cached=True, request_id=cached.get("request_id")
+            ).end()
+            yield from replay_answer(cached)
+            return
+
+        key = (semantic_model_file, normalize_question(question))
+        in_flight, leader = self.in_flight.begin(key)
+        # not made current, the caller runs its own work between the streamed events
+        span = tracer.start("analyst.answer", stream=True, shared=not leader)
+        if not leader:
+            self.LOGGER.debug("Waiting for the answer of the same question in flight")
+            yield {
+                "type": "status",
+                "status": "waiting",
+                "message": "Someone just asked the same question, waiting for its answer",
+            }
+            try:
+                shared = in_flight.result()
+            except Exception as e:
+                span.end(e)
+                raise
+            span.set(request_id=shared.get("request_id"))
+            span.end()
+            yield from replay_answer({**shared, "shared": True})
+            return
+
+        ans, error = None, None
+        try:
+            resp, request_id = self._post(
+                semantic_model_file, question, stream=True, parent=span
+            )
+            span.set(request_id=request_id)
+            # requests reads a text/* response without a charset as ISO-8859-1
+            resp.encoding = "utf-8"
+            with resp:
+                for event in analyst_events(
+                    parse_sse(resp.iter_lines(decode_unicode=True)), request_id
+                ):
+                    if event["type"] == "done":
+                        ans = {"message": event["message"], "request_id": request_id}
+                        if model_version is not None:
+                            self.cache.put(
+                                semantic_model_file, model_version, question, ans
+                            )
+                    yield event
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # also when the caller stopped consuming the stream before its end
+            if ans is not None:
+                self.in_flight.end(key, ans)
+            else:
+                self.in_flight.end(
+                    key, error=error or Exception("Answer stream abandoned")
+                )
+            span.end(error)
+
+    def close(self):
+        """
+        Release the pooled connections held by this client and stop its token refresher
+        """
+        self.http.close()
+        self.jwt_generator.stop_refresher()
+
+
+_clients: Dict[Tuple[str, str, str, str], Cortlayst] = {}
+_clients_lock = threading.Lock()
+
+
+def get_cortalyst(
+    account: str,
+    user: str,
+    private_key_file_path: str,
+    host: str,
+    pool_size: Optional[int] = None,
+) -> Cortlayst:
+    """
+    Return the long lived Cortlayst client for the account/user/host/key,
+    creating it on first use. The client keeps its parsed private key, JWT and
+    HTTP connection pool so that repeated questions skip all of them.
+    """
+    key = (account, user, host, os.path.abspath(private_key_file_path))
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            Cortlayst.LOGGER.debug(f"Creating Cortex Analyst client for {user}@{host}")
+            client = Cortlayst(
+                account=account,
+                user=user,
+                private_key_file_path=private_key_file_path,
+                host=host,
+                pool_size=pool_size,
+            )
+            _clients[key] = client
+    return client
+
+
+def clear_cortalyst_clients():
+    """
+    Close and forget all the registered Cortlayst clients
+    """
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -1,24 +1,53 @@
-from typing import Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 import os
+import io
+import re
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone, timedelta
 import logging
 
 from jinja2 import Environment, FileSystemLoader
 
 
-from snowflake.core import Root, CreateMode
-from snowflake.core.database import Database
-from snowflake.core.schema import Schema
-from snowflake.core.table import Table, TableColumn
-from snowflake.core.stage import Stage, StageEncryption, StageDirectoryTable
-from snowflake.core.pipe import Pipe
+# snowflake.core is slow to import and only needed by the setup, the methods
+# import it on first use so that it stays out of the bot startup
+if TYPE_CHECKING:
+    from snowflake.core import Root
+    from snowflake.core.pipe import Pipe
+    from snowflake.core.stage import Stage
+    from snowflake.core.table import Table
+
+from handler_tasks.answer_cache import answer_cache
+from handler_tasks.setup_state import SetupState, fingerprint
+from handler_tasks.stage_files import (
+    copy_files_batches,
+    copy_files_sql,
+    parse_last_modified,
+    stale_files,
+)
+from utils.dag import DONE, SKIPPED, StepFailed, StepResult, TaskGraph, summary
+
+
+@functools.lru_cache(maxsize=None)
+def template_environment() -> Environment:
+    """
+    The Jinja environment of the templates in the 'data' directory, shared for the
+    life of the process so that the templates are compiled once
+    """
+    template_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), "..", "data")
+    return Environment(
+        loader=FileSystemLoader(template_dir),
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
 
 
 class DBSetup:
 
     LOGGER = logging.getLogger(__name__)
     LOGGER.setLevel(logging.DEBUG)
-    _mode = CreateMode.if_not_exists
 
     def __init__(
         self,
@@ -27,14 +56,39 @@ class DBSetup:
         schema_name: str = "data",
         semantic_models_stage: str = "semantic_models",
         semantic_model_file: str = "support_tickets_semantic_model.yaml",
+        parallelism: Optional[int] = None,
+        state: Optional[SetupState] = None,
+        pool=None,
     ):
         self.session = session
-        self.root = Root(session)
+        # the SessionPool the concurrent statements of the setup run on, if any
+        self.pool = pool
+        self.state = state if state is not None else SetupState()
+        self.parallelism = (
+            parallelism
+            if parallelism is not None
+            else int(os.getenv("SETUP_PARALLELISM", 4))
+        )
         self._db_name = db_name
         self._schema_name = schema_name
         self._semantic_models_stage = semantic_models_stage
         self._semantic_model_file = semantic_model_file
 
+    @functools.cached_property
+    def root(self) -> "Root":
+        """
+        The Snowflake Python API root, created on the first setup
+        """
+        from snowflake.core import Root
+
+        return Root(self.session)
+
+    @property
+    def _mode(self):
+        from snowflake.core import CreateMode
+
+        return CreateMode.if_not_exists
+
     @property
     def db_name(self):
         return self._db_name
@@ -67,6 +121,19 @@ class DBSetup:
     def semantic_model_file(self, semantic_model_file: str):
         self._semantic_model_file = semantic_model_file
 
+    def semantic_model_path(self, db_name: str, schema_name: str) -> str:
+        """
+        The staged semantic model as referred by Cortex Analyst
+        """
+        return f"@{db_name}.{schema_name}.{self.semantic_models_stage}/{self.semantic_model_file}"
+
+    def render_semantic_model(self, db_name: str, schema_name: str) -> str:
+        """
+        Render the semantic model template for the database and schema
+        """
+        template = template_environment().get_template(f"{self.semantic_model_file}.j2")
+        return template.render({"db_name": db_name, "schema_name": schema_name})
+
     def create_db(self, db_name: str) -> None:
         """
         Create the database that will be used in the demo
@@ -74,6 +141,8 @@ class DBSetup:
             db_name - the name of the database to create
         """
 
+        from snowflake.core.database import Database
+
         self.LOGGER.debug(f"Creating database {db_name}")
         database = Database(db_name, comment="created by slack bot setup")
         try:
@@ -82,10 +151,12 @@ class DBSetup:
             self.LOGGER.error(e)
             raise f"Error creating database {db_name},{e}"
 
-    def create_schema(self, schema_name: str, db_name: Database) -> None:
+    def create_schema(self, schema_name: str, db_name: str) -> None:
         """
         Create the Schema for the demo
         """
+        from snowflake.core.schema import Schema
+
         self.LOGGER.debug(f"Creating Schema {schema_name}")
         schema = Schema(schema_name, comment="created by slack bot setup")
         try:
@@ -98,6 +169,18 @@ class DBSetup:
             self.LOGGER.error(e)
             raise Exception(f"Error creating schema {schema_name},{e}")
 
+    def file_format_sql(self, db_name: str, schema_name: str) -> str:
+        """
+        The DDL of the CSV File Format used for data loading
+        """
+        ff_name = ".".join([db_name, schema_name, "csvformat"])
+        return f"""CREATE OR REPLACE FILE FORMAT {ff_name}
+SKIP_HEADER = 1
+FIELD_OPTIONALLY_ENCLOSED_BY = '"'
+TYPE = 'CSV'
+COMMENT = 'created by slack bot setup';
+"""
+
     def create_file_formats(
         self,
         db_name: str,
@@ -109,19 +192,108 @@ class DBSetup:
         try:
             ff_name = ".".join([db_name, schema_name, "csvformat"])
             self.LOGGER.debug(f"Creating file format {ff_name}")
-            df = self.session.sql(
-                f"""CREATE OR REPLACE FILE FORMAT {ff_name}
-SKIP_HEADER = 1
-FIELD_OPTIONALLY_ENCLOSED_BY = '"'
-TYPE = 'CSV'
-COMMENT = 'created by slack bot setup';
-"""
-            )
+            df = self.session.sql(self.file_format_sql(db_name, schema_name))
             df.collect()
         except Exception as e:
             self.LOGGER.error(e)
             raise Exception(f"Error creating file format {ff_name},{e}")
 
+    def stages(self, stage_name: str = "support_tickets_data") -> List["Stage"]:
+        """
+        The stages used for the demo, the external data stage, the internal stage
+        for the data files older than 7 days and the semantic models stage
+        """
+        from snowflake.core.stage import Stage, StageDirectoryTable, StageEncryption
+
+        return [
+            Stage(
+                name=stage_name,
+                url="s3://sfquickstarts/finetuning_llm_using_snowflake_cortex_ai/",
+                comment="created by slack bot setup",
+                directory_table=StageDirectoryTable(enable=True),
+            ),
+            Stage(
+                name=f"older_than_7days_{stage_name}",
+                encryption=StageEncryption(type="SNOWFLAKE_SSE"),
+                directory_table=StageDirectoryTable(enable=True),
+                comment="created by slack bot setup",
+            ),
+            Stage(
+                name=self.semantic_models_stage,
+                encryption=StageEncryption(type="SNOWFLAKE_SSE"),
+                directory_table=StageDirectoryTable(enable=True),
+                comment="created by slack bot setup",
+            ),
+        ]
+
+    def create_stage_object(self, db_name: str, schema_name: str, stage: "Stage"):
+        """
+        Create a single stage
+        """
+        try:
+            self.LOGGER.debug(f"Creating stage {stage.name}")
+            (
+                self.root.databases[db_name]
+                .schemas[schema_name]
+                .stages.create(
+                    stage,
+                    mode=self._mode,
+                )
+            )
+        except Exception as e:
+            self.LOGGER.error(e)
+            raise Exception(f"Error creating stage {stage.name},{e}")
+
+    def staged_semantic_model_md5(
+        self, db_name: str, schema_name: str
+    ) -> Optional[str]:
+        """
+        The MD5 of the semantic model file on the stage, None when it is not staged
+        """
+        staged_files = (
+            self.root.databases[db_name]
+            .schemas[schema_name]
+            .stages[self.semantic_models_stage]
+            .list_files(pattern=f".*{re.escape(self.semantic_model_file)}")
+        )
+        for staged_file in staged_files:
+            if staged_file.name.endswith(f"/{self.semantic_model_file}"):
+                return staged_file.md5
+        return None
+
+    def upload_semantic_model(self, db_name: str, schema_name: str):
+        """
+        Render and upload the semantic model file to the semantic models stage,
+        the upload is skipped when the staged file has the same content
+        """
+        try:
+            rendered_yaml = self.render_semantic_model(db_name, schema_name).encode(
+                "utf-8"
+            )
+            md5 = hashlib.md5(rendered_yaml).hexdigest()
+            if md5 == self.staged_semantic_model_md5(db_name, schema_name):
+                self.LOGGER.debug(
+                    f"Semantic model {self.semantic_model_file} is up to date on stage '{self.semantic_models_stage}'"
+                )
+            else:
+                self.LOGGER.debug(
+                    f"Uploading semantic model {self.semantic_model_file} to stage '{self.semantic_models_stage}'"
+                )
+                self.session.file.put_stream(
+                    io.BytesIO(rendered_yaml),
+                    self.semantic_model_path(db_name, schema_name),
+                    auto_compress=False,
+                    overwrite=True,
+                )
+            # answers cached against the previous upload are no longer valid
+            answer_cache.set_semantic_model(
+                self.semantic_model_path(db_name, schema_name),
+                rendered_yaml.decode("utf-8"),
+            )
+        except Exception as e:
+            self.LOGGER.error(e)
+            raise Exception(f"Error uploading semantic model,{e}")
+
     def create_stage(
         self,
         db_name: str,
@@ -132,81 +304,52 @@ COMMENT = 'created by slack bot setup';
         Create the stage used for the demo
         """
         try:
-            stages = [
-                Stage(
-                    name=stage_name,
-                    url="s3://sfquickstarts/finetuning_llm_using_snowflake_cortex_ai/",
-                    comment="created by slack bot setup",
-                    directory_table=StageDirectoryTable(enable=True),
-                ),
-                Stage(
-                    name=f"older_than_7days_{stage_name}",
-                    encryption=StageEncryption(type="SNOWFLAKE_SSE"),
-                    directory_table=StageDirectoryTable(enable=True),
-                    comment="created by slack bot setup",
-                ),
-                Stage(
-                    name=self.semantic_models_stage,
-                    encryption=StageEncryption(type="SNOWFLAKE_SSE"),
-                    directory_table=StageDirectoryTable(enable=True),
-                    comment="created by slack bot setup",
-                ),
-            ]
-            for stage in stages:
-                (
-                    self.root.databases[db_name]
-                    .schemas[schema_name]
-                    .stages.create(
-                        stage,
-                        mode=self._mode,
-                    )
-                )
+            for stage in self.stages(stage_name):
+                self.create_stage_object(db_name, schema_name, stage)
             # upload the semantic model file
-            curr_path = os.path.abspath(os.path.dirname(__file__))
-            template_dir = os.path.join(
-                curr_path,
-                "..",
-                "data",
-            )
-            _model_file_template = os.path.join(
-                template_dir,
-                f"{self.semantic_model_file}.j2",
-            )
-            env = Environment(
-                loader=FileSystemLoader(
-                    template_dir
-                ),  # Look for templates in 'data' directory
-                trim_blocks=True,
-                lstrip_blocks=True,
-            )
-
-            _model_file = os.path.join(
-                template_dir,
-                self.semantic_model_file,
-            )
-
-            template = env.get_template("support_tickets_semantic_model.yaml.j2")
-            rendered_yaml = template.render(
-                {"db_name": db_name, "schema_name": schema_name}
-            )
-            with open(_model_file, "w") as file:
-                file.write(rendered_yaml)
-
-            self.LOGGER.debug(
-                f"Uploading semantic model {_model_file} to stage '{self.semantic_models_stage}'"
-            )
-            self.root.databases[db_name].schemas[schema_name].stages[
-                self.semantic_models_stage
-            ].put(
-                _model_file,
-                stage_location="/",
-                auto_compress=False,
-                overwrite=True,
-            )
+            self.upload_semantic_model(db_name, schema_name)
         except Exception as e:
             self.LOGGER.error(e)
             raise Exception(f"Error creating stages,{e}")
 
+    def support_tickets_table(self, table_name: str = "support_tickets") -> "Table":
+        """
+        The definition of the table that will be used in the demo
+        """
+        from snowflake.core.table import Table, TableColumn
+
+        table_columns = [
+            TableColumn(
+                name="ticket_id",
+                datatype="varchar(60)",
+            ),
+            TableColumn(
+                name="customer_name",
+                datatype="varchar(60)",
+            ),
+            TableColumn(
+                name="customer_email",
+                datatype="varchar(60)",
+            ),
+            TableColumn(
+                name="service_type",
+                datatype="varchar(60)",
+            ),
+            TableColumn(
+                name="request",
+                datatype="varchar",
+            ),
+            TableColumn(
+                name="contact_preference",
+                datatype="varchar(60)",
+            ),
+        ]
+        return Table(
+            name=table_name,
+            columns=table_columns,
+            comment="created by slack bot setup",
+        )
+
     def create_table(
         self,
         db_name: str,
@@ -217,37 +360,7 @@ COMMENT = 'created by slack bot setup';
         Create the table that will be used in the demo
         """
         try:
-            table_columns = [
-                TableColumn(
-                    name="ticket_id",
-                    datatype="varchar(60)",
-                ),
-                TableColumn(
-                    name="customer_name",
-                    datatype="varchar(60)",
-                ),
-                TableColumn(
-                    name="customer_email",
-                    datatype="varchar(60)",
-                ),
-                TableColumn(
-                    name="service_type",
-                    datatype="varchar(60)",
-                ),
-                TableColumn(
-                    name="request",
-                    datatype="varchar",
-                ),
-                TableColumn(
-                    name="contact_preference",
-                    datatype="varchar(60)",
-                ),
-            ]
-            table = Table(
-                name=table_name,
-                columns=table_columns,
-                comment="created by slack bot setup",
-            )
+            table = self.support_tickets_table(table_name)
             (
                 self.root.databases[db_name]
                 .schemas[schema_name]
@@ -264,17 +377,41 @@ COMMENT = 'created by slack bot setup';
         """
         check if a date is older than 7 days
         """
-        # Parse the date string into datetime object
-        date_obj = datetime.strptime(date_str, "%a, %d %b %Y %H:%M:%S %Z")
+        cutoff = datetime.now(timezone.utc) - timedelta(days=7)
+        return parse_last_modified(date_str) < cutoff.timestamp()
 
-        # Get current time in UTC
-        current_time = datetime.now(timezone.utc)
+    def support_tickets_pipes(
+        self,
+        db_name: str,
+        schema_name: str,
+        stage_name: str = "support_tickets_data",
+        table_name: str = "support_tickets",
+        ff_name: str = "csvformat",
+        pipe_name: str = "support_tickets_data",
+    ) -> List["Pipe"]:
+        """
+        The definitions of the pipes loading the data from the stages
+        """
+        from snowflake.core.pipe import Pipe
 
-        # Calculate the difference
-        time_difference = current_time - date_obj.replace(tzinfo=timezone.utc)
+        _table_fqn = f"{db_name}.{schema_name}.{table_name}"
+        _stage_fqn = f"{db_name}.{schema_name}.{stage_name}"
+        _target_stage_fqn = f"{db_name}.{schema_name}.older_than_7days_{stage_name}"
+        ff_fqn = f"{db_name}.{schema_name}.{ff_name}"
 
-        # Check if difference is more than 7 days
-        return time_difference > timedelta(days=7)
+        return [
+            Pipe(
+                name=pipe_name,
+                auto_ingest=True,
+                comment="created by slack bot setup",
+                copy_statement=f"COPY INTO {_table_fqn} FROM @{_stage_fqn}/ FILE_FORMAT = (FORMAT_NAME = '{ff_fqn}')",
+            ),
+            Pipe(
+                name=f"older_than_7days_{pipe_name}",
+                comment="created by slack bot setup to ingest 7 days older data files from external stage",
+                copy_statement=f"COPY INTO {_table_fqn} FROM @{_target_stage_fqn} FILE_FORMAT = (FORMAT_NAME = '{ff_fqn}')",
+            ),
+        ]
 
     def pipe_and_load(
         self,
@@ -291,24 +428,17 @@ COMMENT = 'created by slack bot setup';
         try:
             self.LOGGER.debug("Pipe and Load")
 
-            _table_fqn = f"{db_name}.{schema_name}.{table_name}"
             _stage_fqn = f"{db_name}.{schema_name}.{stage_name}"
             _target_stage_fqn = f"{db_name}.{schema_name}.older_than_7days_{stage_name}"
-            ff_fqn = f"{db_name}.{schema_name}.{ff_name}"
-
-            support_tickets_pipes = [
-                Pipe(
-                    name=pipe_name,
-                    auto_ingest=True,
-                    comment="created by slack bot setup",
-                    copy_statement=f"COPY INTO {_table_fqn} FROM @{_stage_fqn}/ FILE_FORMAT = (FORMAT_NAME = '{ff_fqn}')",
-                ),
-                Pipe(
-                    name=f"older_than_7days_{pipe_name}",
-                    comment="created by slack bot setup to ingest 7 days older data files from external stage",
-                    copy_statement=f"COPY INTO {_table_fqn} FROM @{_target_stage_fqn} FILE_FORMAT = (FORMAT_NAME = '{ff_fqn}')",
-                ),
-            ]
+
+            support_tickets_pipes = self.support_tickets_pipes(
+                db_name,
+                schema_name,
+                stage_name=stage_name,
+                table_name=table_name,
+                ff_name=ff_name,
+                pipe_name=pipe_name,
+            )
 
             pipes = self.root.databases[db_name].schemas[schema_name].pipes
 
@@ -325,25 +455,29 @@ COMMENT = 'created by slack bot setup';
                 .stages[stage_name]
                 .list_files(pattern=".*[.csv]")
             )
-            older_than_7days = [
-                os.path.basename(f.name)
-                for f in old_stage_files
-                if self.is_date_older_than_7days(f.last_modified)
-            ]
-
-            if len(older_than_7days) > 0:
-                _older_files = ",".join(f"'{x}'" for x in older_than_7days)
+            cutoff = datetime.now(timezone.utc) - timedelta(days=7)
+            batches = copy_files_batches(stale_files(old_stage_files, cutoff))
+
+            # the COPY FILES batches run concurrently, while the listing is streamed
+            copied, futures = 0, []
+            with ThreadPoolExecutor(
+                max_workers=self.parallelism, thread_name_prefix="copy_files"
+            ) as pool:
+                for batch in batches:
+                    copied += len(batch)
+                    futures.append(
+                        pool.submit(
+                            self.run_sql,
+                            copy_files_sql(_target_stage_fqn, _stage_fqn, batch),
+                        )
+                    )
+                for future in as_completed(futures):
+                    future.result()
+
+            if copied > 0:
                 self.LOGGER.debug(
-                    f"Files Older than 7 days to be loaded to internal stage {_older_files}"
+                    f"Copied {copied} files older than 7 days to internal stage in {len(futures)} batches"
                 )
-                self.session.sql(
-                    f"""
-                COPY FILES 
-                INTO @{_target_stage_fqn}
-                FROM @{_stage_fqn}
-                FILES=({_older_files})
-                    """
-                ).collect()
                 # trigger run
                 _pipe = (
                     self.root.databases[db_name]
@@ -356,38 +490,166 @@ COMMENT = 'created by slack bot setup';
             self.LOGGER.error(e)
             raise Exception(f"Error creating pipe and loading data,{e}")
 
-    def do(self):
+    def run_sql(self, sql: str):
+        """
+        Run the statement on a pooled session, or else on the setup session
+        """
+        if self.pool is None:
+            return self.session.sql(sql).collect()
+        with self.pool.session() as session:
+            return session.sql(sql).collect()
+
+    def desired_state(self, db_name: str, schema_name: str) -> Dict[str, str]:
+        """
+        The fingerprint of the desired definition of the objects each setup step creates
+        """
+        comment = "created by slack bot setup"
+        desired = {
+            "database": fingerprint(db_name, comment),
+            "schema": fingerprint(db_name, schema_name, comment),
+            "file_format": fingerprint(self.file_format_sql(db_name, schema_name)),
+        }
+        for stage in self.stages():
+            desired[f"stage {stage.name}"] = fingerprint(
+                db_name, schema_name, stage.to_dict()
+            )
+        desired["semantic_model"] = fingerprint(
+            self.semantic_model_path(db_name, schema_name),
+            self.render_semantic_model(db_name, schema_name),
+        )
+        desired["table"] = fingerprint(
+            db_name, schema_name, self.support_tickets_table().to_dict()
+        )
+        desired["pipes"] = fingerprint(
+            db_name,
+            schema_name,
+            [pipe.to_dict() for pipe in self.support_tickets_pipes(db_name, schema_name)],
+        )
+        return desired
+
+    def applied_state(self, db_name: str, schema_name: str) -> Dict[str, str]:
+        """
+        The fingerprints of the steps already applied to the database/schema, empty
+        when the schema was dropped since
+        """
+        from snowflake.core.exceptions import NotFoundError
+
+        applied = self.state.applied(db_name, schema_name)
+        if applied:
+            try:
+                self.root.databases[db_name].schemas[schema_name].fetch()
+            except NotFoundError:
+                self.LOGGER.debug(f"Schema {db_name}.{schema_name} no longer exists")
+                self.state.forget(db_name, schema_name)
+                applied = {}
+        return applied
+
+    def do(
+        self,
+        force: bool = False,
+        db_name: Optional[str] = None,
+        schema_name: Optional[str] = None,
+    ) -> Dict[str, StepResult]:
         """
         Creates or alters Snowflake Database objects using Snowflake Python API.
+        The steps whose desired definition is unchanged since the last setup of the
+        same database/schema are skipped, unless forced. The steps that only depend
+        on the schema run concurrently, the pipes wait for the objects they load
+        from and into.
+        :param db_name: The database to set up, by default the one of the DBSetup.
+        :param schema_name: The schema to set up, by default the one of the DBSetup.
+        :return: the result and timing of each setup step
         """
 
         try:
-            self.LOGGER.debug(
-                f"Using Database : {self.db_name} and Schema : {self.schema_name}"
-            )
+            db_name = db_name or self.db_name
+            schema_name = schema_name or self.schema_name
+            self.LOGGER.debug(f"Using Database : {db_name} and Schema : {schema_name}")
+
+            desired = self.desired_state(db_name, schema_name)
+            applied = {} if force else self.applied_state(db_name, schema_name)
+
+            def unchanged(step: str) -> bool:
+                return applied.get(step) == desired[step]
 
-            self.create_db(self.db_name)
-            self.create_schema(
-                schema_name=self.schema_name,
-                db_name=self.db_name,
+            graph = TaskGraph(max_workers=self.parallelism)
+            graph.add(
+                "database", self.create_db, db_name, skip=unchanged("database")
             )
-            self.create_file_formats(
-                db_name=self.db_name,
-                schema_name=self.schema_name,
+            graph.add(
+                "schema",
+                self.create_schema,
+                schema_name=schema_name,
+                db_name=db_name,
+                depends_on=["database"],
+                skip=unchanged("schema"),
             )
-            self.create_stage(
-                db_name=self.db_name,
-                schema_name=self.schema_name,
+            graph.add(
+                "file_format",
+                self.create_file_formats,
+                db_name=db_name,
+                schema_name=schema_name,
+                depends_on=["schema"],
+                skip=unchanged("file_format"),
             )
-            self.create_table(
-                db_name=self.db_name,
-                schema_name=self.schema_name,
+            stage_steps = {}
+            for stage in self.stages():
+                stage_steps[stage.name] = f"stage {stage.name}"
+                graph.add(
+                    stage_steps[stage.name],
+                    self.create_stage_object,
+                    db_name,
+                    schema_name,
+                    stage,
+                    depends_on=["schema"],
+                    skip=unchanged(stage_steps[stage.name]),
+                )
+            graph.add(
+                "semantic_model",
+                self.upload_semantic_model,
+                db_name,
+                schema_name,
+                depends_on=[stage_steps.pop(self.semantic_models_stage)],
+                skip=unchanged("semantic_model"),
+            )
+            graph.add(
+                "table",
+                self.create_table,
+                db_name=db_name,
+                schema_name=schema_name,
+                depends_on=["schema"],
+                skip=unchanged("table"),
             )
-            self.pipe_and_load(
-                db_name=self.db_name,
-                schema_name=self.schema_name,
+            # the pipes load from the data stages into the table
+            graph.add(
+                "pipes",
+                self.pipe_and_load,
+                db_name=db_name,
+                schema_name=schema_name,
+                depends_on=["file_format", "table", *stage_steps.values()],
+                skip=unchanged("pipes"),
             )
+            # empty when the graph fails before running any step
+            results = {}
+            try:
+                results = graph.run()
+            except StepFailed as e:
+                results = e.results
+                raise
+            finally:
+                self.LOGGER.info(f"Setup steps: {summary(results)}")
+                # only the steps that were applied are recorded, the rest is redone
+                self.state.record(
+                    db_name,
+                    schema_name,
+                    {
+                        step: desired[step]
+                        for step, result in results.items()
+                        if result.status in (DONE, SKIPPED)
+                    },
+                )
             self.LOGGER.info("Setup successful")
+            return results
         except Exception as e:
             self.LOGGER.error(
                 "Error setting up demo",
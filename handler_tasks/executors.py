@@ -0,0 +1,124 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from utils.tracing import traced
+
+# Stages of the question and setup pipelines with their default concurrency,
+# each can be overridden with the <STAGE>_CONCURRENCY env e.g. QUERY_CONCURRENCY
+DEFAULT_CONCURRENCY = {
+    "analyst": 8,
+    "query": 4,
+    "render": 2,
+    "upload": 4,
+    "setup": 1,
+}
+
+
+class StageExecutors:
+    """
+    Bounded executors per pipeline stage, so that a slow warehouse query or chart
+    render only queues work of the same stage instead of starving every other
+    command running on the event loop.
+    """
+
+    LOGGER = logging.getLogger(__name__)
+    LOGGER.setLevel(os.getenv("APP_LOG_LEVEL", logging.WARNING))
+
+    def __init__(self, concurrency: Optional[Dict[str, int]] = None):
+        concurrency = concurrency or {}
+        self._limits = {
+            stage: int(
+                concurrency.get(
+                    stage, os.getenv(f"{stage.upper()}_CONCURRENCY", default)
+                )
+            )
+            for stage, default in DEFAULT_CONCURRENCY.items()
+        }
+        self.LOGGER.debug(f"Stage concurrency:{self._limits}")
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def limit(self, stage: str) -> int:
+        return self._limits[stage]
+
+    def _pool(self, stage: str) -> ThreadPoolExecutor:
+        pool = self._pools.get(stage)
+        if pool is None:
+            pool = self._pools.setdefault(
+                stage,
+                ThreadPoolExecutor(
+                    max_workers=self._limits[stage],
+                    thread_name_prefix=f"{stage}-stage",
+                ),
+            )
+        return pool
+
+    async def run(self, stage: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run the blocking callable on the executor of the stage
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._pool(stage), traced(fn, *args, **kwargs)
+        )
+
+    def submit(self, stage: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Start the blocking callable on the executor of the stage, from blocking code
+        """
+        return self._pool(stage).submit(traced(fn, *args, **kwargs))
+
+    async def iterate(
+        self, stage: str, fn: Callable[..., Iterator], *args, **kwargs
+    ) -> AsyncIterator:
+        """
+        Consume the blocking iterator returned by the callable on the executor of the
+        stage, yielding its items on the event loop as they are produced
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for item in fn(*args, **kwargs):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+                loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+
+        producer = loop.run_in_executor(self._pool(stage), traced(produce))
+        try:
+            while True:
+                item, error = await queue.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    break
+                yield item
+        finally:
+            stop.set()
+            await producer
+
+    def slot(self, stage: str) -> asyncio.Semaphore:
+        """
+        Semaphore bounding the async (non blocking) work of the stage e.g. uploads
+        """
+        semaphore = self._semaphores.get(stage)
+        if semaphore is None:
+            semaphore = self._semaphores.setdefault(
+                stage, asyncio.Semaphore(self._limits[stage])
+            )
+        return semaphore
+
+    def shutdown(self, wait: bool = True):
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+        self._pools.clear()
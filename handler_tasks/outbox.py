@@ -0,0 +1,279 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from slack_sdk.errors import SlackApiError
+
+from utils.token_bucket import TokenBucket
+
+# Slack Web API rate limit tiers, in calls per minute per workspace
+# see https://api.slack.com/apis/rate-limits
+TIER_RATES = {1: 1, 2: 20, 3: 50, 4: 100}
+METHOD_TIERS = {
+    "chat_update": 3,
+    "chat_postEphemeral": 4,
+    # files_upload_v2 calls files.getUploadURLExternal and files.completeUploadExternal
+    "files_upload_v2": 4,
+}
+# chat.postMessage has its own limit of about one message per second per channel,
+# with short bursts allowed
+POST_MESSAGE_RATE = 1.0
+POST_MESSAGE_BURST = 5
+# Slack rejects messages with more blocks than this
+MAX_BLOCKS = 50
+
+
+class _Message:
+    __slots__ = ("method", "client", "kwargs", "futures", "enqueued_at", "coalesce")
+
+    def __init__(self, method, client, kwargs, coalesce, enqueued_at):
+        self.method = method
+        self.client = client
+        self.kwargs = kwargs
+        self.futures: List[Future] = [Future()]
+        self.enqueued_at = enqueued_at
+        self.coalesce = coalesce
+
+
+class SlackOutbox:
+    """
+    Outbound queue of the Slack Web API calls. The calls to each channel are
+    delivered in order, paced by a token bucket per Slack rate limit tier and,
+    for chat.postMessage, per channel. Rate limited calls are retried after the
+    Retry-After delay, transient failures with exponential backoff.
+    While a channel is behind, its queued messages are coalesced: consecutive
+    plain messages are merged into one chat.postMessage and consecutive updates
+    of the same message are collapsed into the last one.
+    """
+
+    LOGGER = logging.getLogger(__name__)
+    LOGGER.setLevel(os.getenv("APP_LOG_LEVEL", logging.WARNING))
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if workers is None:
+            workers = int(os.getenv("SLACK_OUTBOX_WORKERS", 8))
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else int(os.getenv("SLACK_OUTBOX_MAX_RETRIES", 3))
+        )
+        self.backoff = (
+            backoff
+            if backoff is not None
+            else float(os.getenv("SLACK_OUTBOX_BACKOFF_SECS", 0.5))
+        )
+        self._clock = clock
+        self._sleep = sleep
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="slack_outbox"
+        )
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[_Message]] = {}
+        self._buckets: Dict[Any, TokenBucket] = {}
+        self._paused_until: Dict[str, float] = {}
+        self._stats = {
+            "sent": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "failures": 0,
+            "delay_secs_total": 0.0,
+            "delay_secs_max": 0.0,
+        }
+
+    def send(
+        self, client, method: str, channel: str, coalesce: bool = False, **kwargs
+    ) -> Future:
+        """
+        Queue the call of the Web API method to the channel
+        :return: the future of the Slack response
+        """
+        message = _Message(
+            method, client, {"channel": channel, **kwargs}, coalesce, self._clock()
+        )
+        with self._lock:
+            queue = self._queues.get(channel)
+            scheduled = queue is not None
+            if not scheduled:
+                queue = self._queues[channel] = deque()
+            queue.append(message)
+        if not scheduled:
+            self._pool.submit(self._drain, channel)
+        return message.futures[0]
+
+    def post(
+        self, client, channel: str, blocks=None, text: str = "", coalesce: bool = True
+    ) -> Future:
+        """
+        Queue a plain chat.postMessage, that may be merged with its neighbours
+        unless `coalesce` is False e.g. for a message updated in place later
+        """
+        return self.send(
+            client,
+            "chat_postMessage",
+            channel,
+            coalesce=coalesce,
+            blocks=blocks,
+            text=text,
+        )
+
+    def update(self, client, channel: str, ts: str, blocks=None, text: str = "") -> Future:
+        """
+        Queue a chat.update of the message ts, superseding its queued updates
+        """
+        return self.send(
+            client, "chat_update", channel, coalesce=True, ts=ts, blocks=blocks, text=text
+        )
+
+    def _drain(self, channel: str):
+        while True:
+            with self._lock:
+                queue = self._queues[channel]
+                if not queue:
+                    del self._queues[channel]
+                    return
+                message = queue.popleft()
+                while queue and self._merge(message, queue[0]):
+                    queue.popleft()
+            self._deliver(message)
+
+    def _merge(self, message: _Message, following: _Message) -> bool:
+        if not (message.coalesce and following.coalesce):
+            return False
+        if message.method != following.method or message.client is not following.client:
+            return False
+        match message.method:
+            case "chat_postMessage":
+                blocks = (message.kwargs["blocks"] or []) + (
+                    following.kwargs["blocks"] or []
+                )
+                if (
+                    not message.kwargs["blocks"]
+                    or not following.kwargs["blocks"]
+                    or len(blocks) > MAX_BLOCKS
+                ):
+                    return False
+                message.kwargs["blocks"] = blocks
+                message.kwargs["text"] = "\n".join(
+                    t for t in (message.kwargs["text"], following.kwargs["text"]) if t
+                )
+            case "chat_update":
+                if message.kwargs["ts"] != following.kwargs["ts"]:
+                    return False
+                message.kwargs = following.kwargs
+            case _:
+                return False
+        message.futures += following.futures
+        # the caller holds the lock
+        self._stats["coalesced"] += 1
+        return True
+
+    def _bucket(self, key, rate: float, burst: float) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, burst, self._clock)
+            return bucket
+
+    def _wait_turn(self, method: str, channel: str):
+        if method == "chat_postMessage":
+            bucket = self._bucket(
+                (method, channel), POST_MESSAGE_RATE, POST_MESSAGE_BURST
+            )
+        else:
+            rate = TIER_RATES[METHOD_TIERS.get(method, 3)] / 60
+            bucket = self._bucket(method, rate, max(1.0, rate * 10))
+        wait = bucket.reserve()
+        paused_until = self._paused_until.get(method)
+        if paused_until is not None:
+            wait = max(wait, paused_until - self._clock())
+        if wait > 0:
+            self._sleep(wait)
+
+    def _deliver(self, message: _Message):
+        channel = message.kwargs["channel"]
+        attempt = 0
+        while True:
+            self._wait_turn(message.method, channel)
+            if attempt == 0:
+                delay = self._clock() - message.enqueued_at
+                with self._lock:
+                    self._stats["delay_secs_total"] += delay
+                    self._stats["delay_secs_max"] = max(
+                        self._stats["delay_secs_max"], delay
+                    )
+            try:
+                response = getattr(message.client, message.method)(**message.kwargs)
+                self._record("sent")
+                for future in message.futures:
+                    future.set_result(response)
+                return
+            except Exception as e:
+                retry_after = self._retry_after(e, attempt)
+                if retry_after is None or attempt >= self.max_retries:
+                    self.LOGGER.error(
+                        f"Error calling {message.method} on channel {channel},{e}"
+                    )
+                    self._record("failures")
+                    for future in message.futures:
+                        future.set_exception(e)
+                    return
+                self.LOGGER.debug(
+                    f"Retrying {message.method} on channel {channel} in {retry_after}s,{e}"
+                )
+                self._record("retries")
+                if isinstance(e, SlackApiError) and e.response.status_code == 429:
+                    # the limit applies to every channel, hold back the other calls too
+                    self._paused_until[message.method] = self._clock() + retry_after
+                else:
+                    self._sleep(retry_after)
+                attempt += 1
+
+    def _retry_after(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        :return: the seconds to wait before retrying the failed call, None when it should not be retried
+        """
+        if isinstance(error, SlackApiError):
+            status = error.response.status_code
+            if status == 429:
+                headers = {k.lower(): v for k, v in (error.response.headers or {}).items()}
+                retry_after = headers.get("retry-after", 1)
+                if isinstance(retry_after, list):
+                    retry_after = retry_after[0]
+                return float(retry_after)
+            if status < 500:
+                return None
+        elif not isinstance(error, (ConnectionError, TimeoutError, OSError)):
+            return None
+        return self.backoff * 2**attempt
+
+    def _record(self, counter: str):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Queue depth and delivery metrics, the delay is from queueing to sending
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queued"] = sum(len(queue) for queue in self._queues.values())
+            stats["channels"] = len(self._queues)
+        delivered = stats["sent"] + stats["failures"]
+        stats["delay_secs_mean"] = (
+            stats["delay_secs_total"] / delivered if delivered else 0.0
+        )
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,192 @@
+import os
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+from utils.cache import LRUCache
+from utils.metrics import metrics
+from utils.single_flight import SingleFlight
+from utils.tracing import tracer
+
+# single quoted SQL string literals, with '' escapes
+_STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_LINE_COMMENT = re.compile(r"--[^\n]*")
+
+
+def canonicalize_sql(query: str) -> str:
+    """
+    Canonical form of the generated SQL used as the cache key, line comments,
+    whitespace and trailing semicolons outside of string literals are not significant
+    """
+    parts = _STRING_LITERAL.split(query)
+    for i in range(0, len(parts), 2):
+        parts[i] = " ".join(_LINE_COMMENT.sub(" ", parts[i]).split())
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def dataframe_size(df) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def fetch_preview(session, query: str, max_rows: int):
+    """
+    Run the query and fetch only its first `max_rows` rows batch by batch, the total
+    row count comes from the query result metadata so the rest of the result is
+    never downloaded.
+    :return: the preview DataFrame and the total number of rows of the result
+    """
+    cursor = session.connection.cursor()
+    try:
+        cursor.execute(query)
+        tracer.annotate(query_id=cursor.sfqid)
+        total_rows = cursor.rowcount
+        batches = []
+        fetched = 0
+        for batch in cursor.fetch_pandas_batches():
+            batches.append(batch.head(max_rows - fetched))
+            fetched += len(batches[-1])
+            if fetched >= max_rows:
+                break
+        if batches:
+            df = pd.concat(batches, ignore_index=True)
+        else:
+            df = pd.DataFrame(columns=[column.name for column in cursor.description])
+        return df, total_rows if total_rows is not None else len(df)
+    finally:
+        cursor.close()
+
+
+class ResultCache:
+    """
+    Cache of the query results for the SQL generated by Cortex Analyst, keyed by
+    the canonical SQL and the database/schema it runs against. Entries are bounded
+    by a memory budget and a staleness window, optionally the cache also misses as
+    soon as the probed table metadata (last altered time and row count) changes.
+    """
+
+    LOGGER = logging.getLogger(__name__)
+    LOGGER.setLevel(os.getenv("APP_LOG_LEVEL", logging.WARNING))
+
+    def __init__(
+        self,
+        session,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        probe_interval: Optional[float] = None,
+        table_name: str = "support_tickets",
+        pool=None,
+    ):
+        """
+        :param session: The Snowpark session used to run the queries.
+        :param pool: The SessionPool the queries run on instead, when given.
+        :param max_bytes: Memory budget of the cached results, env RESULT_CACHE_MAX_BYTES.
+        :param ttl: Staleness window in seconds, env RESULT_CACHE_TTL_SECS.
+        :param probe_interval: Seconds between table metadata probes, 0 disables probing, env RESULT_CACHE_PROBE_SECS.
+        :param table_name: The table whose changes invalidate the cached results.
+        """
+        if max_bytes is None:
+            max_bytes = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+        if ttl is None:
+            ttl = float(os.getenv("RESULT_CACHE_TTL_SECS", 300))
+        if probe_interval is None:
+            probe_interval = float(os.getenv("RESULT_CACHE_PROBE_SECS", 30))
+        self.session = session
+        self.pool = pool
+        self.table_name = table_name
+        self.probe_interval = probe_interval
+        self._in_flight = SingleFlight()
+        self._cache = LRUCache(
+            max_entries=None if max_bytes > 0 else 0,
+            ttl=ttl,
+            max_bytes=max_bytes,
+            sizeof=lambda result: dataframe_size(result[0]),
+        )
+        self._probes: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self._probes_lock = threading.Lock()
+
+    def table_version(self, db_name: str, schema_name: str) -> Any:
+        """
+        The last altered time and row count of the table, probed at most once per
+        probe interval. None when probing is disabled or failed.
+        """
+        if self.probe_interval <= 0:
+            return None
+        now = time.monotonic()
+        probe = self._probes.get((db_name, schema_name))
+        if probe is not None and now - probe[0] < self.probe_interval:
+            return probe[1]
+        try:
+            with self._session() as session:
+                rows = session.sql(
+                    f"""SELECT LAST_ALTERED, ROW_COUNT
+FROM {db_name}.INFORMATION_SCHEMA.TABLES
+WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?""",
+                    params=[schema_name.upper(), self.table_name.upper()],
+                ).collect()
+            version = tuple(rows[0]) if rows else None
+        except Exception as e:
+            self.LOGGER.warning(f"Unable to probe table {self.table_name},{e}")
+            version = None
+        with self._probes_lock:
+            self._probes[(db_name, schema_name)] = (now, version)
+        return version
+
+    @contextmanager
+    def _session(self):
+        if self.pool is None:
+            yield self.session
+        else:
+            with self.pool.session() as session:
+                yield session
+
+    def fetch(self, query: str, db_name: str, schema_name: str, max_rows: int):
+        """
+        Return the preview (first `max_rows` rows) of the query result and the total
+        row count, from the cache when the same query already ran against the
+        unchanged table within the staleness window
+        """
+        with tracer.span("query", db=db_name, schema=schema_name) as span:
+            key = (
+                db_name.upper(),
+                schema_name.upper(),
+                canonicalize_sql(query),
+                max_rows,
+                self.table_version(db_name, schema_name),
+            )
+            result = self._cache.get(key)
+            if result is not None:
+                self.LOGGER.debug("Query result from cache")
+                span.set(cached=True)
+                return result
+            # the same query asked again while running waits for the first run
+            result, shared = self._in_flight.do(key, self._fetch, key, query, max_rows)
+            if shared:
+                self.LOGGER.debug("Query result shared with the same query in flight")
+            span.set(shared=shared, total_rows=result[1])
+            return result
+
+    def _fetch(self, key, query: str, max_rows: int):
+        with metrics.stage("query"):
+            with self._session() as session:
+                result = fetch_preview(session, query, max_rows)
+        self._cache.put(key, result)
+        return result
+
+    def share(self, store):
+        """
+        Share the cached query results with the other processes through the SharedStore
+        """
+        self._cache.share(store, "results")
+
+    def clear(self):
+        self._cache.clear()
+        with self._probes_lock:
+            self._probes.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
@@ -0,0 +1,81 @@
+import os
+import uuid
+import logging
+from typing import NamedTuple, Optional
+
+import pyarrow as pa
+
+from utils.cache import LRUCache
+
+
+class PagedResult(NamedTuple):
+    # the rows kept, at most the fetched preview of the result
+    table: pa.Table
+    # the row count of the whole result
+    total_rows: int
+
+
+class ResultPages:
+    """
+    The query results browsed page by page from the answer table, kept as Arrow
+    tables under a result id so that the next and previous pages are sliced from
+    memory rather than queried again. The results expire after a time to live and
+    are bounded by a global memory budget, the least recently browsed going first.
+    """
+
+    LOGGER = logging.getLogger(__name__)
+    LOGGER.setLevel(os.getenv("APP_LOG_LEVEL", logging.WARNING))
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        :param max_bytes: Memory budget of the kept results, env RESULT_PAGES_MAX_BYTES.
+        :param ttl: Seconds a result can be browsed for, env RESULT_PAGES_TTL_SECS.
+        """
+        if max_bytes is None:
+            max_bytes = int(os.getenv("RESULT_PAGES_MAX_BYTES", 64 * 1024 * 1024))
+        if ttl is None:
+            ttl = float(os.getenv("RESULT_PAGES_TTL_SECS", 3600))
+        self._results = LRUCache(
+            max_entries=None if max_bytes > 0 else 0,
+            ttl=ttl,
+            max_bytes=max_bytes,
+            sizeof=lambda result: result.table.nbytes,
+        )
+
+    def keep(self, df, total_rows: int) -> Optional[str]:
+        """
+        Keep the rows of the result for browsing
+        :return: the result id, None when the result is over the memory budget
+        """
+        table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+        result_id = uuid.uuid4().hex
+        if not self._results.put(result_id, PagedResult(table, total_rows)):
+            self.LOGGER.debug(f"Result of {table.nbytes} bytes not kept for browsing")
+            return None
+        return result_id
+
+    def page(self, result_id: str, offset: int, rows: int):
+        """
+        The rows of the result from `offset`, sliced without copying the table
+        :return: the page DataFrame, the number of rows kept and the total number
+        of rows of the result, None when the result expired or was evicted
+        """
+        result = self._results.get(result_id)
+        if result is None:
+            return None
+        offset = max(0, min(offset, result.table.num_rows - 1))
+        df = result.table.slice(offset, rows).to_pandas()
+        return df, result.table.num_rows, result.total_rows
+
+    def share(self, store):
+        """
+        Share the kept results with the other processes through the SharedStore, a
+        page can be asked from any of them
+        """
+        self._results.share(store, "result_pages")
+
+    def stats(self):
+        return self._results.stats()
+
+
+result_pages = ResultPages()
@@ -0,0 +1,162 @@
+import os
+import heapq
+import logging
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from utils.tracing import traced
+
+# Lower runs first, the interactive questions go ahead of the setups
+PRIORITIES = {
+    "question": 0,
+    # browsing the pages of an answer is interactive too, and sliced from memory
+    "page": 0,
+    "setup": 1,
+}
+
+
+class Admission(NamedTuple):
+    accepted: bool
+    # the position of the work in the queue, 0 when it started right away
+    position: int = 0
+    reason: Optional[str] = None
+
+
+class CommandScheduler:
+    """
+    Admission control and priority queue of the work started by the bot commands
+    and actions. A bounded number of workers run the work, by command priority and
+    then round robin across users, so that one user asking many questions only
+    delays their own. Work is rejected when the queue, the user or the channel
+    already has too much pending.
+    """
+
+    LOGGER = logging.getLogger(__name__)
+    LOGGER.setLevel(os.getenv("APP_LOG_LEVEL", logging.WARNING))
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        max_per_user: Optional[int] = None,
+        max_per_channel: Optional[int] = None,
+    ):
+        """
+        :param workers: The number of commands run at once, env SCHEDULER_WORKERS.
+        :param max_queued: The number of commands waiting to run, env SCHEDULER_MAX_QUEUED.
+        :param max_per_user: The commands pending (running or waiting) per user, env SCHEDULER_MAX_PER_USER.
+        :param max_per_channel: The commands pending per channel, env SCHEDULER_MAX_PER_CHANNEL.
+        """
+        self.workers = (
+            workers if workers is not None else int(os.getenv("SCHEDULER_WORKERS", 4))
+        )
+        self.max_queued = (
+            max_queued
+            if max_queued is not None
+            else int(os.getenv("SCHEDULER_MAX_QUEUED", 50))
+        )
+        self.max_per_user = (
+            max_per_user
+            if max_per_user is not None
+            else int(os.getenv("SCHEDULER_MAX_PER_USER", 3))
+        )
+        self.max_per_channel = (
+            max_per_channel
+            if max_per_channel is not None
+            else int(os.getenv("SCHEDULER_MAX_PER_CHANNEL", 10))
+        )
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[Tuple[int, int, int], str, str, Callable[[], Any]]] = []
+        self._seq = 0
+        self._running = 0
+        self._per_user: Counter = Counter()
+        self._per_channel: Counter = Counter()
+        self._stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self._stopped = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"scheduler-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(
+        self, kind: str, user: str, channel: str, fn: Callable, *args, **kwargs
+    ) -> Admission:
+        """
+        Queue fn(*args, **kwargs) as the work of a `kind` command of the user in the channel
+        :return: whether it was accepted and its position in the queue
+        """
+        with self._cond:
+            reason = None
+            if self._stopped:
+                reason = "The bot is shutting down."
+            elif self._per_user[user] >= self.max_per_user:
+                reason = f"You already have {self._per_user[user]} requests pending, please wait for them to finish."
+            elif self._per_channel[channel] >= self.max_per_channel:
+                reason = "This channel has too many requests pending, please try again in a bit."
+            elif len(self._queue) >= self.max_queued:
+                reason = "I am busy answering others, please try again in a bit."
+            if reason is not None:
+                self._stats["rejected"] += 1
+                self.LOGGER.debug(f"Rejected {kind} of {user} in {channel}: {reason}")
+                return Admission(False, reason=reason)
+
+            # the nth pending command of a user goes after the (n-1)th of everyone else
+            key = (PRIORITIES[kind], self._per_user[user], self._seq)
+            self._seq += 1
+            self._per_user[user] += 1
+            self._per_channel[channel] += 1
+            # the work keeps the trace of the command that queued it
+            heapq.heappush(
+                self._queue, (key, user, channel, traced(fn, *args, **kwargs))
+            )
+            self._stats["accepted"] += 1
+            # the idle workers take the queued work in order
+            ahead = sum(1 for queued in self._queue if queued[0] < key)
+            idle = self.workers - self._running
+            position = 0 if ahead < idle else ahead - idle + 1
+            self._cond.notify()
+            return Admission(True, position=position)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                _, user, channel, job = heapq.heappop(self._queue)
+                self._running += 1
+            failed = False
+            try:
+                job()
+            except Exception as e:
+                failed = True
+                self.LOGGER.error(f"Error running command of {user} in {channel},{e}")
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._per_user[user] -= 1
+                    if self._per_user[user] <= 0:
+                        del self._per_user[user]
+                    self._per_channel[channel] -= 1
+                    if self._per_channel[channel] <= 0:
+                        del self._per_channel[channel]
+                    self._stats["failed" if failed else "completed"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {**self._stats, "queued": len(self._queue), "running": self._running}
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop accepting work, the queued work still runs
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,286 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.metrics import metrics
+
+
+def ping(session):
+    """
+    The health check of a pooled session, a round trip to Snowflake
+    """
+    session.sql("SELECT 1").collect()
+
+
+class _Pooled:
+    __slots__ = ("session", "created", "used")
+
+    def __init__(self, session, now: float):
+        self.session = session
+        self.created = now
+        self.used = now
+
+
+class SessionPool:
+    """
+    Bounded pool of Snowpark sessions so that concurrent queries run in parallel on
+    the warehouse rather than one after the other on a shared session. Sessions
+    are opened on demand up to `size`, checked out and in around each query,
+    pinged when idle so that they stay alive and replaced after their max lifetime
+    or when a query left them unhealthy.
+    """
+
+    LOGGER = logging.getLogger(__name__)
+    LOGGER.setLevel(os.getenv("APP_LOG_LEVEL", logging.WARNING))
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        size: Optional[int] = None,
+        timeout: Optional[float] = None,
+        keepalive: Optional[float] = None,
+        max_lifetime: Optional[float] = None,
+        health_check: Callable[[Any], Any] = ping,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param factory: Opens a new Snowpark session.
+        :param size: The max number of sessions open at once, env SESSION_POOL_SIZE.
+        :param timeout: Seconds to wait for a free session, env SESSION_POOL_TIMEOUT_SECS.
+        :param keepalive: Seconds idle before a session is pinged, 0 never pings, env SESSION_POOL_KEEPALIVE_SECS.
+        :param max_lifetime: Seconds after which a session is closed and replaced, 0 keeps it, env SESSION_POOL_MAX_LIFETIME_SECS.
+        :param health_check: Raises when the session is not usable anymore.
+        """
+        self.factory = factory
+        self.size = size if size is not None else int(os.getenv("SESSION_POOL_SIZE", 4))
+        self.timeout = (
+            timeout
+            if timeout is not None
+            else float(os.getenv("SESSION_POOL_TIMEOUT_SECS", 30))
+        )
+        self.keepalive = (
+            keepalive
+            if keepalive is not None
+            else float(os.getenv("SESSION_POOL_KEEPALIVE_SECS", 600))
+        )
+        self.max_lifetime = (
+            max_lifetime
+            if max_lifetime is not None
+            else float(os.getenv("SESSION_POOL_MAX_LIFETIME_SECS", 3600))
+        )
+        self.health_check = health_check
+        self.clock = clock
+        self._cond = threading.Condition()
+        # the idle sessions, the most recently used last
+        self._idle: List[_Pooled] = []
+        self._in_use: List[_Pooled] = []
+        # the sessions being opened or pinged, counted against the size
+        self._pending = 0
+        self._waiting = 0
+        self._closed = False
+        self._stopped = threading.Event()
+        self._keepalive_thread: Optional[threading.Thread] = None
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "opened": 0,
+            "discarded": 0,
+            "wait_secs": 0.0,
+        }
+
+    def checkout(self, timeout: Optional[float] = None):
+        """
+        A session for the exclusive use of the caller, check it in once done
+        :raises TimeoutError: when no session is free within the timeout
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise Exception("Error checking out a session, the pool is closed")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    self._pending += 1
+                    break
+                if len(self._in_use) + self._pending < self.size:
+                    self._pending += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise TimeoutError(
+                        f"No Snowpark session free within {timeout}s, all {self.size} in use"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        if pooled is not None and (
+            self._expired(pooled) or not self._healthy(pooled, stale_only=True)
+        ):
+            self._discard(pooled)
+            pooled = None
+        if pooled is None:
+            pooled = self._open()
+
+        waited = time.perf_counter() - start
+        metrics.observe("session_pool_wait", waited)
+        with self._cond:
+            self._pending -= 1
+            pooled.used = self.clock()
+            self._in_use.append(pooled)
+            self._stats["checkouts"] += 1
+            self._stats["wait_secs"] += waited
+        return pooled.session
+
+    def checkin(self, session, healthy: Optional[bool] = True):
+        """
+        Return the session to the pool, None checks its health first and False
+        closes it, e.g. after a query failed on it
+        """
+        with self._cond:
+            pooled = next(
+                (pooled for pooled in self._in_use if pooled.session is session), None
+            )
+            if pooled is not None:
+                self._in_use.remove(pooled)
+        if pooled is None:
+            self.LOGGER.warning("Checked in a session not checked out of the pool")
+            return
+        if healthy is None:
+            healthy = self._healthy(pooled)
+        if not healthy or self._expired(pooled) or self._closed:
+            self._discard(pooled)
+            with self._cond:
+                self._cond.notify()
+            return
+        with self._cond:
+            pooled.used = self.clock()
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def session(self, timeout: Optional[float] = None):
+        """
+        Context manager of a checked out session e.g.
+        `with pool.session() as session: session.sql(query).collect()`
+        """
+        session = self.checkout(timeout)
+        healthy = True
+        try:
+            yield session
+        except BaseException:
+            # most failures are the query's own, only a broken session is closed
+            healthy = None
+            raise
+        finally:
+            self.checkin(session, healthy)
+
+    def keep_alive(self):
+        """
+        Ping the sessions idle for longer than the keepalive, and close the ones
+        past their max lifetime or failing the ping
+        """
+        now = self.clock()
+        with self._cond:
+            due = [
+                pooled
+                for pooled in self._idle
+                if (self.keepalive > 0 and now - pooled.used >= self.keepalive)
+                or self._expired(pooled)
+            ]
+            # out of the idle ones while pinged, not to be checked out meanwhile
+            self._idle = [pooled for pooled in self._idle if pooled not in due]
+            self._pending += len(due)
+        for pooled in due:
+            healthy = not self._expired(pooled) and self._healthy(pooled)
+            if not healthy:
+                self._discard(pooled)
+            with self._cond:
+                self._pending -= 1
+                if healthy:
+                    pooled.used = self.clock()
+                    self._idle.insert(0, pooled)
+                self._cond.notify()
+
+    def _keep_alive_loop(self):
+        while not self._stopped.wait(self.keepalive / 2):
+            try:
+                self.keep_alive()
+            except Exception as e:
+                self.LOGGER.warning(f"Error keeping the sessions alive,{e}")
+
+    def _open(self) -> _Pooled:
+        try:
+            session = self.factory()
+        except Exception as e:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify()
+            raise Exception(f"Error opening a Snowpark session,{e}")
+        with self._cond:
+            self._stats["opened"] += 1
+            if self.keepalive > 0 and self._keepalive_thread is None:
+                self._keepalive_thread = threading.Thread(
+                    target=self._keep_alive_loop, name="session-keepalive", daemon=True
+                )
+                self._keepalive_thread.start()
+        self.LOGGER.debug("Opened a pooled Snowpark session")
+        return _Pooled(session, self.clock())
+
+    def _expired(self, pooled: _Pooled) -> bool:
+        return self.max_lifetime > 0 and self.clock() - pooled.created >= self.max_lifetime
+
+    def _healthy(self, pooled: _Pooled, stale_only: bool = False) -> bool:
+        # on checkout only the sessions idle for longer than the keepalive are pinged
+        if stale_only and (
+            self.keepalive <= 0 or self.clock() - pooled.used < self.keepalive
+        ):
+            return True
+        try:
+            self.health_check(pooled.session)
+            return True
+        except Exception as e:
+            self.LOGGER.warning(f"Pooled session failed its health check,{e}")
+            return False
+
+    def _discard(self, pooled: _Pooled):
+        with self._cond:
+            self._stats["discarded"] += 1
+        try:
+            pooled.session.close()
+        except Exception as e:
+            self.LOGGER.debug(f"Error closing a pooled session,{e}")
+
+    def close(self):
+        """
+        Close the idle sessions, the ones in use are closed when checked in
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        self._stopped.set()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            in_use = len(self._in_use)
+            return {
+                "size": self.size,
+                "open": in_use + len(self._idle),
+                "in_use": in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "utilization": in_use / self.size if self.size else 0.0,
+                **self._stats,
+            }
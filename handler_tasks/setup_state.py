@@ -0,0 +1,89 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Dict
+
+
+def fingerprint(*definition: Any) -> str:
+    """
+    Fingerprint of the desired definition of a Snowflake object
+    """
+    return hashlib.sha256(
+        json.dumps(definition, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class SetupState:
+    """
+    Manifest of the setup steps applied to each database/schema, with the
+    fingerprint of the definition each step applied. Persisted as JSON next to
+    the .dbinfo file so that a repeat setup only applies what changed, or in the
+    SharedStore when the bot runs as several worker processes.
+    """
+
+    LOGGER = logging.getLogger(__name__)
+    LOGGER.setLevel(os.getenv("APP_LOG_LEVEL", logging.WARNING))
+
+    def __init__(self, path: str = ".setup_state"):
+        self.path = path
+        # the SharedStore of the worker processes, if any
+        self.store = None
+        self._lock = threading.Lock()
+
+    def share(self, store):
+        """
+        Keep the manifest in the SharedStore rather than the file, one entry per
+        database/schema so that the workers setting up different schemas do not
+        overwrite each other
+        """
+        self.store = store
+
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            self.LOGGER.warning(f"Ignoring unreadable setup state {self.path},{e}")
+            return {}
+
+    def _save(self, state: Dict[str, Dict[str, str]]):
+        # per process, two workers may save at once
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(state, file, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _key(db_name: str, schema_name: str) -> str:
+        return f"{db_name}.{schema_name}".upper()
+
+    def applied(self, db_name: str, schema_name: str) -> Dict[str, str]:
+        """
+        :return: the fingerprints of the steps applied to the database/schema
+        """
+        if self.store is not None:
+            return self.store.get("setup_state", self._key(db_name, schema_name), {})
+        with self._lock:
+            return self._load().get(self._key(db_name, schema_name), {})
+
+    def record(self, db_name: str, schema_name: str, fingerprints: Dict[str, str]):
+        if self.store is not None:
+            self.store.put("setup_state", self._key(db_name, schema_name), fingerprints)
+            return
+        with self._lock:
+            state = self._load()
+            state[self._key(db_name, schema_name)] = fingerprints
+            self._save(state)
+
+    def forget(self, db_name: str, schema_name: str):
+        if self.store is not None:
+            self.store.delete("setup_state", self._key(db_name, schema_name))
+            return
+        with self._lock:
+            state = self._load()
+            if state.pop(self._key(db_name, schema_name), None) is not None:
+                self._save(state)
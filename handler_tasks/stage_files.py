@@ -0,0 +1,81 @@
+import os
+import functools
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+import numpy as np
+
+# Snowflake accepts at most 1000 files in the FILES list of a COPY statement
+COPY_FILES_BATCH_SIZE = int(os.getenv("COPY_FILES_BATCH_SIZE", 1000))
+# keeps the statement well below the Snowflake statement size limit
+COPY_FILES_BATCH_CHARS = int(os.getenv("COPY_FILES_BATCH_CHARS", 256 * 1024))
+# the number of files whose age is checked at once while listing a stage
+LISTING_CHUNK_SIZE = 1000
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_last_modified(date_str: str) -> float:
+    """
+    Parse the last modified date of a staged file e.g. 'Tue, 15 Oct 2024 10:00:00 GMT'.
+    The files of a stage are usually uploaded in bulk and share their dates, hence the cache.
+    :return: the date as UTC epoch seconds
+    """
+    date_obj = datetime.strptime(date_str, "%a, %d %b %Y %H:%M:%S %Z")
+    return date_obj.replace(tzinfo=timezone.utc).timestamp()
+
+
+def stale_files(staged_files: Iterable, cutoff: datetime) -> Iterator[str]:
+    """
+    Streams the names of the staged files last modified before the cutoff, the
+    listing is consumed and filtered chunk by chunk.
+    :param staged_files: the files listed from the stage, with name and last_modified
+    """
+    cutoff_secs = cutoff.timestamp()
+    staged_files = iter(staged_files)
+    while chunk := list(islice(staged_files, LISTING_CHUNK_SIZE)):
+        modified = np.fromiter(
+            (parse_last_modified(f.last_modified) for f in chunk),
+            dtype=float,
+            count=len(chunk),
+        )
+        for i in np.flatnonzero(modified < cutoff_secs).tolist():
+            yield os.path.basename(chunk[i].name)
+
+
+def quote_file(name: str) -> str:
+    return "'" + name.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def copy_files_batches(
+    names: Iterable[str],
+    max_files: int = COPY_FILES_BATCH_SIZE,
+    max_chars: int = COPY_FILES_BATCH_CHARS,
+) -> Iterator[List[str]]:
+    """
+    Split the file names in batches of quoted names, whose FILES=(...) list has
+    at most `max_files` files and `max_chars` characters. A single name longer
+    than `max_chars` is batched on its own.
+    """
+    batch, chars = [], 0
+    for name in names:
+        quoted = quote_file(name)
+        if batch and (len(batch) >= max_files or chars + len(quoted) + 1 > max_chars):
+            yield batch
+            batch, chars = [], 0
+        batch.append(quoted)
+        chars += len(quoted) + 1
+    if batch:
+        yield batch
+
+
+def copy_files_sql(target_stage_fqn: str, stage_fqn: str, batch: List[str]) -> str:
+    """
+    The COPY FILES statement of a batch of quoted file names
+    """
+    return f"""
+                COPY FILES
+                INTO @{target_stage_fqn}
+                FROM @{stage_fqn}
+                FILES=({",".join(batch)})
+                    """
@@ -0,0 +1,184 @@
+"""
+Runs the bot as several worker processes, for the throughput to scale with the cores.
+
+Each worker is an app.py (or async_app.py) process with its own Socket Mode
+connection, Slack spreads the envelopes across the connections of the app. The
+workers share their caches and the database/schema set up through the SQLite
+store at SHARED_STORE_PATH. A worker that exits is restarted, after a backoff
+when it keeps exiting right away.
+
+    python supervisor.py --workers 4
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+import argparse
+import subprocess
+from typing import Dict, List, Optional
+
+from utils.shared_store import SharedStore
+
+# Slack allows at most 10 Socket Mode connections per app, one per worker
+MAX_WORKERS = 10
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format="%(name)s:%(levelname)s:%(message)s",
+    handlers=[logging.StreamHandler()],
+)
+
+
+class Supervisor:
+    """
+    Starts the worker processes, restarts the ones that exit and stops them all
+    on SIGTERM/SIGINT
+    """
+
+    LOGGER = logging.getLogger("supervisor")
+    LOGGER.setLevel(os.getenv("APP_LOG_LEVEL", logging.WARNING))
+
+    def __init__(
+        self,
+        command: List[str],
+        workers: int,
+        env: Optional[Dict[str, str]] = None,
+        min_uptime: float = 10.0,
+        max_backoff: float = 60.0,
+        stop_timeout: float = 10.0,
+    ):
+        """
+        :param command: The command of a worker e.g. `python app.py`.
+        :param workers: The number of worker processes.
+        :param env: The environment of the workers, WORKER_ID is set for each.
+        :param min_uptime: Seconds a worker must run for its exit not to be counted as a failure.
+        :param max_backoff: Max seconds to wait before restarting a failing worker.
+        :param stop_timeout: Seconds given to the workers to exit before they are killed.
+        """
+        self.command = command
+        self.workers = workers
+        self.env = dict(env if env is not None else os.environ)
+        self.min_uptime = min_uptime
+        self.max_backoff = max_backoff
+        self.stop_timeout = stop_timeout
+        self.restarts = 0
+        self._processes: Dict[int, subprocess.Popen] = {}
+        self._started: Dict[int, float] = {}
+        self._failures: Dict[int, int] = {}
+        self._restart_at: Dict[int, float] = {}
+        self._stopping = False
+
+    def worker_env(self, worker_id: int) -> Dict[str, str]:
+        env = {**self.env, "WORKER_ID": str(worker_id)}
+        # one metrics endpoint per worker, on consecutive ports
+        if env.get("METRICS_PORT"):
+            env["METRICS_PORT"] = str(int(env["METRICS_PORT"]) + worker_id)
+        return env
+
+    def _spawn(self, worker_id: int):
+        self._processes[worker_id] = subprocess.Popen(
+            self.command, env=self.worker_env(worker_id)
+        )
+        self._started[worker_id] = time.monotonic()
+        self.LOGGER.info(
+            f"Started worker {worker_id}, pid {self._processes[worker_id].pid}"
+        )
+
+    def start(self):
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+
+    def poll(self):
+        """
+        Restart the workers that exited, once their backoff is over
+        """
+        now = time.monotonic()
+        for worker_id, process in list(self._processes.items()):
+            if self._stopping:
+                return
+            if worker_id in self._restart_at:
+                if now >= self._restart_at[worker_id]:
+                    del self._restart_at[worker_id]
+                    self.restarts += 1
+                    self._spawn(worker_id)
+                continue
+            code = process.poll()
+            if code is None:
+                continue
+            if now - self._started[worker_id] < self.min_uptime:
+                self._failures[worker_id] = self._failures.get(worker_id, 0) + 1
+            else:
+                self._failures[worker_id] = 0
+            backoff = min(self.max_backoff, 2 ** self._failures[worker_id] - 1)
+            self.LOGGER.warning(
+                f"Worker {worker_id} exited with {code}, restarting in {backoff}s"
+            )
+            self._restart_at[worker_id] = now + backoff
+
+    def stop(self, *args):
+        """
+        Terminate the workers, killing the ones still running after the stop timeout
+        """
+        self._stopping = True
+        running = [p for p in self._processes.values() if p.poll() is None]
+        for process in running:
+            process.terminate()
+        deadline = time.monotonic() + self.stop_timeout
+        for process in running:
+            try:
+                process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                self.LOGGER.warning(f"Killing worker pid {process.pid}")
+                process.kill()
+                process.wait()
+
+    def run(self, interval: float = 0.5):
+        """
+        Run the workers until SIGTERM/SIGINT
+        """
+        signal.signal(signal.SIGTERM, lambda *args: self.stop())
+        signal.signal(signal.SIGINT, lambda *args: self.stop())
+        self.start()
+        while not self._stopping:
+            self.poll()
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WORKERS", min(os.cpu_count() or 1, MAX_WORKERS))),
+        help="Worker processes, env WORKERS (default the number of cores, at most "
+        f"{MAX_WORKERS})",
+    )
+    parser.add_argument(
+        "--app", default="app.py", help="The bot run by the workers, app.py or async_app.py"
+    )
+    parser.add_argument(
+        "--store",
+        default=os.getenv("SHARED_STORE_PATH", ".bot_store.sqlite"),
+        help="The SQLite store shared by the workers, env SHARED_STORE_PATH",
+    )
+    args = parser.parse_args()
+    if not 1 <= args.workers <= MAX_WORKERS:
+        parser.error(
+            f"--workers must be between 1 and {MAX_WORKERS}, the Socket Mode "
+            "connections Slack allows per app"
+        )
+
+    # created once here, rather than raced by the workers
+    SharedStore(args.store).close()
+    supervisor = Supervisor(
+        [sys.executable, args.app],
+        args.workers,
+        env={**os.environ, "SHARED_STORE_PATH": args.store},
+    )
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from handler_tasks.cortalyst import analyst_events, replay_answer
+from utils.sse import parse_sse
+
+
+def sse_lines(*events):
+    lines = [": keep-alive", ""]
+    for event, data in events:
+        lines += [f"event: {event}", f"data: {json.dumps(data)}", ""]
+    return lines
+
+
+def delta(index, type, **fields):
+    return ("message.content.delta", {"index": index, "type": type, **fields})
+
+
+def status(status):
+    return ("status", {"status": status, "status_message": status.replace("_", " ")})
+
+
+class TestParseSSE:
+    def test_events(self):
+        lines = ["event: status", "data: a", "data: b", "", ": comment", "data:c", ""]
+        assert list(parse_sse(lines)) == [("status", "a\nb"), ("message", "c")]
+
+    def test_last_event_without_blank_line(self):
+        assert list(parse_sse(["event: done", "data: x"])) == [("done", "x")]
+
+
+class TestAnalystEvents:
+    def test_answer_assembled_as_it_streams(self):
+        lines = sse_lines(
+            status("interpreting_question"),
+            delta(0, "text", text_delta="This is our "),
+            delta(0, "text", text_delta="interpretation"),
+            status("generating_sql"),
+            delta(1, "sql", statement_delta="SELECT 1", confidence={}),
+            delta(1, "sql", statement_delta=" FROM t"),
+            delta(2, "text", text_delta="Note"),
+            status("done"),
+        )
+
+        events = list(analyst_events(parse_sse(lines), "req-1"))
+
+        assert [e["type"] for e in events] == [
+            "status",
+            "text",
+            "text",
+            "status",
+            "sql",
+            "text",
+            "status",
+            "done",
+        ]
+        assert events[2]["text"] == "This is our interpretation"
+        assert events[4]["statement"] == "SELECT 1 FROM t"
+        assert events[5]["text"] == "This is our interpretation\nNote"
+        assert events[-1]["request_id"] == "req-1"
+        assert events[-1]["message"]["content"] == [
+            {"type": "text", "text": "This is our interpretation"},
+            {"type": "sql", "statement": "SELECT 1 FROM t", "confidence": {}},
+            {"type": "text", "text": "Note"},
+        ]
+
+    def test_statement_complete_at_end_of_stream(self):
+        lines = sse_lines(delta(0, "sql", statement_delta="SELECT 1"))
+        events = list(analyst_events(parse_sse(lines)))
+        assert events[0] == {"type": "sql", "statement": "SELECT 1"}
+        assert events[-1]["type"] == "done"
+
+    def test_error(self):
+        lines = sse_lines(("error", {"message": "no model", "code": "392700"}))
+        with pytest.raises(Exception, match="no model"):
+            list(analyst_events(parse_sse(lines), "req-1"))
+
+    def test_replay_matches_stream(self):
+        lines = sse_lines(
+            delta(0, "text", text_delta="Interpretation"),
+            delta(1, "sql", statement_delta="SELECT 1"),
+        )
+        streamed = list(analyst_events(parse_sse(lines), "req-1"))
+        done = streamed[-1]
+
+        replayed = list(
+            replay_answer(
+                {"message": done["message"], "request_id": "req-1", "cached": True}
+            )
+        )
+
+        assert replayed[:-1] == streamed[:-1]
+        assert replayed[-1]["cached"] is True
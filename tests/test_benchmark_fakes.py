@@ -0,0 +1,155 @@
+import json
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from benchmarks.end_to_end import percentile, stage_latencies
+from benchmarks.fakes import FakeAnalystServer, FakeSession, FakeSlackServer
+from benchmarks.socket_replay import (
+    cortalyst_envelope,
+    find_knee,
+    recorded_envelopes,
+    step_report,
+)
+from handler_tasks.cortalyst import Cortlayst
+from handler_tasks.result_cache import fetch_preview
+
+
+@pytest.fixture
+def analyst():
+    server = FakeAnalystServer(latency=0.01, statements=2).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def cortalyst(tmp_path, analyst):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path = tmp_path / "rsa_key.p8"
+    path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    client = Cortlayst(
+        account="bench",
+        user="bench",
+        private_key_file_path=str(path),
+        host="127.0.0.1",
+        cache=None,
+    )
+    client.analyst_endpoint = analyst.endpoint
+    yield client
+    client.close()
+
+
+class TestFakes:
+    def test_analyst_answers(self, cortalyst, analyst):
+        ans = cortalyst.answer("How many tickets?")
+        assert [item["type"] for item in ans["message"]["content"]] == [
+            "text",
+            "sql",
+            "sql",
+        ]
+        assert ans["request_id"]
+
+    def test_analyst_streams(self, cortalyst, analyst):
+        events = list(cortalyst.stream_answer("How many tickets?"))
+        statements = [e["statement"] for e in events if e["type"] == "sql"]
+        assert statements == [
+            item["statement"]
+            for item in analyst.content("How many tickets?")
+            if item["type"] == "sql"
+        ]
+        assert events[-1]["type"] == "done"
+        assert analyst.requests == 1
+
+    def test_session_results(self):
+        session = FakeSession(query_latency=0, rows=25, batch_rows=10)
+        df, total_rows = fetch_preview(session, "SELECT 1", max_rows=15)
+        assert (len(df), total_rows) == (15, 25)
+        assert list(df.columns) == ["SERVICE_TYPE", "TICKET_COUNT"]
+        # the same query has the same result
+        assert fetch_preview(session, "SELECT 1", max_rows=15)[0].equals(df)
+
+
+class TestReport:
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert [percentile(values, p) for p in (50, 95, 99, 100)] == [50, 95, 99, 100]
+
+    def test_stage_latencies(self):
+        def span(trace, name, start, duration):
+            return {"trace_id": trace, "name": name, "start": start, "duration": duration}
+
+        latencies = stage_latencies(
+            [
+                span("t1", "command", 0.0, 0.001),
+                span("t1", "question", 0.5, 1.0),
+                span("t1", "upload", 1.4, 0.2),
+            ]
+        )
+        assert latencies["end_to_end"]["p50"] == 1600.0
+        assert latencies["question"]["p99"] == 1000.0
+
+
+class TestSocketReplay:
+    def test_fake_slack_server(self):
+        from slack_sdk import WebClient
+
+        server = FakeSlackServer(latency=0).start()
+        try:
+            client = WebClient(token="xoxb-test", base_url=server.base_url)
+            assert client.chat_postMessage(channel="C1", text="hi")["ts"]
+            uploaded = client.files_upload_v2(
+                channel="C1", file=b"png", filename="chart.png"
+            )
+            assert uploaded["file"]["id"].startswith("F")
+        finally:
+            server.stop()
+        assert server.calls["chat.postMessage"] == 1
+        assert server.calls["upload"] == 1
+
+    def test_recorded_envelopes_restamped(self, tmp_path):
+        path = tmp_path / "envelopes.jsonl"
+        envelope = cortalyst_envelope(0, "How many tickets?", "https://hooks.slack.com/x")
+        path.write_text(json.dumps(envelope) + "\n")
+
+        replayed = recorded_envelopes(str(path), lambda i: f"http://local/{i}")
+        first, second = next(replayed), next(replayed)
+        assert [first["envelope_id"], second["envelope_id"]] == ["replay-0", "replay-1"]
+        assert second["payload"]["trigger_id"] == "replay-1"
+        assert second["payload"]["response_url"] == "http://local/1"
+        assert second["payload"]["text"] == "How many tickets?"
+
+    def test_step_report_and_knee(self):
+        sent = [
+            {"envelope_id": f"e{i}", "trigger_id": f"t{i}", "sent_at": 100.0}
+            for i in range(4)
+        ]
+        acked_at = {"e0": 100.1, "e1": 104.0, "e2": 100.2}
+
+        def command(accepted):
+            return {
+                "name": "command",
+                "start": 100.1,
+                "duration": 0.001,
+                "error": None,
+                "attributes": {"accepted": accepted},
+            }
+
+        traces = {
+            "t0": [command(True), {**command(True), "name": "question", "duration": 1.9}],
+            "t2": [command(False)],
+        }
+
+        step = step_report(5, sent, acked_at, traces, deadline=3.0)
+        assert (step["missing_acks"], step["late_acks"], step["rejected"]) == (1, 1, 1)
+        assert step["error_rate"] == 0.5
+        assert step["completion_ms"]["p50"] == pytest.approx(2000.0)
+        healthy = {"rate": 2, "error_rate": 0.0, "ack_ms": {"p99": 150.0}}
+        assert find_knee([healthy, step], 3.0, 0.01) == 5
+        assert find_knee([healthy], 3.0, 0.01) is None
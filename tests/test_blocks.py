@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import handler_tasks.blocks as blocks
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "SERVICE_TYPE": ["Cellular", "Business Internet", None],
+            "TICKET_COUNT": [10, 200, 3],
+            "AVG_DAYS": [1.234, np.nan, -3.0],
+        }
+    )
+
+
+class TestCreateDfBlock:
+    def test_markdown_table(self, df):
+        want = "\n".join(
+            [
+                " | SERVICE_TYPE      | TICKET_COUNT | AVG_DAYS | ",
+                " | ----------------- | ------------ | -------- | ",
+                " | Cellular          |           10 |     1.23 | ",
+                " | Business Internet |          200 |      N/A | ",
+                " | N/A               |            3 |    -3.00 | ",
+            ]
+        )
+        got, shown_rows = blocks.markdown_table(df)
+        assert want == got
+        assert shown_rows == 3
+
+    def test_format_floats(self):
+        values = np.array([1.115, 2.675, 0.125, -0.001, 1e20, np.inf, 12345.678])
+        assert blocks.format_floats(values).tolist() == [f"{v:.2f}" for v in values]
+
+    def test_row_cap_and_summary(self, df):
+        got = blocks.create_df_block(df, total_rows=1000, max_rows=2)
+        assert got[1]["text"]["text"].count("\n") == 3
+        assert got[2]["elements"][0]["text"] == "_Showing 2 of 1000 rows_"
+
+    def test_fits_slack_section_limit(self):
+        df = pd.DataFrame({"TICKET_ID": [f"TR{i:04}" for i in range(5000)]})
+        got = blocks.create_df_block(df, max_rows=5000)
+        assert len(got[1]["text"]["text"]) <= blocks.SECTION_TEXT_LIMIT
@@ -0,0 +1,180 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from utils.cache import LRUCache
+from handler_tasks.answer_cache import AnswerCache, normalize_question
+from handler_tasks.result_cache import canonicalize_sql, fetch_preview
+from handler_tasks import charts
+from handler_tasks.charts import ChartCache, DEFAULT_SPEC, chart_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class TestLRUCache:
+    def test_lru_eviction(self):
+        cache = LRUCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+
+        assert "b" not in cache
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiry(self, clock):
+        cache = LRUCache(max_entries=2, ttl=10, clock=clock)
+        cache.put("a", 1)
+        clock.now = 5
+        assert cache.get("a") == 1
+        clock.now = 11
+        assert cache.get("a") is None
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["expirations"] == 1
+
+    def test_disabled(self):
+        cache = LRUCache(max_entries=0)
+        cache.put("a", 1)
+        assert len(cache) == 0
+
+
+class TestAnswerCache:
+    model = "@demo_db.data.semantic_models/support_tickets_semantic_model.yaml"
+
+    def test_normalize_question(self):
+        assert normalize_question(
+            "  How many tickets\nper SERVICE type? "
+        ) == normalize_question("how many tickets per service type")
+
+    def test_answers_keyed_by_model_version(self):
+        cache = AnswerCache(max_entries=8, ttl=60)
+        question = "How many tickets per service type?"
+        version = cache.set_semantic_model(self.model, "name: v1")
+        cache.put(self.model, version, question, {"message": "v1"})
+
+        assert cache.get(self.model, version, "how many tickets per service type") == {
+            "message": "v1"
+        }
+
+        new_version = cache.set_semantic_model(self.model, "name: v2")
+        assert new_version != version
+        assert cache.get(self.model, version, question) is None
+        assert cache.get(self.model, new_version, question) is None
+
+    def test_reupload_invalidates(self):
+        cache = AnswerCache(max_entries=8, ttl=60)
+        version = cache.set_semantic_model(self.model, "name: v1")
+        cache.put(self.model, version, "q", {"message": "v1"})
+
+        assert cache.set_semantic_model(self.model, "name: v1") == version
+        assert cache.get(self.model, version, "q") is None
+
+
+class TestResultCache:
+    def test_canonicalize_sql(self):
+        query = """SELECT service_type,   COUNT(*) AS ticket_count
+-- Generated by Cortex Analyst
+FROM demo_db.data.support_tickets
+WHERE request LIKE '%two  spaces%'
+GROUP BY service_type;
+"""
+        assert canonicalize_sql(query) == canonicalize_sql(
+            "SELECT service_type, COUNT(*) AS ticket_count FROM demo_db.data.support_tickets "
+            "WHERE request LIKE '%two  spaces%' GROUP BY service_type"
+        )
+        assert "'%two  spaces%'" in canonicalize_sql(query)
+
+    def test_memory_budget(self):
+        cache = LRUCache(max_entries=None, max_bytes=10, sizeof=len)
+        cache.put("a", "12345")
+        cache.put("b", "12345")
+        assert cache.stats()["bytes"] == 10
+        cache.put("c", "123")
+
+        assert "a" not in cache
+        assert cache.stats()["bytes"] == 8
+        assert not cache.put("d", "12345678901")
+
+
+class FakeCursor:
+    def __init__(self, batches, rowcount):
+        self.batches = batches
+        self.rowcount = None
+        self.sfqid = None
+        self._rowcount = rowcount
+        self.fetched_batches = 0
+
+    def execute(self, query):
+        self.rowcount = self._rowcount
+        self.sfqid = "01b2c3d4-0000-0000-0000-000000000001"
+
+    def fetch_pandas_batches(self):
+        for batch in self.batches:
+            self.fetched_batches += 1
+            yield batch
+
+    def close(self):
+        pass
+
+
+class TestFetchPreview:
+    def test_fetches_only_needed_batches(self):
+        batches = [pd.DataFrame({"TICKET_ID": range(i * 4, i * 4 + 4)}) for i in range(5)]
+        cursor = FakeCursor(batches, rowcount=20)
+        session = SimpleNamespace(connection=SimpleNamespace(cursor=lambda: cursor))
+
+        df, total_rows = fetch_preview(session, "select ticket_id from t", max_rows=6)
+
+        assert total_rows == 20
+        assert list(df["TICKET_ID"]) == [0, 1, 2, 3, 4, 5]
+        assert cursor.fetched_batches == 2
+
+
+class TestChartCache:
+    def test_chart_key(self):
+        df = pd.DataFrame(
+            {"SERVICE_TYPE": ["Cellular", "Business Internet"], "TICKET_COUNT": [3, 4]}
+        )
+        assert chart_key(df, DEFAULT_SPEC) == chart_key(df.copy(), DEFAULT_SPEC)
+        assert chart_key(df, DEFAULT_SPEC) != chart_key(
+            df.assign(TICKET_COUNT=[3, 5]), DEFAULT_SPEC
+        )
+        assert chart_key(df, DEFAULT_SPEC) != chart_key(
+            df, {**DEFAULT_SPEC, "mark": "bar"}
+        )
+
+    def test_renders_once(self, monkeypatch):
+        renders = []
+
+        def render_png(df, spec):
+            renders.append(spec)
+            return b"png"
+
+        monkeypatch.setattr(charts, "render_png", render_png)
+        cache = ChartCache(max_bytes=1024)
+        df = pd.DataFrame({"SERVICE_TYPE": ["Cellular"], "TICKET_COUNT": [3]})
+
+        key, png = cache.render(df)
+        assert (key, png) == cache.render(df.copy())
+        assert len(renders) == 1
+
+        cache.remember_file(key, "C1", "F1")
+        assert cache.shared_file(key, "C1") == "F1"
+        assert cache.shared_file(key, "C2") is None
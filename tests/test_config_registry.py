@@ -0,0 +1,101 @@
+import json
+import threading
+
+import pytest
+
+from handler_tasks.config_registry import GLOBAL, ConfigRegistry, TenantConfig
+from utils.shared_store import SharedStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / ".tenant_config")
+
+
+@pytest.fixture
+def registry(path):
+    return ConfigRegistry(path=path)
+
+
+class TestConfigRegistry:
+    def test_resolve_falls_back(self, registry):
+        team = TenantConfig("team_db", "data")
+        channel = TenantConfig("channel_db", "demo")
+        registry.set(team, "T1")
+        registry.set(channel, "T1", "C1")
+
+        assert registry.resolve("T1", "C1") == channel
+        assert registry.resolve("T1", "C2") == team
+        assert registry.resolve("T2", "C1") == TenantConfig()
+
+    def test_semantic_model(self):
+        assert (
+            TenantConfig("demo_db", "data").semantic_model
+            == "@demo_db.data.semantic_models/support_tickets_semantic_model.yaml"
+        )
+
+    def test_persisted(self, registry, path):
+        registry.set(TenantConfig("channel_db", "demo"), "T1", "C1")
+        reloaded = ConfigRegistry(path=path).load()
+        assert reloaded.resolve("T1", "C1") == TenantConfig("channel_db", "demo")
+        assert reloaded.resolve(None, None) == TenantConfig()
+
+    def test_legacy_dbinfo(self, tmp_path, path):
+        legacy_path = tmp_path / ".dbinfo"
+        legacy_path.write_text(json.dumps({"db_name": "old_db", "schema_name": "old"}))
+        registry = ConfigRegistry(path=path).load(legacy_path=str(legacy_path))
+        assert registry.resolve("T1", "C1") == TenantConfig("old_db", "old")
+
+    def test_concurrent_setups_do_not_overwrite(self, registry):
+        def setup(i):
+            registry.set(TenantConfig(f"db_{i}", "data"), "T1", f"C{i}")
+
+        threads = [threading.Thread(target=setup, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(
+            registry.resolve("T1", f"C{i}").db_name == f"db_{i}" for i in range(20)
+        )
+
+    def test_shared_by_processes(self, tmp_path):
+        store = SharedStore(str(tmp_path / "store.sqlite"))
+        worker_1 = ConfigRegistry(
+            path=str(tmp_path / "1"), store=store, refresh_interval=0
+        ).load()
+        worker_2 = ConfigRegistry(
+            path=str(tmp_path / "2"), store=store, refresh_interval=0
+        ).load()
+
+        worker_1.set(TenantConfig("db_1", "data"), "T1", "C1")
+        assert worker_2.refresh()
+        assert worker_2.resolve("T1", "C1").db_name == "db_1"
+        assert not worker_2.refresh()
+
+        # a write on top of the other worker's, not over it
+        worker_2.set(TenantConfig("db_2", "data"), "T1", "C2")
+        worker_1.refresh()
+        assert worker_1.resolve("T1", "C1").db_name == "db_1"
+        assert worker_1.resolve("T1", "C2").db_name == "db_2"
+        assert GLOBAL in worker_1.configs()
+
+    def test_concurrent_setups_of_the_workers(self, tmp_path):
+        store = SharedStore(str(tmp_path / "store.sqlite"))
+        workers = [
+            ConfigRegistry(path=str(tmp_path / str(i)), store=store).load()
+            for i in range(2)
+        ]
+
+        def setup(i):
+            workers[i % 2].set(TenantConfig(f"db_{i}", "data"), "T1", f"C{i}")
+
+        threads = [threading.Thread(target=setup, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        registry = ConfigRegistry(path=str(tmp_path / "new"), store=store).load()
+        assert all(
+            registry.resolve("T1", f"C{i}").db_name == f"db_{i}" for i in range(20)
+        )
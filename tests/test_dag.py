@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from handler_tasks.setup_state import SetupState, fingerprint
+from utils.dag import CANCELLED, DONE, FAILED, SKIPPED, StepFailed, TaskGraph
+from utils.shared_store import SharedStore
+
+
+class TestTaskGraph:
+    def test_dependencies_run_first(self):
+        order = []
+        lock = threading.Lock()
+
+        def step(name):
+            with lock:
+                order.append(name)
+
+        graph = TaskGraph(max_workers=4)
+        graph.add("database", step, "database")
+        graph.add("schema", step, "schema", depends_on=["database"])
+        graph.add("table", step, "table", depends_on=["schema"])
+        graph.add("stage", step, "stage", depends_on=["schema"])
+        graph.add("pipes", step, "pipes", depends_on=["table", "stage"])
+
+        results = graph.run()
+
+        assert order[:2] == ["database", "schema"]
+        assert set(order[2:4]) == {"table", "stage"}
+        assert order[4] == "pipes"
+        assert list(results) == ["database", "schema", "table", "stage", "pipes"]
+        assert all(result.status == DONE for result in results.values())
+
+    def test_independent_steps_run_concurrently(self):
+        graph = TaskGraph(max_workers=4)
+        graph.add("schema", lambda: None)
+        for name in ["file_format", "stage", "table"]:
+            graph.add(name, time.sleep, 0.2, depends_on=["schema"])
+
+        start = time.perf_counter()
+        graph.run()
+        assert time.perf_counter() - start < 0.5
+
+    def test_failure_cancels_dependents(self):
+        def fail():
+            raise Exception("no privilege")
+
+        ran = []
+        graph = TaskGraph(max_workers=2)
+        graph.add("schema", lambda: None)
+        graph.add("table", fail, depends_on=["schema"])
+        graph.add("stage", ran.append, "stage", depends_on=["schema"])
+        graph.add("pipes", ran.append, "pipes", depends_on=["table", "stage"])
+
+        with pytest.raises(StepFailed) as e:
+            graph.run()
+
+        results = e.value.results
+        assert results["table"].status == FAILED
+        assert "no privilege" in str(e.value)
+        assert results["stage"].status == DONE
+        assert results["pipes"].status == CANCELLED
+        assert ran == ["stage"]
+
+    def test_unknown_dependency(self):
+        with pytest.raises(ValueError):
+            TaskGraph().add("pipes", lambda: None, depends_on=["table"])
+
+    def test_skipped_steps_satisfy_dependents(self):
+        ran = []
+        graph = TaskGraph(max_workers=2)
+        graph.add("schema", ran.append, "schema", skip=True)
+        graph.add("table", ran.append, "table", depends_on=["schema"], skip=True)
+        graph.add("pipes", ran.append, "pipes", depends_on=["table"])
+
+        results = graph.run()
+
+        assert ran == ["pipes"]
+        assert results["schema"].status == SKIPPED
+        assert results["table"].status == SKIPPED
+        assert results["pipes"].status == DONE
+
+
+class TestSetupState:
+    def test_fingerprint_of_the_definition(self):
+        assert fingerprint("db", {"a": 1, "b": 2}) == fingerprint("db", {"b": 2, "a": 1})
+        assert fingerprint("db", {"a": 1}) != fingerprint("db", {"a": 2})
+
+    def test_record_and_forget(self, tmp_path):
+        path = str(tmp_path / ".setup_state")
+        state = SetupState(path)
+        assert state.applied("demo_db", "data") == {}
+
+        state.record("demo_db", "data", {"schema": "abc"})
+        state.record("other_db", "data", {"schema": "def"})
+
+        # persisted and keyed case insensitively, like Snowflake identifiers
+        assert SetupState(path).applied("DEMO_DB", "DATA") == {"schema": "abc"}
+        state.forget("demo_db", "data")
+        assert state.applied("demo_db", "data") == {}
+        assert state.applied("other_db", "data") == {"schema": "def"}
+
+    def test_shared_by_processes(self, tmp_path):
+        store = SharedStore(str(tmp_path / "store.sqlite"))
+        worker_1 = SetupState(str(tmp_path / "1"))
+        worker_2 = SetupState(str(tmp_path / "2"))
+        worker_1.share(store)
+        worker_2.share(store)
+
+        worker_1.record("demo_db", "data", {"schema": "abc"})
+        worker_2.record("other_db", "data", {"schema": "def"})
+        assert worker_2.applied("demo_db", "data") == {"schema": "abc"}
+        assert worker_1.applied("other_db", "data") == {"schema": "def"}
+        worker_2.forget("demo_db", "data")
+        assert worker_1.applied("demo_db", "data") == {}
+        store.close()
+
+    def test_unreadable_state(self, tmp_path):
+        path = tmp_path / ".setup_state"
+        path.write_text("{not json")
+        assert SetupState(str(path)).applied("demo_db", "data") == {}
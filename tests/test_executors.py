@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from handler_tasks.executors import StageExecutors
+
+
+@pytest.fixture
+def executors():
+    executors = StageExecutors(concurrency={"query": 2, "render": 1})
+    yield executors
+    executors.shutdown()
+
+
+class TestStageExecutors:
+    def test_limits_from_env(self, monkeypatch):
+        monkeypatch.setenv("UPLOAD_CONCURRENCY", "7")
+        executors = StageExecutors(concurrency={"query": 3})
+        assert executors.limit("upload") == 7
+        assert executors.limit("query") == 3
+
+    def test_stage_concurrency_is_bounded(self, executors):
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def slow_query():
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+
+        async def run_all():
+            await asyncio.gather(*[executors.run("query", slow_query) for _ in range(6)])
+
+        asyncio.run(run_all())
+        assert peak == 2
+
+    def test_slow_stage_does_not_block_others(self, executors):
+        async def run_all():
+            slow = asyncio.ensure_future(executors.run("render", time.sleep, 0.3))
+            start = time.perf_counter()
+            await executors.run("query", lambda: None)
+            elapsed = time.perf_counter() - start
+            await slow
+            return elapsed
+
+        assert asyncio.run(run_all()) < 0.2
+
+    def test_iterate_yields_as_produced(self, executors):
+        def produce():
+            yield 1
+            time.sleep(0.3)
+            yield 2
+
+        async def consume():
+            start = time.perf_counter()
+            got = []
+            async for item in executors.iterate("query", produce):
+                got.append((item, time.perf_counter() - start))
+            return got
+
+        got = asyncio.run(consume())
+        assert [item for item, _ in got] == [1, 2]
+        assert got[0][1] < 0.2
+
+    def test_iterate_raises_producer_errors(self, executors):
+        def produce():
+            yield 1
+            raise ValueError("stream broken")
+
+        async def consume():
+            async for _ in executors.iterate("query", produce):
+                pass
+
+        with pytest.raises(ValueError):
+            asyncio.run(consume())
@@ -0,0 +1,117 @@
+import threading
+import time
+from datetime import timedelta
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import utils.jwt_generator as jwt_generator
+from utils.jwt_generator import JWTGenerator
+
+
+@pytest.fixture
+def private_key_file(tmp_path):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path = tmp_path / "rsa_key.p8"
+    path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    return str(path)
+
+
+@pytest.fixture
+def signed(monkeypatch):
+    """
+    Counts the tokens signed, each signing made slow enough for threads to race
+    """
+    tokens = []
+    encode = jwt.encode
+
+    def slow_encode(*args, **kwargs):
+        time.sleep(0.05)
+        tokens.append(encode(*args, **kwargs))
+        return tokens[-1]
+
+    monkeypatch.setattr(jwt_generator.jwt, "encode", slow_encode)
+    return tokens
+
+
+class TestJWTGenerator:
+    def test_claims(self, private_key_file):
+        generator = JWTGenerator("myorg-myaccount.us-east-1", "demo", private_key_file)
+
+        claims = jwt.decode(
+            generator.generate_token(),
+            key=generator.private_key.public_key(),
+            algorithms=[JWTGenerator.ALGORITHM],
+        )
+
+        assert claims["sub"] == "MYORG-MYACCOUNT.DEMO"
+        assert claims["iss"] == f"MYORG-MYACCOUNT.DEMO.{generator.public_key_fp}"
+        assert generator.public_key_fp.startswith("SHA256:")
+
+    def test_token_reused_until_renewal(self, private_key_file, signed):
+        generator = JWTGenerator("account", "demo", private_key_file)
+
+        token = generator.generate_token()
+        assert generator.generate_token() == token
+
+        assert len(signed) == 1
+
+        generator.renew_time -= timedelta(hours=1)
+        generator.generate_token()
+        assert len(signed) == 2
+
+    def test_single_flight_renewal(self, private_key_file, signed):
+        generator = JWTGenerator("account", "demo", private_key_file)
+        start = threading.Barrier(8)
+        tokens = []
+
+        def ask():
+            start.wait()
+            tokens.append(generator.generate_token())
+
+        threads = [threading.Thread(target=ask) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(signed) == 1
+        assert set(tokens) == set(signed)
+
+    def test_refresher_renews_ahead(self, private_key_file, signed):
+        generator = JWTGenerator(
+            "account",
+            "demo",
+            private_key_file,
+            renewal_delay=JWTGenerator.REFRESH_AHEAD + timedelta(seconds=0.2),
+        )
+        generator.start_refresher()
+        try:
+            deadline = time.monotonic() + 5
+            while len(signed) < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert len(signed) >= 2
+            # the token is renewed before the renewal time, never by the caller
+            assert generator.generate_token() == signed[-1]
+        finally:
+            generator.stop_refresher()
+
+    def test_refresher_short_renewal_delay(self, private_key_file, signed):
+        generator = JWTGenerator(
+            "account", "demo", private_key_file, renewal_delay=timedelta(0)
+        )
+        generator.start_refresher()
+        try:
+            time.sleep(0.5)
+            # renewed at most once per REFRESH_MIN_WAIT, not in a tight loop
+            assert len(signed) == 1
+        finally:
+            generator.stop_refresher()
@@ -0,0 +1,67 @@
+import urllib.request
+
+import pytest
+
+from utils.metrics import Metrics
+
+
+@pytest.fixture
+def metrics():
+    m = Metrics(buckets=(0.1, 1))
+    m.enable()
+    return m
+
+
+class TestMetrics:
+    def test_disabled_is_noop(self):
+        m = Metrics()
+        with m.stage("query"):
+            pass
+        m.count("errors")
+        assert m.stage("query") is m.stage("render")
+        assert "stage=" not in m.render()
+
+    def test_stage_histogram(self, metrics):
+        metrics.observe("query", 0.05)
+        metrics.observe("query", 0.5)
+        metrics.observe("query", 5)
+        text = metrics.render()
+        assert 'demo_mate_stage_seconds_bucket{stage="query",le="0.1"} 1' in text
+        assert 'demo_mate_stage_seconds_bucket{stage="query",le="1"} 2' in text
+        assert 'demo_mate_stage_seconds_bucket{stage="query",le="+Inf"} 3' in text
+        assert 'demo_mate_stage_seconds_sum{stage="query"} 5.55' in text
+        assert 'demo_mate_stage_seconds_count{stage="query"} 3' in text
+
+    def test_stage_errors_counted(self, metrics):
+        with pytest.raises(ValueError):
+            with metrics.stage("analyst"):
+                raise ValueError("boom")
+        with metrics.stage("analyst"):
+            pass
+        text = metrics.render()
+        assert 'demo_mate_stage_seconds_count{stage="analyst"} 2' in text
+        assert 'demo_mate_stage_errors_total{stage="analyst"} 1' in text
+
+    def test_collectors(self, metrics):
+        metrics.collect(
+            "cache", "Cache stats.", lambda: {("answers", "hits"): 3}, ("cache", "stat")
+        )
+        metrics.collect("broken", "Fails.", lambda: 1 / 0)
+        text = metrics.render()
+        assert "# TYPE demo_mate_cache gauge" in text
+        assert 'demo_mate_cache{cache="answers",stat="hits"} 3' in text
+        assert "demo_mate_broken" not in text
+
+    def test_serve(self):
+        m = Metrics()
+        server = m.serve(0)
+        try:
+            with m.stage("question"):
+                pass
+            url = f"http://127.0.0.1:{server.server_port}/metrics"
+            with urllib.request.urlopen(url) as resp:
+                assert resp.status == 200
+                assert 'stage="question"' in resp.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,140 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from slack_sdk.errors import SlackApiError
+
+from handler_tasks.outbox import SlackOutbox
+from utils.token_bucket import TokenBucket
+
+
+class FakeClient:
+    """
+    Records the Web API calls, the first call blocks until released so that the
+    following calls queue up behind it
+    """
+
+    def __init__(self, errors=()):
+        self.calls = []
+        self.errors = list(errors)
+        self.release = threading.Event()
+        self.release.set()
+
+    def _call(self, method, **kwargs):
+        self.release.wait(5)
+        self.calls.append((method, kwargs))
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"ok": True, "ts": str(len(self.calls))}
+
+    def chat_postMessage(self, **kwargs):
+        return self._call("chat_postMessage", **kwargs)
+
+    def chat_update(self, **kwargs):
+        return self._call("chat_update", **kwargs)
+
+    def files_upload_v2(self, **kwargs):
+        return self._call("files_upload_v2", **kwargs)
+
+
+def rate_limited(retry_after="2"):
+    return SlackApiError(
+        "ratelimited",
+        SimpleNamespace(status_code=429, headers={"retry-after": retry_after}),
+    )
+
+
+@pytest.fixture
+def sleeps():
+    return []
+
+
+@pytest.fixture
+def outbox(sleeps):
+    outbox = SlackOutbox(workers=4, max_retries=2, backoff=0.5, sleep=sleeps.append)
+    yield outbox
+    outbox.shutdown()
+
+
+class TestTokenBucket:
+    def test_waits_once_burst_is_spent(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=2, burst=2, clock=lambda: now[0])
+        assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+        now[0] = 10.0
+        assert bucket.reserve() == 0.0
+
+
+class TestSlackOutbox:
+    def test_channel_order(self, outbox):
+        client = FakeClient()
+        futures = [
+            outbox.send(client, "chat_postMessage", "C1", text=str(i)) for i in range(5)
+        ]
+        for future in futures:
+            future.result(5)
+        assert [kwargs["text"] for _, kwargs in client.calls] == list("01234")
+
+    def test_queued_messages_are_coalesced(self, outbox):
+        client = FakeClient()
+        client.release.clear()
+        first = outbox.send(client, "chat_postMessage", "C1", text="waiting")
+        sql = outbox.post(client, "C1", blocks=[{"type": "header"}], text="SQL")
+        table = outbox.post(client, "C1", blocks=[{"type": "section"}], text="Table")
+        updates = [
+            outbox.update(client, "C1", "1", blocks=[], text=f"update {i}")
+            for i in range(3)
+        ]
+        client.release.set()
+
+        assert first.result(5)["ok"]
+        assert sql.result(5) is table.result(5)
+        assert all(update.result(5) is updates[-1].result(5) for update in updates)
+        assert [(method, kwargs["text"]) for method, kwargs in client.calls] == [
+            ("chat_postMessage", "waiting"),
+            ("chat_postMessage", "SQL\nTable"),
+            ("chat_update", "update 2"),
+        ]
+        stats = outbox.stats()
+        assert stats["sent"] == 3
+        assert stats["coalesced"] == 3
+        assert stats["queued"] == 0
+
+    def test_not_coalesced(self, outbox):
+        client = FakeClient()
+        client.release.clear()
+        outbox.send(client, "chat_postMessage", "C1", text="waiting")
+        first = outbox.post(client, "C1", blocks=[{"type": "actions"}], coalesce=False)
+        second = outbox.post(client, "C1", blocks=[{"type": "actions"}], coalesce=False)
+        client.release.set()
+
+        assert first.result(5) is not second.result(5)
+        assert len(client.calls) == 3
+
+    def test_rate_limited_calls_are_retried(self, outbox, sleeps):
+        client = FakeClient(errors=[rate_limited("2")])
+
+        response = outbox.send(client, "files_upload_v2", "C1", file=b"png").result(5)
+
+        assert response["ok"]
+        assert len(client.calls) == 2
+        assert any(wait > 1.5 for wait in sleeps)
+        assert outbox.stats()["retries"] == 1
+
+    def test_client_errors_are_not_retried(self, outbox):
+        error = SlackApiError(
+            "channel_not_found", SimpleNamespace(status_code=404, headers={})
+        )
+        client = FakeClient(errors=[error])
+
+        with pytest.raises(SlackApiError):
+            outbox.send(client, "chat_postMessage", "C1", text="hi").result(5)
+        assert len(client.calls) == 1
+        assert outbox.stats()["failures"] == 1
+
+    def test_gives_up_after_max_retries(self, outbox):
+        client = FakeClient(errors=[ConnectionError("reset")] * 5)
+
+        with pytest.raises(ConnectionError):
+            outbox.send(client, "chat_postMessage", "C1", text="hi").result(5)
+        assert len(client.calls) == 3
@@ -0,0 +1,132 @@
+import json
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import handler_tasks.blocks as blocks
+from handler_tasks.result_pages import ResultPages
+from utils.shared_store import SharedStore
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {"TICKET_ID": list(range(25)), "SERVICE_TYPE": ["Cellular"] * 25}
+    )
+
+
+def pages_nbytes(df):
+    return pa.Table.from_pandas(df, preserve_index=False).nbytes
+
+
+def page_values(block):
+    actions = [b for b in block if b["type"] == "actions"]
+    if not actions:
+        return {}
+    return {
+        button["action_id"]: json.loads(button["value"])
+        for button in actions[0]["elements"]
+    }
+
+
+class TestResultPages:
+    def test_page(self, df):
+        pages = ResultPages()
+        result_id = pages.keep(df, total_rows=1000)
+        page, kept_rows, total_rows = pages.page(result_id, 10, 10)
+        assert page["TICKET_ID"].tolist() == list(range(10, 20))
+        assert (kept_rows, total_rows) == (25, 1000)
+        # the last page is short, an offset past the end shows the last row
+        assert pages.page(result_id, 20, 10)[0]["TICKET_ID"].tolist() == list(
+            range(20, 25)
+        )
+        assert pages.page(result_id, 100, 10)[0]["TICKET_ID"].tolist() == [24]
+        assert pages.page("unknown", 0, 10) is None
+
+    def test_ttl(self, df):
+        pages = ResultPages(ttl=-1)
+        assert pages.page(pages.keep(df, total_rows=25), 0, 10) is None
+
+    def test_memory_budget(self, df):
+        pages = ResultPages(max_bytes=int(pages_nbytes(df) * 2.5))
+        first = pages.keep(df, total_rows=25)
+        second = pages.keep(df, total_rows=25)
+        pages.page(first, 0, 10)
+        third = pages.keep(df, total_rows=25)
+        # the least recently browsed goes first
+        assert pages.page(second, 0, 10) is None
+        assert pages.page(first, 0, 10) is not None
+        assert pages.page(third, 0, 10) is not None
+        assert pages.stats()["bytes"] <= pages_nbytes(df) * 2.5
+
+        assert ResultPages(max_bytes=10).keep(df, total_rows=25) is None
+
+    def test_shared_by_workers(self, df, tmp_path):
+        store = SharedStore(str(tmp_path / "store.sqlite"))
+        worker_1, worker_2 = ResultPages(), ResultPages()
+        worker_1.share(store)
+        worker_2.share(store)
+        result_id = worker_1.keep(df, total_rows=25)
+        assert worker_2.page(result_id, 10, 5)[0]["TICKET_ID"].tolist() == list(
+            range(10, 15)
+        )
+        store.close()
+
+
+class TestPageButtons:
+    def test_first_page(self, df):
+        block = blocks.create_df_block(
+            df.head(10), total_rows=1000, result_id="abc", kept_rows=25
+        )
+        assert (
+            block[2]["elements"][0]["text"]
+            == "_Showing rows 1-10 of 1000, the first 25 can be browsed_"
+        )
+        assert page_values(block) == {
+            "result_next_page": {"result_id": "abc", "offset": 10}
+        }
+
+    def test_middle_page(self, df):
+        block = blocks.create_df_block(
+            df.iloc[10:20], total_rows=25, offset=10, result_id="abc", kept_rows=25
+        )
+        assert block[2]["elements"][0]["text"] == "_Showing rows 11-20 of 25_"
+        assert page_values(block) == {
+            "result_previous_page": {"result_id": "abc", "offset": 0},
+            "result_next_page": {"result_id": "abc", "offset": 20},
+        }
+
+    def test_last_page(self, df):
+        block = blocks.create_df_block(
+            df.iloc[20:], total_rows=25, offset=20, result_id="abc", kept_rows=25
+        )
+        assert block[2]["elements"][0]["text"] == "_Showing rows 21-25 of 25_"
+        assert page_values(block) == {
+            "result_previous_page": {"result_id": "abc", "offset": 10}
+        }
+
+    def test_pages_cut_by_the_character_limit(self, df):
+        wide = df.assign(COMMENT=["x" * 400] * 25)
+        block = blocks.create_df_block(
+            wide.iloc[8:18], total_rows=25, offset=8, result_id="abc", kept_rows=25
+        )
+        # 4 rows of 400+ characters fit in a section, the pages step by 4
+        assert block[2]["elements"][0]["text"] == "_Showing rows 9-12 of 25_"
+        assert page_values(block) == {
+            "result_previous_page": {"result_id": "abc", "offset": 4},
+            "result_next_page": {"result_id": "abc", "offset": 12},
+        }
+
+    def test_unique_block_ids(self, df):
+        first, second = (
+            blocks.create_df_block(df, result_id=result_id) for result_id in "ab"
+        )
+        assert first[-1]["block_id"] != second[-1]["block_id"]
+        assert blocks.has_page_buttons(first)
+        assert not blocks.has_page_buttons(blocks.create_df_block(df.head(3)))
+
+    def test_not_kept(self, df):
+        block = blocks.create_df_block(df.head(10), total_rows=1000)
+        assert block[2]["elements"][0]["text"] == "_Showing 10 of 1000 rows_"
+        assert page_values(block) == {}
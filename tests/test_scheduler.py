@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from handler_tasks.scheduler import CommandScheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = CommandScheduler(
+        workers=1, max_queued=5, max_per_user=3, max_per_channel=10
+    )
+    yield scheduler
+    scheduler.shutdown()
+
+
+@pytest.fixture
+def blocked(scheduler):
+    """
+    Keeps the only worker busy until released
+    """
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    assert scheduler.submit("question", "U0", "C0", block).position == 0
+    started.wait(5)
+    yield release
+    release.set()
+
+
+def run_all(scheduler, release):
+    done = threading.Event()
+    scheduler.submit("setup", "U_last", "C_last", done.set)
+    release.set()
+    assert done.wait(5)
+
+
+class TestCommandScheduler:
+    def test_questions_ahead_of_setups(self, scheduler, blocked):
+        ran = []
+        setup = scheduler.submit("setup", "U1", "C1", ran.append, "setup")
+        question = scheduler.submit("question", "U2", "C1", ran.append, "question")
+
+        assert setup.position == 1
+        # queued ahead of the setup
+        assert question.position == 1
+
+        run_all(scheduler, blocked)
+        assert ran == ["question", "setup"]
+
+    def test_users_take_turns(self, scheduler, blocked):
+        ran = []
+        for i in range(3):
+            scheduler.submit("question", "U1", "C1", ran.append, f"U1 #{i}")
+        scheduler.submit("question", "U2", "C1", ran.append, "U2 #0")
+
+        run_all(scheduler, blocked)
+        assert ran == ["U1 #0", "U2 #0", "U1 #1", "U1 #2"]
+
+    def test_rejected_when_user_has_too_much_pending(self, scheduler, blocked):
+        for _ in range(3):
+            assert scheduler.submit("question", "U1", "C1", lambda: None).accepted
+        admission = scheduler.submit("question", "U1", "C1", lambda: None)
+        assert not admission.accepted
+        assert "3 requests pending" in admission.reason
+
+    def test_rejected_when_queue_is_full(self, scheduler, blocked):
+        for i in range(5):
+            assert scheduler.submit("question", f"U{i + 1}", "C1", lambda: None).accepted
+        admission = scheduler.submit("question", "U9", "C1", lambda: None)
+        assert not admission.accepted
+        assert scheduler.stats()["rejected"] == 1
+
+    def test_failures_release_the_slots(self, scheduler):
+        def fail():
+            raise Exception("warehouse suspended")
+
+        for _ in range(3):
+            scheduler.submit("question", "U1", "C1", fail)
+        done = threading.Event()
+        scheduler.submit("setup", "U2", "C1", done.set)
+        # the setup runs after all the questions
+        assert done.wait(5)
+        assert scheduler.stats()["failed"] == 3
+        assert scheduler.submit("question", "U1", "C1", lambda: None).accepted
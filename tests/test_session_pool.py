@@ -0,0 +1,166 @@
+import threading
+
+import pytest
+
+from handler_tasks.session_pool import SessionPool
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSession:
+    def __init__(self, id: int):
+        self.id = id
+        self.pings = 0
+        self.broken = False
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def check(session):
+    session.pings += 1
+    if session.broken:
+        raise ConnectionError("session expired")
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def opened():
+    return []
+
+
+@pytest.fixture
+def pool(clock, opened):
+    def factory():
+        opened.append(FakeSession(len(opened)))
+        return opened[-1]
+
+    return SessionPool(
+        factory,
+        size=2,
+        timeout=0.2,
+        keepalive=60,
+        max_lifetime=3600,
+        health_check=check,
+        clock=clock,
+    )
+
+
+class TestSessionPool:
+    def test_opens_on_demand_and_reuses(self, pool, opened):
+        with pool.session() as first:
+            pass
+        with pool.session() as second:
+            assert second is first
+        assert len(opened) == 1
+        assert pool.stats()["idle"] == 1
+
+    def test_concurrent_checkouts_get_their_own_session(self, pool, opened):
+        first = pool.checkout()
+        second = pool.checkout()
+        assert first is not second
+        stats = pool.stats()
+        assert stats["in_use"] == 2
+        assert stats["utilization"] == 1.0
+        pool.checkin(first)
+        pool.checkin(second)
+        assert pool.stats()["in_use"] == 0
+
+    def test_bounded_wait(self, pool):
+        pool.checkout()
+        second = pool.checkout()
+        with pytest.raises(TimeoutError):
+            pool.checkout(timeout=0.05)
+        assert pool.stats()["timeouts"] == 1
+
+        # a checkin hands the session to the waiting checkout
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.checkout(timeout=5)))
+        waiter.start()
+        pool.checkin(second)
+        waiter.join(5)
+        assert got == [second]
+
+    def test_stale_session_checked_on_checkout(self, pool, clock, opened):
+        with pool.session():
+            pass
+        clock.now = 30
+        with pool.session():
+            pass
+        assert opened[0].pings == 0
+
+        clock.now = 120
+        opened[0].broken = True
+        with pool.session() as session:
+            assert session is opened[1]
+        assert opened[0].closed
+
+    def test_failed_query_checks_the_session(self, pool, opened):
+        with pytest.raises(ValueError):
+            with pool.session():
+                raise ValueError("SQL compilation error")
+        # the session itself is fine, it stays in the pool
+        assert opened[0].pings == 1
+        assert not opened[0].closed
+
+        opened[0].broken = True
+        with pytest.raises(ValueError):
+            with pool.session():
+                raise ValueError("connection reset")
+        assert opened[0].closed
+        assert pool.stats()["open"] == 0
+
+    def test_keep_alive(self, pool, clock, opened):
+        first, second = pool.checkout(), pool.checkout()
+        pool.checkin(first)
+        pool.checkin(second)
+        clock.now = 90
+        second.broken = True
+        pool.keep_alive()
+        assert first.pings == 1
+        assert second.closed
+        assert pool.stats()["idle"] == 1
+
+        # pinged just now, not again
+        pool.keep_alive()
+        assert first.pings == 1
+
+    def test_max_lifetime(self, pool, clock, opened):
+        with pool.session():
+            clock.now = 4000
+        assert opened[0].closed
+        with pool.session() as session:
+            assert session is opened[1]
+
+    def test_open_error(self, clock):
+        def factory():
+            raise ConnectionError("no network")
+
+        pool = SessionPool(factory, size=1, timeout=0.1, keepalive=0, clock=clock)
+        with pytest.raises(Exception, match="no network"):
+            pool.checkout()
+        # the failed open does not hold a slot
+        with pytest.raises(Exception, match="no network"):
+            pool.checkout()
+
+    def test_close(self, pool, opened):
+        session = pool.checkout()
+        with pool.session():
+            pass
+        pool.close()
+        assert opened[1].closed
+        pool.checkin(session)
+        assert opened[0].closed
+        with pytest.raises(Exception, match="closed"):
+            pool.checkout()
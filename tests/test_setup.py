@@ -131,6 +131,23 @@ class TestSetup:
             "semantic_models/support_tickets_semantic_model.yaml" == stage_files[0].name
         )
 
+    def test_upload_unchanged_semantic_model(self, db_setup, root: Root):
+        db_name = "test_db"
+        schema_name = "data"
+        stage = root.databases[db_name].schemas[schema_name].stages["semantic_models"]
+
+        db_setup.upload_semantic_model(db_name, schema_name)
+        want = list(stage.list_files(pattern=".*.yaml"))
+
+        db_setup.upload_semantic_model(db_name, schema_name)
+        got = list(stage.list_files(pattern=".*.yaml"))
+
+        assert len(got) == 1
+        assert want[0].md5 == got[0].md5
+        assert want[0].md5 == db_setup.staged_semantic_model_md5(db_name, schema_name)
+        # not uploaded again
+        assert want[0].last_modified == got[0].last_modified
+
     def test_create_table(self, db_setup, root: Root):
         db_name = "test_db"
         schema_name = "data"
@@ -0,0 +1,110 @@
+import sys
+import subprocess
+
+import pandas as pd
+import pytest
+
+from handler_tasks.answer_cache import AnswerCache
+from utils.cache import LRUCache
+from utils.shared_store import SharedStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SharedStore(str(tmp_path / "store.sqlite"))
+    yield store
+    store.close()
+
+
+class TestSharedStore:
+    def test_put_get(self, store):
+        df = pd.DataFrame({"SERVICE_TYPE": ["Cellular"], "TICKET_COUNT": [3]})
+        assert store.put("results", ("DB", "SCHEMA", "SELECT 1"), (df, 1))
+        cached, total_rows = store.get("results", ("DB", "SCHEMA", "SELECT 1"))
+        assert cached.equals(df)
+        assert total_rows == 1
+        assert store.get("charts", ("DB", "SCHEMA", "SELECT 1")) is None
+
+    def test_wal_mode(self, store):
+        assert store._connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_ttl(self, store):
+        store.put("answers", "q", "a", ttl=-1)
+        assert store.get("answers", "q", "missing") == "missing"
+
+    def test_bounds(self, store):
+        for i in range(5):
+            store.put("charts", i, b"x" * 100, max_entries=3)
+        assert [store.get("charts", i) is not None for i in range(5)] == [
+            False,
+            False,
+            True,
+            True,
+            True,
+        ]
+        store.put("charts", "big", b"x" * 250, max_bytes=300)
+        assert store.get("charts", "big") is not None
+        assert store.get("charts", 4) is None
+
+    def test_delete_and_clear(self, store):
+        store.put("config", "dbinfo", {"db_name": "demo_db"})
+        store.put("answers", "q", "a")
+        assert store.delete("answers", "q")
+        assert store.get("answers", "q") is None
+        store.clear("config")
+        assert store.get("config", "dbinfo") is None
+
+    def test_shared_by_processes(self, store):
+        code = (
+            "import sys; from utils.shared_store import SharedStore;"
+            "SharedStore(sys.argv[1]).put('config', 'dbinfo', {'db_name': 'other_db'})"
+        )
+        subprocess.run([sys.executable, "-c", code, store.path], check=True)
+        assert store.get("config", "dbinfo") == {"db_name": "other_db"}
+
+
+class TestSharedCache:
+    def test_write_through_and_read_back(self, store):
+        worker_1, worker_2 = LRUCache(max_entries=4), LRUCache(max_entries=4)
+        worker_1.share(store, "answers")
+        worker_2.share(store, "answers")
+        worker_1.put(("model", "v1", "how many tickets"), {"answer": 42})
+
+        assert worker_2.get(("model", "v1", "how many tickets")) == {"answer": 42}
+        assert worker_2.stats()["shared_hits"] == 1
+        # now cached locally too
+        assert worker_2.get(("model", "v1", "how many tickets")) == {"answer": 42}
+        assert worker_2.stats()["hits"] == 1
+
+        worker_2.invalidate(("model", "v1", "how many tickets"))
+        worker_1.clear()
+        assert worker_1.get(("model", "v1", "how many tickets")) is None
+        assert worker_1.stats()["misses"] == 1
+
+    def test_read_back_keeps_the_stored_expiry(self, store):
+        now = [0.0]
+        worker = LRUCache(max_entries=4, ttl=100, clock=lambda: now[0])
+        worker.share(store, "answers")
+        # stored 90s ago by another worker, 10s left
+        store.put("answers", "q", "a", ttl=10)
+
+        assert worker.get("q") == "a"
+        now[0] = 11
+        store.delete("answers", "q")
+        assert worker.get("q") is None
+        assert worker.stats()["expirations"] == 1
+
+    def test_invalidate_where(self, store):
+        worker_1, worker_2 = AnswerCache(), AnswerCache()
+        worker_1.share(store)
+        worker_2.share(store)
+        model = "@demo_db.data.semantic_models/model.yaml"
+        other_model = "@other_db.data.semantic_models/model.yaml"
+        worker_1.put(model, "v1", "how many tickets", {"answer": 42})
+        worker_1.put(other_model, "v1", "how many tickets", {"answer": 1})
+
+        worker_2.set_semantic_model(model, "name: model")
+        # not loaded back from the store on the next local miss
+        assert worker_2.get(model, "v1", "how many tickets") is None
+        assert store.get("answers", (model, "v1", "how many tickets")) is None
+        assert worker_2.get(other_model, "v1", "how many tickets") == {"answer": 1}
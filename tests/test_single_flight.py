@@ -0,0 +1,172 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from handler_tasks.cortalyst import Cortlayst
+from utils.single_flight import SingleFlight
+
+
+@pytest.fixture
+def private_key_file(tmp_path):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path = tmp_path / "rsa_key.p8"
+    path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    return str(path)
+
+
+class FakeStream:
+    """
+    Streamed Analyst response, held back until released
+    """
+
+    def __init__(self, release: threading.Event):
+        self.release = release
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def iter_lines(self, decode_unicode=True):
+        yield "event: message.content.delta"
+        yield 'data: {"index": 0, "type": "text", "text_delta": "Interpretation"}'
+        yield ""
+        self.release.wait(5)
+        yield "event: message.content.delta"
+        yield f"data: {json.dumps({'index': 1, 'type': 'sql', 'statement_delta': 'SELECT 1'})}"
+        yield ""
+
+
+def in_threads(n, fn):
+    results = [None] * n
+    start = threading.Barrier(n)
+
+    def run(i):
+        start.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_the_result(self):
+        flight = SingleFlight()
+        calls = []
+
+        def slow_answer():
+            calls.append(1)
+            time.sleep(0.2)
+            return "answer"
+
+        threads, results = in_threads(5, lambda: flight.do("q", slow_answer))
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert sorted(shared for _, shared in results) == [False] + [True] * 4
+        assert {result for result, _ in results} == {"answer"}
+        assert flight.stats() == {"leaders": 1, "followers": 4, "in_flight": 0}
+
+    def test_errors_are_shared_and_not_remembered(self):
+        flight = SingleFlight()
+        future, leader = flight.begin("q")
+        follower, _ = flight.begin("q")
+        flight.end("q", error=ValueError("warehouse suspended"))
+
+        with pytest.raises(ValueError):
+            follower.result()
+        assert flight.do("q", lambda: "retried") == ("retried", False)
+
+
+class TestCortlaystInFlight:
+    def test_same_question_streams_once(self, private_key_file, monkeypatch):
+        cortalyst = Cortlayst(
+            account="account",
+            user="demo",
+            private_key_file_path=private_key_file,
+            host="localhost",
+            cache=None,
+        )
+        release = threading.Event()
+        posts = []
+
+        def post(semantic_model_file, question, stream=False, parent=None):
+            posts.append(question)
+            return FakeStream(release), "req-1"
+
+        monkeypatch.setattr(cortalyst, "_post", post)
+
+        threads, results = in_threads(
+            3, lambda: list(cortalyst.stream_answer("How many tickets?"))
+        )
+        # the followers ask the same question, differently written
+        follower = threading.Thread(
+            target=lambda: results.append(
+                list(cortalyst.stream_answer("how many   tickets"))
+            )
+        )
+        while not posts:
+            time.sleep(0.01)
+        follower.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads + [follower]:
+            thread.join(5)
+
+        assert posts == ["How many tickets?"]
+        for events in results:
+            assert {"type": "sql", "statement": "SELECT 1"} in events
+            assert events[-1]["message"]["content"][1]["statement"] == "SELECT 1"
+        assert sum(events[-1].get("shared", False) for events in results) == 3
+
+
+class TestCortlaystStream:
+    def test_utf8_event_stream(self, private_key_file, monkeypatch):
+        cortalyst = Cortlayst(
+            account="account",
+            user="demo",
+            private_key_file_path=private_key_file,
+            host="localhost",
+            cache=None,
+        )
+        body = (
+            "event: message.content.delta\n"
+            'data: {"index": 0, "type": "text", "text_delta": "Tickets of the café"}\n'
+            "\n"
+            "event: message.content.delta\n"
+            'data: {"index": 1, "type": "sql", "statement_delta": "SELECT \'café\'"}\n'
+            "\n"
+        )
+
+        def post(semantic_model_file, question, stream=False, parent=None):
+            # without a charset, as Cortex Analyst sends it
+            resp = requests.Response()
+            resp.status_code = 200
+            resp.headers["Content-Type"] = "text/event-stream"
+            resp.raw = io.BytesIO(body.encode("utf-8"))
+            return resp, "req-1"
+
+        monkeypatch.setattr(cortalyst, "_post", post)
+
+        done = list(cortalyst.stream_answer("Tickets of the café?"))[-1]
+        assert done["type"] == "done"
+        assert [
+            content.get("text") or content.get("statement")
+            for content in done["message"]["content"]
+        ] == ["Tickets of the café", "SELECT 'café'"]
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from handler_tasks.stage_files import (
+    copy_files_batches,
+    copy_files_sql,
+    parse_last_modified,
+    stale_files,
+)
+
+
+def staged_file(name, modified: datetime):
+    return SimpleNamespace(
+        name=f"support_tickets_data/{name}",
+        last_modified=modified.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+    )
+
+
+class TestStaleFiles:
+    def test_parse_last_modified(self):
+        want = datetime(2024, 10, 15, 10, 0, 0, tzinfo=timezone.utc).timestamp()
+        assert parse_last_modified("Tue, 15 Oct 2024 10:00:00 GMT") == want
+
+    def test_only_files_older_than_cutoff(self):
+        now = datetime.now(timezone.utc)
+        files = (
+            staged_file(f"tickets_{i}.csv", now - timedelta(days=i % 14))
+            for i in range(2500)
+        )
+
+        got = list(stale_files(files, now - timedelta(days=7, hours=1)))
+
+        assert got == [f"tickets_{i}.csv" for i in range(2500) if i % 14 > 7]
+
+
+class TestCopyFilesBatches:
+    def test_bounded_by_file_count(self):
+        names = [f"tickets_{i}.csv" for i in range(2500)]
+
+        batches = list(copy_files_batches(names, max_files=1000))
+
+        assert [len(batch) for batch in batches] == [1000, 1000, 500]
+        assert batches[0][0] == "'tickets_0.csv'"
+
+    def test_bounded_by_size(self):
+        names = [f"{i:04d}.csv" for i in range(100)]
+
+        batches = list(copy_files_batches(names, max_chars=100))
+
+        # each quoted name and its separator takes 11 characters
+        assert all(len(",".join(batch)) <= 100 for batch in batches)
+        assert sum(len(batch) for batch in batches) == 100
+        assert len(batches) == 12
+
+    def test_quotes_names(self):
+        (batch,) = copy_files_batches(["it's.csv"])
+        sql = copy_files_sql("db.data.older", "db.data.tickets", batch)
+        assert "FILES=('it\\'s.csv')" in sql
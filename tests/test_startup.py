@@ -0,0 +1,115 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import types
+
+import pytest
+
+from handler_tasks.db_setup import DBSetup
+from utils.warmup import WarmUp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# time to import app.py, over it the cold start regressed
+STARTUP_BUDGET_SECS = float(os.getenv("STARTUP_BUDGET_SECS", 5))
+
+# imports app.py as the bot would and reports the time it took and the heavy
+# modules it loaded, the Bolt App does not call Slack on creation
+_IMPORT_APP = """
+import functools, json, sys, time
+import slack_bolt
+slack_bolt.App = functools.partial(slack_bolt.App, token_verification_enabled=False)
+start = time.perf_counter()
+import app
+secs = time.perf_counter() - start
+heavy = ("altair", "vl_convert", "snowflake.core", "snowflake.snowpark")
+print(json.dumps({
+    "secs": secs,
+    "loaded": [name for name in heavy if name in sys.modules],
+    "session_ready": app.session.ready,
+}))
+"""
+
+
+class TestWarmUp:
+    def test_creates_in_background(self):
+        release = threading.Event()
+        warmup = WarmUp(lambda: release.wait() and {"account": "acme"})
+        warmup.start()
+        assert not warmup.ready
+        release.set()
+        assert warmup.get(timeout=5) == {"account": "acme"}
+        assert warmup.ready
+
+    def test_delegates_attributes(self):
+        warmup = WarmUp(lambda: {"account": "acme"})
+        # not started, the first access opens it
+        assert list(warmup.keys()) == ["account"]
+        assert warmup.ready
+
+    def test_delegates_private_attributes(self):
+        session = types.SimpleNamespace(_conn=types.SimpleNamespace(_conn="connection"))
+        warmup = WarmUp(lambda: session)
+        assert warmup._conn._conn == "connection"
+        with pytest.raises(AttributeError):
+            warmup.__deepcopy__
+
+    def test_db_setup_root(self, monkeypatch):
+        class Root:
+            # as snowflake.core's, which reads the connection of the session
+            def __init__(self, session):
+                self.connection = session._conn._conn
+
+        snowflake_core = types.ModuleType("snowflake.core")
+        snowflake_core.Root = Root
+        monkeypatch.setitem(sys.modules, "snowflake.core", snowflake_core)
+        session = types.SimpleNamespace(_conn=types.SimpleNamespace(_conn="connection"))
+        db_setup = DBSetup(session=WarmUp(lambda: session))
+        assert db_setup.root.connection == "connection"
+
+    def test_created_once(self):
+        calls = []
+        warmup = WarmUp(lambda: calls.append(1) or object())
+        warmup.start()
+        warmup.start()
+        assert warmup.get(timeout=5) is warmup.get(timeout=5)
+        assert calls == [1]
+
+    def test_error(self):
+        def fail():
+            raise ConnectionError("no network")
+
+        errors = []
+        warmup = WarmUp(fail)
+        warmup.add_done_callback(lambda future: errors.append(future.exception()))
+        with pytest.raises(ConnectionError):
+            warmup.get(timeout=5)
+        assert not warmup.ready
+        assert isinstance(errors[0], ConnectionError)
+
+
+class TestStartup:
+    def test_import_app(self, tmp_path):
+        env = {
+            **os.environ,
+            "PYTHONPATH": ROOT,
+            "SLACK_BOT_TOKEN": "xoxb-startup",
+            "LAZY_STARTUP": "true",
+        }
+        env.pop("METRICS_PORT", None)
+        result = subprocess.run(
+            [sys.executable, "-c", _IMPORT_APP],
+            cwd=tmp_path,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        assert result.returncode == 0, result.stderr
+        startup = json.loads(result.stdout.splitlines()[-1])
+        print(f"app.py imported in {startup['secs']:.3f}s")
+        assert startup["loaded"] == []
+        assert not startup["session_ready"]
+        assert startup["secs"] < STARTUP_BUDGET_SECS
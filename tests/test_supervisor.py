@@ -0,0 +1,29 @@
+import sys
+import time
+
+from supervisor import Supervisor
+
+
+class TestSupervisor:
+    def test_restarts_and_stops_workers(self):
+        # the first worker exits right away, the second one keeps running
+        code = "import os, sys, time; sys.exit(1) if os.environ['WORKER_ID'] == '0' else time.sleep(60)"
+        supervisor = Supervisor(
+            [sys.executable, "-c", code],
+            workers=2,
+            env={"METRICS_PORT": "9100"},
+            max_backoff=0,
+            stop_timeout=5,
+        )
+        assert supervisor.worker_env(1)["METRICS_PORT"] == "9101"
+        supervisor.start()
+        deadline = time.monotonic() + 10
+        while supervisor.restarts < 2 and time.monotonic() < deadline:
+            supervisor.poll()
+            time.sleep(0.05)
+        assert supervisor.restarts >= 2
+
+        running = supervisor._processes[1]
+        assert running.poll() is None
+        supervisor.stop()
+        assert running.poll() is not None
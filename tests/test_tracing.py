@@ -0,0 +1,102 @@
+import json
+import threading
+
+import pytest
+
+from handler_tasks.scheduler import CommandScheduler
+from utils.tracing import NOOP_SPAN, JsonLinesExporter, RingBufferExporter, Tracer
+
+
+@pytest.fixture
+def buffer():
+    return RingBufferExporter(100)
+
+
+@pytest.fixture
+def tracer(buffer):
+    return Tracer([buffer])
+
+
+class TestTracer:
+    def test_disabled_is_noop(self):
+        tracer = Tracer()
+        with tracer.span("question") as span:
+            span.set(request_id="req-1")
+            tracer.annotate(query_id="q-1")
+        assert span is NOOP_SPAN
+        assert tracer.current() is None
+
+    def test_nested_spans(self, tracer, buffer):
+        with tracer.span("question", channel="C1") as question:
+            with tracer.span("query"):
+                tracer.annotate(query_id="q-1")
+        spans = {span["name"]: span for span in buffer.spans()}
+
+        assert spans["query"]["trace_id"] == question.trace_id
+        assert spans["query"]["parent_id"] == question.span_id
+        assert spans["query"]["attributes"] == {"query_id": "q-1"}
+        assert spans["question"]["parent_id"] is None
+        assert spans["question"]["duration"] >= spans["query"]["duration"]
+        assert tracer.current() is None
+
+    def test_errors_recorded(self, tracer, buffer):
+        with pytest.raises(ValueError):
+            with tracer.span("analyst.request"):
+                raise ValueError("warehouse suspended")
+        assert buffer.spans()[0]["error"] == "ValueError: warehouse suspended"
+
+    def test_explicit_parent(self, tracer, buffer):
+        envelope = tracer.start("slack.envelope")
+        envelope.end()
+        # e.g. continued by a handler on another thread
+        thread = threading.Thread(
+            target=lambda: tracer.start("command", parent=envelope).end()
+        )
+        thread.start()
+        thread.join()
+        command = buffer.spans(envelope.trace_id)[-1]
+        assert command["name"] == "command"
+        assert command["parent_id"] == envelope.span_id
+
+    def test_scheduled_work_continues_trace(self, tracer, buffer):
+        scheduler = CommandScheduler(workers=1)
+        done = threading.Event()
+
+        def answer():
+            with tracer.span("question"):
+                pass
+            done.set()
+
+        with tracer.span("command") as command:
+            scheduler.submit("question", "U1", "C1", answer)
+        assert done.wait(5)
+        scheduler.shutdown()
+
+        question = buffer.spans(command.trace_id)[-1]
+        assert question["name"] == "question"
+        assert question["parent_id"] == command.span_id
+
+    def test_slowest(self, buffer):
+        tracer = Tracer([buffer])
+        for duration in (0.1, 3.0, 0.5):
+            with tracer.span("question"):
+                tracer.start("query").end()
+            buffer._spans[-1]["duration"] = duration
+
+        slowest = buffer.slowest("question", limit=2)
+        assert [trace[-1]["duration"] for trace in slowest] == [3.0, 0.5]
+        assert [span["name"] for span in slowest[0]] == ["query", "question"]
+
+    def test_json_lines_exporter(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        exporter = JsonLinesExporter(str(path))
+        tracer = Tracer([exporter])
+        with tracer.span("question"):
+            with tracer.span("analyst.request", request_id="req-1"):
+                pass
+        exporter.close()
+
+        spans = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [span["name"] for span in spans] == ["analyst.request", "question"]
+        assert spans[0]["attributes"] == {"request_id": "req-1"}
+        assert spans[0]["trace_id"] == spans[1]["trace_id"]
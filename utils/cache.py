@@ -0,0 +1,179 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """
+    A thread safe in-process cache with least recently used eviction and an
+    optional time to live for its entries. The cache can be bounded by the number
+    of entries, by a memory budget in bytes or both. Hit, miss and eviction
+    counters are kept so that the cache can be sized from its stats.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = 128,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = sys.getsizeof,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param max_entries: Maximum number of entries kept, None for no limit and 0 disables the cache.
+        :param ttl: Seconds after which an entry expires, None to never expire.
+        :param max_bytes: Memory budget of the cache in bytes, None for no limit.
+        :param sizeof: Function returning the size in bytes of a cached value.
+        :param clock: Monotonic clock used for expiry, mostly useful for tests.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared_hits = 0
+        self._store = None
+        self._namespace = None
+
+    def share(self, store, namespace: str):
+        """
+        Back the cache with a SharedStore, so that the processes of the bot share
+        their entries: a local miss is looked up in the store and the entries put
+        are written through to it, under the same bounds and time to live
+        """
+        self._store = store
+        self._namespace = namespace
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return entry[1]
+        if self._store is not None:
+            entry = self._store.get_entry(self._namespace, key)
+            if entry is not None:
+                value, expires_at = entry
+                # the local copy expires with the stored entry, not a time to live later
+                stored_at = None
+                if self.ttl is not None and expires_at is not None:
+                    stored_at = self._clock() - (self.ttl - (expires_at - time.time()))
+                self._put(key, value, stored_at)
+                if count:
+                    with self._lock:
+                        self.shared_hits += 1
+                return value
+        if count:
+            with self._lock:
+                self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any) -> bool:
+        """
+        Cache the value, evicting the least recently used entries to make room
+        :return: False when the value was not cached e.g. larger than the memory budget
+        """
+        if not self._put(key, value):
+            return False
+        if self._store is not None:
+            self._store.put(
+                self._namespace,
+                key,
+                value,
+                ttl=self.ttl,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+            )
+        return True
+
+    def _put(
+        self, key: Hashable, value: Any, stored_at: Optional[float] = None
+    ) -> bool:
+        if self.max_entries == 0:
+            return False
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (
+                stored_at if stored_at is not None else self._clock(),
+                value,
+                size,
+            )
+            self._bytes += size
+            while (
+                self.max_entries is not None and len(self._entries) > self.max_entries
+            ) or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def invalidate(self, key: Hashable) -> bool:
+        if self._store is not None:
+            self._store.delete(self._namespace, key)
+        with self._lock:
+            return self._remove(key)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Drop all the entries whose key matches the predicate, from the SharedStore too
+        :return: the number of entries dropped
+        """
+        if self._store is not None:
+            self._store.delete_where(self._namespace, predicate)
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "shared_hits": self.shared_hits,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _remove(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[2]
+        return True
+
+    def _expired(self, entry: Tuple[float, Any, int]) -> bool:
+        return self.ttl is not None and self._clock() - entry[0] > self.ttl
@@ -0,0 +1,126 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+logger = logging.getLogger("dag")
+
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class StepResult(NamedTuple):
+    status: str
+    seconds: float = 0.0
+    error: Optional[BaseException] = None
+
+
+def summary(results: Dict[str, StepResult]) -> str:
+    """
+    One line summary of the status and timing of the steps
+    """
+    return ", ".join(
+        f"{name} {result.status} in {result.seconds:.2f}s"
+        for name, result in results.items()
+    )
+
+
+class StepFailed(Exception):
+    """
+    Raised by TaskGraph.run when one or more steps failed, carries all the step results
+    """
+
+    def __init__(self, results: Dict[str, StepResult]):
+        self.results = results
+        failed = {n: r.error for n, r in results.items() if r.status == FAILED}
+        super().__init__(
+            ",".join(f"{name}: {error}" for name, error in failed.items())
+        )
+
+
+class TaskGraph(object):
+    """
+    A small executor of dependent steps. Steps whose dependencies are all done run
+    concurrently on a thread pool, a failed step cancels all the steps depending on it.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._steps: Dict[str, Callable[[], Any]] = {}
+        self._depends_on: Dict[str, List[str]] = {}
+        self._skipped = set()
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        *args,
+        depends_on: Iterable[str] = (),
+        skip: bool = False,
+        **kwargs,
+    ) -> "TaskGraph":
+        """
+        Add a step calling fn(*args, **kwargs) once all the steps it depends on are
+        done. A skipped step is not run, but still satisfies its dependents.
+        """
+        if name in self._steps:
+            raise ValueError(f"Duplicate step {name}")
+        depends_on = list(depends_on)
+        for dependency in depends_on:
+            if dependency not in self._steps:
+                raise ValueError(f"Step {name} depends on unknown step {dependency}")
+        self._steps[name] = lambda: fn(*args, **kwargs)
+        self._depends_on[name] = depends_on
+        if skip:
+            self._skipped.add(name)
+        return self
+
+    def run(self) -> Dict[str, StepResult]:
+        """
+        Run all the steps, dependencies first.
+        :return: the result and timing of each step, in the order they were added
+        :raises StepFailed: when any of the steps failed
+        """
+        results: Dict[str, StepResult] = {}
+        pending = dict(self._depends_on)
+        running: Dict[Future, str] = {}
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="dag"
+        ) as pool:
+            while pending or running:
+                for name, depends_on in list(pending.items()):
+                    statuses = [results.get(d, StepResult(None)).status for d in depends_on]
+                    if any(status in (FAILED, CANCELLED) for status in statuses):
+                        logger.debug(f"Cancelling step {name}")
+                        results[name] = StepResult(CANCELLED)
+                        del pending[name]
+                    elif all(status in (DONE, SKIPPED) for status in statuses):
+                        del pending[name]
+                        if name in self._skipped:
+                            results[name] = StepResult(SKIPPED)
+                            continue
+                        running[pool.submit(self._timed, self._steps[name])] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    logger.debug(f"Step {name} {results[name].status} in {results[name].seconds:.2f}s")
+
+        results = {name: results[name] for name in self._steps}
+        if any(result.status == FAILED for result in results.values()):
+            raise StepFailed(results)
+        return results
+
+    @staticmethod
+    def _timed(step: Callable[[], Any]) -> StepResult:
+        start = time.perf_counter()
+        try:
+            step()
+            return StepResult(DONE, time.perf_counter() - start)
+        except Exception as e:
+            return StepResult(FAILED, time.perf_counter() - start, e)
@@ -7,6 +7,7 @@ import base64
 import hashlib
 import logging
 import os
+import threading
 
 # This class relies on the PyJWT module (https://pypi.org/project/PyJWT/).
 import jwt
@@ -50,6 +51,9 @@ class JWTGenerator(object):
 
     LIFETIME = timedelta(minutes=59)  # The tokens will have a 59 minute lifetime
     RENEWAL_DELTA = timedelta(minutes=54)  # Tokens will be renewed after 54 minutes
+    REFRESH_AHEAD = timedelta(minutes=1)  # The background refresher renews this early
+    REFRESH_RETRY = timedelta(seconds=30)  # and retries after this when renewal failed
+    REFRESH_MIN_WAIT = timedelta(seconds=1)  # and never renews more often than this
     ALGORITHM = "RS256"  # Tokens will be generated using RSA with SHA256
 
     def __init__(
@@ -88,6 +92,10 @@ class JWTGenerator(object):
         self.private_key_file_path = private_key_file_path
         self.renew_time = datetime.now(timezone.utc)
         self.token = None
+        # Only one thread signs a token at a time, the others wait for it.
+        self._lock = threading.Lock()
+        self._stop_refresher = threading.Event()
+        self._refresher = None
 
         # Load the private key from the specified file.
         with open(self.private_key_file_path, "rb") as pem_in:
@@ -103,6 +111,9 @@ class JWTGenerator(object):
                     pemlines, get_private_key_passphrase().encode(), default_backend()
                 )
 
+        # The public key fingerprint of the issuer in the claims never changes.
+        self.public_key_fp = self.calculate_public_key_fingerprint(self.private_key)
+
     def prepare_account_name_for_jwt(self, raw_account: Text) -> Text:
         """
         Prepare the account identifier for use in the JWT.
@@ -127,56 +138,92 @@ class JWTGenerator(object):
     def generate_token(self) -> Text:
         """
         Generates a new JWT. If a JWT has been already been generated earlier, return the previously generated token unless the
-        specified renewal time has passed.
+        specified renewal time has passed. Concurrent callers finding the token due for renewal wait for a single renewal.
         :return: the new token
         """
-        now = datetime.now(timezone.utc)  # Fetch the current time
-
-        # If the token has expired or doesn't exist, regenerate the token.
-        if self.token is None or self.renew_time <= now:
-            logger.info(
-                "Generating a new token because the present time (%s) is later than the renewal time (%s)",
-                now,
-                self.renew_time,
-            )
-            # Calculate the next time we need to renew the token.
-            self.renew_time = now + self.renewal_delay
-
-            # Prepare the fields for the claims.
-            # Generate the public key fingerprint for the issuer in the claims.
-            public_key_fp = self.calculate_public_key_fingerprint(self.private_key)
-
-            # Create our claims
-            claims = {
-                # Set the issuer to the fully qualified username concatenated with the public key fingerprint.
-                ISSUER: self.qualified_username + "." + public_key_fp,
-                # Set the subject to the fully qualified username.
-                SUBJECT: self.qualified_username,
-                # Set the issue time to now.
-                ISSUE_TIME: now,
-                # Set the expiration time, based on the lifetime specified for this object.
-                EXPIRE_TIME: now + self.lifetime,
-            }
-
-            # Regenerate the actual token
-            token = jwt.encode(
-                claims, key=self.private_key, algorithm=JWTGenerator.ALGORITHM
-            )
-            # If you are using a version of PyJWT prior to 2.0, jwt.encode returns a byte string, rather than a string.
-            # If the token is a byte string, convert it to a string.
-            if isinstance(token, bytes):
-                token = token.decode("utf-8")
-            self.token = token
-            logger.info(
-                "Generated a JWT with the following claims: %s",
-                jwt.decode(
-                    self.token,
-                    key=self.private_key.public_key(),
-                    algorithms=[JWTGenerator.ALGORITHM],
-                ),
-            )
-
-        return self.token
+        # The renewal time is read before the token, the renewal updates the token first.
+        renew_time = self.renew_time
+        token = self.token
+        if token is not None and datetime.now(timezone.utc) < renew_time:
+            return token
+
+        with self._lock:
+            now = datetime.now(timezone.utc)  # Fetch the current time
+            # Another thread may have renewed the token while this one waited.
+            if self.token is None or self.renew_time <= now:
+                logger.info(
+                    "Generating a new token because the present time (%s) is later than the renewal time (%s)",
+                    now,
+                    self.renew_time,
+                )
+                self._renew(now)
+            return self.token
+
+    def _renew(self, now: datetime):
+        """
+        Signs a new token, the caller holds the lock.
+        """
+        # Create our claims
+        claims = {
+            # Set the issuer to the fully qualified username concatenated with the public key fingerprint.
+            ISSUER: self.qualified_username + "." + self.public_key_fp,
+            # Set the subject to the fully qualified username.
+            SUBJECT: self.qualified_username,
+            # Set the issue time to now.
+            ISSUE_TIME: now,
+            # Set the expiration time, based on the lifetime specified for this object.
+            EXPIRE_TIME: now + self.lifetime,
+        }
+
+        # Regenerate the actual token
+        token = jwt.encode(claims, key=self.private_key, algorithm=JWTGenerator.ALGORITHM)
+        # If you are using a version of PyJWT prior to 2.0, jwt.encode returns a byte string, rather than a string.
+        # If the token is a byte string, convert it to a string.
+        if isinstance(token, bytes):
+            token = token.decode("utf-8")
+        self.token = token
+        # Calculate the next time we need to renew the token.
+        self.renew_time = now + self.renewal_delay
+        logger.debug("Generated a JWT with the following claims: %s", claims)
+
+    def start_refresher(self):
+        """
+        Starts a daemon thread renewing the token ahead of its renewal time, so that
+        generate_token never has to sign one while serving a request.
+        """
+        if self._refresher is not None:
+            return
+        self._stop_refresher.clear()
+        self._refresher = threading.Thread(
+            target=self._refresh, name="jwt_refresher", daemon=True
+        )
+        self._refresher.start()
+
+    def stop_refresher(self):
+        if self._refresher is None:
+            return
+        self._stop_refresher.set()
+        self._refresher.join()
+        self._refresher = None
+
+    def _refresh(self):
+        wait = timedelta(0)
+        while not self._stop_refresher.wait(wait.total_seconds()):
+            try:
+                with self._lock:
+                    now = datetime.now(timezone.utc)
+                    if self.token is None or self.renew_time - self.REFRESH_AHEAD <= now:
+                        logger.debug("Renewing the token ahead of %s", self.renew_time)
+                        self._renew(now)
+                # a renewal delay within REFRESH_AHEAD would otherwise renew in a
+                # tight loop
+                wait = max(
+                    self.renew_time - self.REFRESH_AHEAD - datetime.now(timezone.utc),
+                    self.REFRESH_MIN_WAIT,
+                )
+            except Exception as e:
+                logger.error(f"Error renewing the token,{e}")
+                wait = self.REFRESH_RETRY
 
     def calculate_public_key_fingerprint(self, private_key: Text) -> Text:
         """
@@ -0,0 +1,227 @@
+import bisect
+import contextlib
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("metrics")
+
+# seconds, from a cached answer up to a long warehouse query
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_DISABLED = contextlib.nullcontext()
+
+
+class Histogram:
+    """
+    Thread-safe cumulative histogram with fixed buckets, as Prometheus exposes them
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """
+        :return: the cumulative count of each bucket (and +Inf), the sum and the count
+        """
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, running = [], 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total, running
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics: "Metrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.metrics.count("stage_errors", stage=self.stage)
+        return False
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+        + "}"
+    )
+
+
+class Metrics:
+    """
+    Latency histograms per pipeline stage, counters and gauges collected on scrape,
+    exposed in the Prometheus text format. Until enabled every call is a no-op, the
+    stage timers are a shared null context.
+    """
+
+    def __init__(self, namespace: str = "demo_mate", buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._collectors: List[Tuple[str, str, Sequence[str], Callable[[], Dict]]] = []
+
+    def enable(self):
+        self.enabled = True
+
+    def stage(self, stage: str):
+        """
+        Context manager timing a stage e.g. `with metrics.stage("query"): ...`,
+        failures are also counted
+        """
+        if not self.enabled:
+            return _DISABLED
+        return _StageTimer(self, stage)
+
+    def observe(self, stage: str, seconds: float):
+        if not self.enabled:
+            return
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(stage, Histogram(self.buckets))
+        histogram.observe(seconds)
+
+    def count(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def collect(
+        self,
+        name: str,
+        help: str,
+        fn: Callable[[], Dict],
+        labels: Sequence[str] = (),
+    ):
+        """
+        Register gauges read on each scrape, fn returns the value of each label
+        value (or tuple of label values) e.g. the stats of a cache
+        """
+        self._collectors.append((name, help, tuple(labels), fn))
+
+    def render(self) -> str:
+        """
+        The metrics in the Prometheus text exposition format
+        """
+        ns = self.namespace
+        lines = [
+            f"# HELP {ns}_stage_seconds Latency of the request pipeline stages.",
+            f"# TYPE {ns}_stage_seconds histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            counters = sorted(self._counters.items())
+        for stage, histogram in stages:
+            cumulative, total, count = histogram.snapshot()
+            for bound, bucket_count in zip(
+                [*histogram.buckets, "+Inf"], cumulative
+            ):
+                lines.append(
+                    f'{ns}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {bucket_count}'
+                )
+            lines.append(f'{ns}_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{ns}_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {ns}_{name}_total counter")
+                typed.add(name)
+            lines.append(
+                f"{ns}_{name}_total{_labels([k for k, _ in labels], [v for _, v in labels])} {value}"
+            )
+
+        for name, help, label_names, fn in self._collectors:
+            try:
+                values = fn()
+            except Exception as e:
+                logger.warning(f"Error collecting {name},{e}")
+                continue
+            lines.append(f"# HELP {ns}_{name} {help}")
+            lines.append(f"# TYPE {ns}_{name} gauge")
+            for label_values, value in values.items():
+                if not isinstance(label_values, tuple):
+                    label_values = (label_values,)
+                lines.append(f"{ns}_{name}{_labels(label_names, label_values)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(
+        self,
+        port: int,
+        host: str = "127.0.0.1",
+        routes: Optional[Dict[str, Callable[[], Any]]] = None,
+    ) -> ThreadingHTTPServer:
+        """
+        Enable the metrics and serve them on http://host:port/metrics from a daemon thread
+        :param routes: Other paths served as the JSON of what their callable returns.
+        """
+        self.enable()
+        metrics = self
+        routes = routes or {}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    body = metrics.render().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4"
+                elif path in routes:
+                    body = json.dumps(routes[path](), default=str).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(
+            target=server.serve_forever, name="metrics", daemon=True
+        ).start()
+        logger.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+        return server
+
+
+metrics = Metrics()
@@ -0,0 +1,266 @@
+import os
+import ast
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+logger = logging.getLogger("shared_store")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+
+class SharedStore:
+    """
+    Key value store shared by the processes of one host, a SQLite database in WAL
+    mode so that the readers never block the writer. The entries are grouped by
+    namespace, each optionally bounded by entries and bytes, the oldest stored
+    going first, and expire after their time to live.
+
+    The values are pickled, the file must only be writable by the bot.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        """
+        :param path: The SQLite database file, created when missing.
+        :param busy_timeout: Seconds to wait for the write lock held by another process.
+        """
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # a connection per thread, a sqlite3 connection is not to be shared
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            # durable enough for caches and settings, the last commits may be lost
+            # on a power failure but the database is never corrupted
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return repr(key)
+
+    def get(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        entry = self.get_entry(namespace, key)
+        return entry[0] if entry is not None else default
+
+    def get_entry(
+        self, namespace: str, key: Hashable
+    ) -> Optional[Tuple[Any, Optional[float]]]:
+        """
+        :return: the value and the time.time() it expires at, None when missing
+        """
+        try:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+                    (namespace, self._key(key)),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading {namespace} from the shared store,{e}")
+            return None
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        try:
+            return pickle.loads(row[0]), row[1]
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable {namespace} entry,{e}")
+            return None
+
+    def put(
+        self,
+        namespace: str,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> bool:
+        """
+        Store the value, dropping the oldest entries of the namespace over its bounds
+        :return: False when the value could not be stored
+        """
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.debug(f"Not storing an unpicklable {namespace} value,{e}")
+            return False
+        now = time.time()
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        namespace,
+                        self._key(key),
+                        data,
+                        len(data),
+                        now,
+                        now + ttl if ttl is not None else None,
+                    ),
+                )
+                self._evict(connection, namespace, now, max_entries, max_bytes)
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"Error writing {namespace} to the shared store,{e}")
+            return False
+
+    def update(
+        self,
+        namespace: str,
+        key: Hashable,
+        fn: Callable[[Any], Any],
+        ttl: Optional[float] = None,
+    ) -> Any:
+        """
+        Read, update and write back the value in one transaction, so that the
+        concurrent updates of the other processes are not lost. `fn` is given the
+        current value, None when missing, and returns the new one.
+        :return: the new value, None when it could not be stored
+        """
+        now = time.time()
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute(
+                    "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+                    (namespace, self._key(key)),
+                ).fetchone()
+                current = None
+                if row is not None and (row[1] is None or row[1] > now):
+                    current = pickle.loads(row[0])
+                value = fn(current)
+                data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        namespace,
+                        self._key(key),
+                        data,
+                        len(data),
+                        now,
+                        now + ttl if ttl is not None else None,
+                    ),
+                )
+            return value
+        except (sqlite3.Error, pickle.PickleError) as e:
+            logger.warning(f"Error updating {namespace} in the shared store,{e}")
+            return None
+
+    @staticmethod
+    def _evict(connection, namespace, now, max_entries, max_bytes):
+        connection.execute(
+            "DELETE FROM entries WHERE namespace = ? AND expires_at <= ?",
+            (namespace, now),
+        )
+        if max_entries is not None:
+            connection.execute(
+                """DELETE FROM entries WHERE namespace = ? AND key IN (
+    SELECT key FROM entries WHERE namespace = ?
+    ORDER BY stored_at DESC LIMIT -1 OFFSET ?
+)""",
+                (namespace, namespace, max_entries),
+            )
+        if max_bytes is not None:
+            connection.execute(
+                """DELETE FROM entries WHERE namespace = ? AND key IN (
+    SELECT key FROM (
+        SELECT key, SUM(size) OVER (ORDER BY stored_at DESC, key) AS total
+        FROM entries WHERE namespace = ?
+    ) WHERE total > ?
+)""",
+                (namespace, namespace, max_bytes),
+            )
+
+    def delete(self, namespace: str, key: Hashable) -> bool:
+        try:
+            with self._connection() as connection:
+                return (
+                    connection.execute(
+                        "DELETE FROM entries WHERE namespace = ? AND key = ?",
+                        (namespace, self._key(key)),
+                    ).rowcount
+                    > 0
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Error deleting {namespace} from the shared store,{e}")
+            return False
+
+    def delete_where(
+        self, namespace: str, predicate: Callable[[Hashable], bool]
+    ) -> int:
+        """
+        Delete the entries of the namespace whose key matches the predicate, the
+        keys are read back from their repr so only the literal ones can match
+        :return: the number of entries deleted
+        """
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                rows = connection.execute(
+                    "SELECT key FROM entries WHERE namespace = ?", (namespace,)
+                ).fetchall()
+                keys = [(namespace, key) for (key,) in rows if _matches(key, predicate)]
+                connection.executemany(
+                    "DELETE FROM entries WHERE namespace = ? AND key = ?", keys
+                )
+            return len(keys)
+        except sqlite3.Error as e:
+            logger.warning(f"Error deleting {namespace} from the shared store,{e}")
+            return 0
+
+    def clear(self, namespace: str):
+        try:
+            with self._connection() as connection:
+                connection.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+        except sqlite3.Error as e:
+            logger.warning(f"Error clearing {namespace} of the shared store,{e}")
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def _matches(stored_key: str, predicate: Callable[[Hashable], bool]) -> bool:
+    try:
+        return predicate(ast.literal_eval(stored_key))
+    except (ValueError, SyntaxError, TypeError, IndexError, KeyError):
+        return False
+
+
+def shared_store(path: Optional[str] = None) -> Optional[SharedStore]:
+    """
+    The store at `path` or else at env SHARED_STORE_PATH, None when not set
+    """
+    path = path if path is not None else os.getenv("SHARED_STORE_PATH")
+    return SharedStore(path) if path else None
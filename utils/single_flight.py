@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls of the same key: the first caller (the leader)
+    does the work, the callers arriving while it is in flight wait for its result
+    instead of repeating the work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    def begin(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        Join the call of the key in flight, or lead a new one. The leader must
+        call end once done.
+        :return: the future of the call result and whether the caller leads it
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._stats["followers"] += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self._stats["leaders"] += 1
+            return future, True
+
+    def end(
+        self, key: Hashable, result: Any = None, error: Optional[BaseException] = None
+    ):
+        """
+        Complete the call led for the key, with its result or error
+        """
+        with self._lock:
+            future = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Call fn(*args, **kwargs) unless a call of the same key is already in flight,
+        in which case wait for its result
+        :return: the result and whether it was shared from the call in flight
+        """
+        future, leader = self.begin(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.end(key, error=e)
+            raise
+        self.end(key, result)
+        return result, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
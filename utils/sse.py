@@ -0,0 +1,28 @@
+from typing import Iterable, Iterator, Tuple
+
+
+def parse_sse(lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Parse a server-sent events stream, given line by line without line terminators.
+    :return: the event name and data of each event, the data lines joined by newlines
+    """
+    event, data = "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+            continue
+        if line.startswith(":"):
+            # comment, usually a keep-alive
+            continue
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        match field:
+            case "event":
+                event = value
+            case "data":
+                data.append(value)
+    if data:
+        yield event, "\n".join(data)
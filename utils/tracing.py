@@ -0,0 +1,263 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger("tracing")
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def _new_id(chars: int) -> str:
+    return uuid.uuid4().hex[:chars]
+
+
+class Span:
+    """
+    A timed operation of a trace, with its attributes e.g. the Snowflake request
+    and query ids. Used as a context manager the span is the current one, the
+    parent of the spans started within it, on this thread or task.
+    """
+
+    __slots__ = (
+        "tracer",
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "start",
+        "duration",
+        "error",
+        "_started",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attributes: Dict[str, Any],
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(16)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self._started = time.perf_counter()
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.tracer._export(self)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # exited from another context than entered e.g. a closed generator
+            _current.set(None)
+        self.end(exc)
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """
+    The span of a disabled tracer, every call is a no-op
+    """
+
+    trace_id = None
+    span_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def end(self, error: Optional[BaseException] = None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class RingBufferExporter:
+    """
+    Keeps the last `size` finished spans in memory
+    """
+
+    def __init__(self, size: int = 1000):
+        self._spans: deque = deque(maxlen=size)
+
+    def export(self, span: Span):
+        self._spans.append(span.to_dict())
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        spans = list(self._spans)
+        if trace_id is not None:
+            spans = [span for span in spans if span["trace_id"] == trace_id]
+        return spans
+
+    def slowest(self, name: str, limit: int = 10) -> List[List[Dict[str, Any]]]:
+        """
+        The traces of the slowest `name` spans, e.g. the slowest questions
+        """
+        spans = list(self._spans)
+        roots = sorted(
+            (span for span in spans if span["name"] == name),
+            key=lambda span: span["duration"],
+            reverse=True,
+        )[:limit]
+        return [
+            [span for span in spans if span["trace_id"] == root["trace_id"]]
+            for root in roots
+        ]
+
+
+class JsonLinesExporter:
+    """
+    Appends the finished spans to a JSON lines file, one span per line
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    """
+    Request scoped spans exported as they finish. Without exporters the tracer is
+    disabled and hands out a shared no-op span.
+    """
+
+    def __init__(self, exporters: Sequence = ()):
+        self.exporters = list(exporters)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    def start(self, name: str, parent=None, **attributes):
+        """
+        Start a span, child of `parent` or else of the current span, or the root
+        of a new trace. The span is not made current, end it once done.
+        """
+        if not self.exporters:
+            return NOOP_SPAN
+        if parent is None:
+            parent = _current.get()
+        if parent is None or parent.trace_id is None:
+            return Span(self, name, _new_id(32), None, attributes)
+        return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+    def span(self, name: str, parent=None, **attributes):
+        """
+        Context manager of a span current within it e.g.
+        `with tracer.span("query", sql=query) as span: ...`
+        """
+        return self.start(name, parent, **attributes)
+
+    def current(self) -> Optional[Span]:
+        return _current.get()
+
+    def annotate(self, **attributes):
+        """
+        Set attributes on the current span, if any
+        """
+        span = _current.get()
+        if span is not None:
+            span.set(**attributes)
+
+    def _export(self, span: Span):
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning(f"Error exporting span {span.name},{e}")
+
+
+def traced(fn, *args, **kwargs):
+    """
+    Bind the callable to the current context, so that the spans it starts on
+    another thread are children of the current span
+    """
+    context = contextvars.copy_context()
+    return lambda: context.run(fn, *args, **kwargs)
+
+
+tracer = Tracer()
+
+
+def configure_tracing(
+    buffer_size: Optional[int] = None, path: Optional[str] = None
+) -> Optional[RingBufferExporter]:
+    """
+    Enable the tracer with the exporters set in env, the in memory ring buffer of
+    the last TRACE_BUFFER_SIZE spans and the TRACE_FILE JSON lines file
+    :return: the ring buffer exporter, when enabled
+    """
+    if buffer_size is None:
+        buffer_size = int(os.getenv("TRACE_BUFFER_SIZE", 0))
+    if path is None:
+        path = os.getenv("TRACE_FILE")
+    buffer = None
+    if buffer_size > 0:
+        buffer = RingBufferExporter(buffer_size)
+        tracer.add_exporter(buffer)
+    if path:
+        tracer.add_exporter(JsonLinesExporter(path))
+    return buffer
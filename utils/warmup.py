@@ -0,0 +1,64 @@
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("warmup")
+
+_OWN_ATTRIBUTES = ("_factory", "_name", "_future", "_started", "_lock")
+
+
+class WarmUp:
+    """
+    Creates a slow resource e.g. the Snowpark session on a background thread, and
+    stands in for it meanwhile: attribute access waits for the resource and then
+    goes to it, so the proxy can be handed out before the resource exists.
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: str = "warmup"):
+        self._factory = factory
+        self._name = name
+        self._future: Future = Future()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self) -> "WarmUp":
+        """
+        Start creating the resource, if not already started
+        """
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+        threading.Thread(target=self._create, name=self._name, daemon=True).start()
+        return self
+
+    def _create(self):
+        try:
+            self._future.set_result(self._factory())
+        except BaseException as e:
+            logger.error(f"Error warming up {self._name},{e}")
+            self._future.set_exception(e)
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        The resource, waiting for it to be created, started now if it was not
+        """
+        self.start()
+        return self._future.result(timeout)
+
+    def add_done_callback(self, fn: Callable[[Future], Any]):
+        self._future.add_done_callback(fn)
+
+    @property
+    def ready(self) -> bool:
+        return self._future.done() and self._future.exception() is None
+
+    def __getattr__(self, name: str):
+        # only called for the attributes the proxy does not have itself. The private
+        # ones go to the resource too, e.g. snowflake.core's Root reads
+        # session._conn, but not the proxy's own before __init__ set them, nor
+        # the special ones looked up by copy/pickle
+        if name in _OWN_ATTRIBUTES or (name.startswith("__") and name.endswith("__")):
+            raise AttributeError(name)
+        return getattr(self.get(), name)